@@ -1,11 +1,26 @@
 #!/usr/bin/python3
+import time
+# Taken first so the boot time includes importing the app's modules
+_import_start = time.perf_counter()
+
+import threading
 from flask import Flask, jsonify, render_template
 from flasgger import Swagger
+from api.v1 import commands
 from api.v1.views import api_views
 from utils.decorators import token_required
-from flasgger import Swagger
 from dotenv import load_dotenv
+from utils.cache import identity_cache
 from utils.database import db
+from utils.health import health
+from utils.json_provider import json_provider_class
+from utils.like_buffer import like_buffer
+from utils.mail import mailer
+from utils.metrics import metrics
+from utils.passwords import passwords
+from utils.queries import check_queries, track_queries
+from utils.response_cache import response_cache
+from utils.routing import router
 from utils.config import Config
 from flask_talisman import Talisman
 from flask_cors import CORS
@@ -14,47 +29,100 @@ from utils.logger import logger
 
 load_dotenv()
 
-app = Flask(__name__)
-talisman = Talisman(app, force_https=False)
-#CORS(app)
 
-app.url_map.strict_slashes = False
-app.config.from_object(Config)
-app.register_blueprint(api_views)
-db.init_app(app)
-logger.info('Connected to database successfully')
+class CachedSwagger(Swagger):
+    """Swagger building each spec from the YAML files on its first request,
+    instead of on every request"""
+
+    def __init__(self, *args, **kwargs):
+        self._specs = {}
+        self._specs_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
 
-if app.config['CS_ENV'] == 'test':
-    with app.app_context():
-        db.drop_all()
+    def get_apispecs(self, endpoint='apispec_1'):
+        with self._specs_lock:
+            if endpoint not in self._specs:
+                self._specs[endpoint] = super().get_apispecs(endpoint)
+            return self._specs[endpoint]
 
-with app.app_context():
-    db.create_all()
 
-@app.after_request
 def add_cors_headers(response):
     response.headers.add("Access-Control-Allow-Origin", "*")
     response.headers.add("Access-Control-Allow-Headers", "Content-Type,Accepts,Authorization,x-token")
     response.headers.add("Access-Control-Allow-Methods", "GET,POST,PUT,DELETE")
-    logger.info('Response sent')
+    response.headers.add("Access-Control-Expose-Headers", "X-Next-Cursor")
+    check_queries(response)
+    metrics.end_request(response)
+    logger.info('Response sent', extra={'sample': True})
     return response
 
-@app.before_request
+
 def before_request():
-    logger.info('Request received')
+    track_queries()
+    metrics.start_request()
+    logger.info('Request received', extra={'sample': True})
+
+
+def create_app(config=Config, overrides: dict = None) -> Flask:
+    """Build the app from a config object, then the overrides. Nothing here
+    touches the database: create the tables with `flask --app api.v1.app
+    init-db`, see api/v1/commands.py. Every app gets helpers of its own, see
+    utils/extension.py, so building another one leaves this module's alone"""
+    start = time.perf_counter()
+    app = Flask(__name__)
+    Talisman(app, force_https=False)
+    #CORS(app)
+
+    app.url_map.strict_slashes = False
+    app.config.from_object(config)
+    app.config.update(overrides or {})
+    app.json = json_provider_class(app.config['CS_JSON_PROVIDER'])(app)
+    app.register_blueprint(api_views)
+    router.init_app(app)
+    db.init_app(app)
+    identity_cache.init_app(app)
+    like_buffer.init_app(app)
+    mailer.init_app(app)
+    passwords.init_app(app)
+    response_cache.init_app(app)
+    metrics.init_app(app)
+    health.init_app(app)
+    commands.init_app(app)
+    app.before_request(before_request)
+    app.after_request(add_cors_headers)
+
+    app.config['SWAGGER'] = {
+        'title': 'CaseShare Swagger API',
+        'uiversion': 3
+    }
+    CachedSwagger(app)
+    app.config['CS_BOOT_SECONDS'] = round(time.perf_counter() - start, 4)
+    return app
+
+
+app = create_app()
+# The app of the module also counts the imports, as a worker booting does
+app.config['CS_BOOT_SECONDS'] = round(time.perf_counter() - _import_start, 4)
+logger.info('App ready in %.3fs', app.config['CS_BOOT_SECONDS'])
+
+_schema_ready = False
 
-app.config['SWAGGER'] = {
-    'title': 'CaseShare Swagger API',
-    'uiversion': 3
-}
-Swagger(app)
 
 def test_client():
+    """Return a client of the app. With CS_ENV=test, the first call also
+    recreates the tables of the test database"""
+    global _schema_ready
+    if not _schema_ready and app.config['CS_ENV'] == 'test':
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+    _schema_ready = True
     client = app.test_client()
     client.environ_base['wsgi.url_scheme'] = 'https'
     return client
 
 if __name__ == '__main__':
+    # Werkzeug's development server, serve wsgi.py with gunicorn in production
     logger.info('Starting app...')
     app.run(host="0.0.0.0", port = app.config['PORT'],
             ssl_context=(app.config['CERT'], app.config['KEY']))
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+"""Flask commands of the app. Run from src/, for example:
+    flask --app api.v1.app init-db
+    flask --app api.v1.app resume-purges
+    flask --app api.v1.app import-ndjson archive.ndjson
+    flask --app api.v1.app export-ndjson --types posts posts.ndjson"""
+import json
+import click
+from flask import current_app
+from utils.bulk import EXPORTS, export_ndjson, import_ndjson, read_lines
+from utils.database import db
+from utils.purge import purge_user, unfinished_purges
+
+
+@click.command('init-db')
+@click.option('--drop', is_flag=True, help='drop every table first, losing its rows')
+def init_db_command(drop):
+    """Create the tables missing from the database"""
+    if drop:
+        click.confirm(f'Drop every table of {db.engine.url.render_as_string()}?', abort=True)
+        db.drop_all()
+    db.create_all()
+    click.echo('Tables created')
+
+
+@click.command('resume-purges')
+@click.option('--idle', default=600, show_default=True,
+              help='seconds without progress after which a job is resumed')
+def resume_purges_command(idle):
+    """Finish the account purges left behind by workers, see utils/purge.py"""
+    resumed = 0
+    for user_id, job_id, status, update_at in unfinished_purges(idle):
+        click.echo(f'Resuming purge {job_id} of user {user_id}')
+        if purge_user(user_id, job_id, current_app.config['CS_PURGE_BATCH_SIZE'],
+                      status, update_at):
+            resumed += 1
+        else:
+            click.echo(f'Purge {job_id} was taken by another worker')
+    click.echo(f'{resumed} purges resumed')
+
+
+@click.command('import-ndjson')
+@click.argument('source', type=click.File('rb'), default='-')
+def import_command(source):
+    """Import posts and comments from an NDJSON file, see utils/bulk.py"""
+    report = import_ndjson(read_lines(source), current_app.config['CS_IMPORT_CHUNK_SIZE'])
+    click.echo(json.dumps(report, indent=2))
+
+
+@click.command('export-ndjson')
+@click.argument('dest', type=click.File('w'), default='-')
+@click.option('--types', default='posts,comments', help='posts, comments or both')
+def export_command(dest, types):
+    """Export posts and comments to an NDJSON file"""
+    types = types.split(',')
+    unknown = [kind for kind in types if kind not in EXPORTS]
+    if unknown:
+        raise click.BadParameter(f'unknown types: {", ".join(unknown)}')
+    for text in export_ndjson(types):
+        dest.write(text)
+
+
+def init_app(app):
+    """Register the commands on app"""
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(resume_purges_command)
+    app.cli.add_command(import_command)
+    app.cli.add_command(export_command)
@@ -8,4 +8,7 @@ from api.v1.views.index import *
 from api.v1.views.users import *
 from api.v1.views.user_auth import *
 from api.v1.views.posts import *
-from api.v1.views.comment import *
\ No newline at end of file
+from api.v1.views.comment import *
+from api.v1.views.likes import *
+from api.v1.views.batch import *
+from api.v1.views.admin import *
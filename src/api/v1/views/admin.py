@@ -0,0 +1,38 @@
+#!/usr/bin/python3
+"""Define the endpoints admins use to move case archives in and out, see
+utils/bulk.py for the NDJSON format"""
+from flask import Response, current_app, jsonify, request, stream_with_context
+from api.v1.views import api_views
+from utils.bulk import EXPORTS, export_ndjson, import_ndjson, read_lines
+from utils.decorators import admin_required, token_required
+from utils.logger import logger
+
+
+@api_views.post('/admin/import', strict_slashes=False)
+@token_required
+@admin_required
+def import_archive(email):
+    """Import the posts and comments of an NDJSON body, read line by line.
+    Answers with the rows imported and the lines that failed"""
+    try:
+        report = import_ndjson(read_lines(request.stream),
+                               current_app.config['CS_IMPORT_CHUNK_SIZE'])
+        return jsonify(report), 200
+    except Exception as e:
+        logger.exception(e)
+        return jsonify({'error': 'import failed'}), 500
+
+
+@api_views.get('/admin/export', strict_slashes=False)
+@token_required
+@admin_required
+def export_archive(email):
+    """Stream every post then every comment as NDJSON.
+    `types` limits the export to posts or comments"""
+    types = request.args.get('types', 'posts,comments').split(',')
+    unknown = [kind for kind in types if kind not in EXPORTS]
+    if unknown:
+        return jsonify({'error': f'unknown types: {", ".join(unknown)}'}), 400
+    logger.info('Export of %s started', ', '.join(types))
+    return Response(stream_with_context(export_ndjson(types)),
+                    mimetype='application/x-ndjson')
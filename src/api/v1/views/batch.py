@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+"""This module implements POST /batch, which runs many API calls in one request.
+The body is a list of sub-requests such as
+    [{"method": "GET", "path": "/api/v1/posts?fields=id,title"},
+     {"method": "POST", "path": "/api/v1/posts/<id>/likes"}]
+with an optional "body" (JSON) and "headers" each. The token of the batch is
+decoded once and reused by every sub-request. Consecutive GETs run in
+parallel, anything else runs alone and in order, so a GET listed after a
+write sees it. The answer lists, in order, the status, headers and body of
+every sub-request."""
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, g, jsonify, request
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+from api.v1.views import api_views
+from utils.config import Config
+from utils.decorators import BATCH_AUTH, token_required
+from utils.logger import logger
+
+SAFE_METHODS = ('GET', 'HEAD')
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE')
+# Response headers passed back for each sub-request
+HEADERS = ('ETag', 'Last-Modified', 'X-Next-Cursor')
+
+_pool = ThreadPoolExecutor(max_workers=Config.CS_BATCH_WORKERS,
+                           thread_name_prefix='batch')
+
+
+@api_views.post('/batch', strict_slashes=False)
+@token_required
+def batch(email):
+    """Run a list of API calls and return all their responses"""
+    try:
+        calls = request.get_json()
+        if not isinstance(calls, list):
+            return jsonify({'error': 'expected a list of requests'}), 400
+        limit = current_app.config['CS_BATCH_MAX_REQUESTS']
+        if len(calls) > limit:
+            return jsonify({'error': f'at most {limit} requests per batch'}), 413
+        app = current_app._get_current_object()
+        # What the sub-requests inherit from the batch
+        parent = {'auth': (g.token, g.email, g.token_exp), 'base_url': request.host_url}
+        results, group = [], []
+        for call in calls:
+            if _method(call) in SAFE_METHODS:
+                group.append(call)
+                continue
+            results += _run_parallel(app, parent, group)
+            group = []
+            results.append(_dispatch(app, parent, call))
+        results += _run_parallel(app, parent, group)
+        logger.info('Batch of %s requests completed', len(calls))
+        return jsonify(results), 200
+    except Exception as e:
+        logger.exception(e)
+        return jsonify({'error': 'not a JSON'}), 400
+
+
+def _method(call) -> str:
+    return call.get('method', 'GET').upper() if isinstance(call, dict) else ''
+
+
+def _run_parallel(app, parent: dict, calls: list) -> list:
+    """Run read-only calls on the pool, keeping their order"""
+    if len(calls) < 2:
+        return [_dispatch(app, parent, call) for call in calls]
+    return list(_pool.map(lambda call: _dispatch(app, parent, call), calls))
+
+
+def _dispatch(app, parent: dict, call) -> dict:
+    """Run one call through the app, in its own application context so it
+    gets a fresh flask.g and database session"""
+    method, path = _method(call), call.get('path') if isinstance(call, dict) else None
+    if method not in METHODS or not isinstance(path, str) or not path.startswith('/'):
+        return {'status': 400, 'headers': {}, 'body': {'error': 'invalid request'}}
+    headers = {key: value for key, value in (call.get('headers') or {}).items()
+               if key.lower() != 'authorization'}
+    builder = EnvironBuilder(path=path, method=method, headers=headers,
+                             json=call.get('body'), base_url=parent['base_url'])
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+    environ[BATCH_AUTH] = parent['auth']
+    with app.app_context(), app.request_context(environ):
+        try:
+            if request.routing_exception is not None:
+                raise request.routing_exception
+            # Only the API, and no batch within a batch
+            if request.blueprint != api_views.name or request.endpoint == 'api_views.batch':
+                return {'status': 404, 'headers': {}, 'body': {'error': 'not found'}}
+            response = app.full_dispatch_request()
+        except HTTPException as e:
+            return {'status': e.code, 'headers': {}, 'body': {'error': e.description}}
+        except Exception as e:
+            logger.exception(e)
+            return {'status': 500, 'headers': {}, 'body': {'error': 'unknown error occurred'}}
+        # Closed once read, the close hooks of streamed bodies record the
+        # metrics and check the query budget of the call
+        with response:
+            return {'status': response.status_code,
+                    'headers': {key: response.headers[key] for key in HEADERS
+                                if key in response.headers},
+                    'body': response.get_json(silent=True)}
@@ -1,25 +1,57 @@
 #!/usr/bin/python3
 """This module implement API endpoints for accessing and manipulating comments"""
-from datetime import datetime
-from flask import jsonify, request
+from flask import g, jsonify, request
 from api.v1.views import api_views
 from models import Comment
 from models import Post
 from models import User
-from utils.decorators import token_required
+from utils.auth import current_principal
+from utils.conditional import conditional
+from utils.decorators import expandable, sparse_fields, token_required
+from utils.fields import get_with_fields, load_fields
+from utils.includes import include_columns, include_tags, load_includes, with_includes
 from utils.logger import logger
+from utils.pagination import keyset_paginate
+from utils.queries import query_budget
+from utils.response_cache import response_cache
+from utils.streaming import stream_json_array
 
 @api_views.get('/posts/<string:id>/comments', strict_slashes=False)
+@query_budget(4)
 @token_required
+@sparse_fields(Comment)
+@expandable(Comment)
+@response_cache.cached(lambda id: [f'post:{id}', f'post:{id}:comments']
+                       + include_tags(g.includes))
 def get_comments(email, id):
-    """Get all comments related to a post"""
+    """Get the comments of a post, oldest first, one page at a time.
+    Pass `cursor` (empty for the first page) to page by keyset, the cursor of
+    the next page is sent back in the X-Next-Cursor header. Otherwise `offset`
+    is the page number. `include=author` embeds the author of each comment.
+    Answers 304 when the client has the current page"""
     try:
-        post = Post.query.get(id)
-        offset, limit = request.args.get('offset', 0), 20
-        comments = post.comments[offset * limit:offset * limit + limit]
-        response = jsonify([comment.to_dict() for comment in comments]), 200
-        logger.info(f'{len(comments)} comments retrieved successfully')
-        return response
+        post = Post.get(id)
+        limit = 20
+        query = load_fields(Comment.query, Comment, g.fields, include_columns(g.includes))
+        query = load_includes(query, Comment, g.includes).filter_by(post_id=post.id)
+        if 'cursor' in request.args:
+            comments, next_cursor = keyset_paginate(query, Comment, request.args.get('cursor'),
+                                                    limit, descending=False)
+        else:
+            offset, next_cursor = request.args.get('offset', 0, type=int), None
+            comments = list(query.order_by(Comment.create_at, Comment.id)
+                            .offset(offset * limit).limit(limit))
+        comments, serialize = with_includes(comments, Comment, g.includes, g.fields)
+
+        def render():
+            response = stream_json_array(comments, 'comments', serialize, fields=g.fields)
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            return response
+        return conditional(comments, render, next_cursor)
+    except ValueError as e:
+        logger.exception(e)
+        return jsonify({'error': 'invalid cursor'}), 400
     except AttributeError as e:
         logger.exception(e)
         return jsonify({'error': 'not found'}), 404
@@ -29,14 +61,17 @@ def get_comments(email, id):
     
     
 @api_views.get('/comments/<string:id>', strict_slashes=False)
+@query_budget(2)
 @token_required
+@sparse_fields(Comment)
+@response_cache.cached(lambda id: [f'comment:{id}'])
 def get_comment(email, id):
     """Get a single comment and display it"""
     try:
-        comment = Comment.query.get(id)
-        result = jsonify(comment.to_dict()), 200
-        logger.info(f'Comment {comment.id} retrieved successfully')
-        return result
+        comment = get_with_fields(Comment, id, g.fields)
+        response = conditional(comment, lambda: jsonify(comment.to_dict(g.fields)))
+        logger.info('Comment %s retrieved successfully', comment.id)
+        return response
     except AttributeError as e:
         logger.exception(e)
         return jsonify({'error': 'not found'}), 404
@@ -53,15 +88,15 @@ def post_comment(email, post_id):
         if not isinstance(data, dict):
             logger.error('User did not provide a valid JSON')
             return jsonify({'error': 'not a JSON'}), 400
-        post = Post.query.get(post_id)
-        user_id = User.get_user_by_email(email).id
+        post = Post.get(post_id)
+        user_id = current_principal().id
         content = data['content']
         if len(content) == 0:
-            logger.error(f'Comment content on post {post.id} by user {user_id} cannot empty')
+            logger.error('Comment content on post %s by user %s cannot empty', post.id, user_id)
             return jsonify({'error': "empty request"}), 400
         new_comment = Comment(user_id=user_id, post_id=post.id, content=content)
         new_comment.save()
-        logger.info(f'Comment {new_comment.id} created successfully')
+        logger.info('Comment %s created successfully', new_comment.id)
         return jsonify(new_comment.to_dict()), 201
     except KeyError as e:
         logger.exception(e)
@@ -82,17 +117,16 @@ def update_comment(email, id):
         if not isinstance(data, dict):
             logger.error('User did not provide a valid JSON')
             return jsonify({'error': 'not a JSON'}), 400
-        comment = Comment.query.get(id)
-        user = User.get_user_by_email(email)
+        comment = Comment.get(id)
+        user = current_principal()
         if comment.user_id == user.id:
             content = data.get('content', comment.content)
             comment.content = content
-            comment.updated_at = datetime.now()
             comment.save()
-            logger.info(f'Comment {comment.id} updated successfully')
+            logger.info('Comment %s updated successfully', comment.id)
             return jsonify(comment.to_dict()), 200
         else:
-            logger.error(f'User {user.id} does not own comment {comment.id}')
+            logger.error('User %s does not own comment %s', user.id, comment.id)
             return jsonify({'error': 'forbidden'}), 403
     except AttributeError as e:
         # The comment is not found
@@ -108,14 +142,14 @@ def update_comment(email, id):
 def delete_comment(email, id):
     """Delete a comment"""
     try:
-        user = User.get_user_by_email(email)
-        comment = Comment.query.get(id)
+        user = current_principal()
+        comment = Comment.get(id)
         if comment.user_id == user.id:
             comment.delete()
-            logger.info(f'Comment {comment.id} deleted successfully')
+            logger.info('Comment %s deleted successfully', comment.id)
             return jsonify({}), 204
         else:
-            logger.error(f'User {user.id} not authorized to delete comment {comment.id}')
+            logger.error('User %s not authorized to delete comment %s', user.id, comment.id)
             return jsonify({'error': 'forbidden'}), 403
     except AttributeError as e:
         logger.exception(e)
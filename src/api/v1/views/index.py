@@ -1,13 +1,26 @@
 #!/usr/bin/python3
 """This module contain some view functions for our APIs.
 Particularly, the one for status, and all the views needed to manage user sessions"""
-from flask import jsonify
+from flask import Response, current_app, jsonify
 from os import environ
 from api.v1.views import api_views
+from utils.health import health
+from utils.logger import logger
+from utils.metrics import CONTENT_TYPE, metrics
 
 secret_key=environ.get('SECRET_KEY')
 
 @api_views.get('/status', strict_slashes=False)
 def status():
-    """Return the status of the API"""
-    return jsonify({'status': 'OK'}), 200
\ No newline at end of file
+    """Return the status of the API and its dependencies, 503 when this
+    worker should not get traffic, see utils/health.py"""
+    report, ready = health.check()
+    report['boot_seconds'] = current_app.config.get('CS_BOOT_SECONDS')
+    if not ready:
+        logger.warning('Not ready: %s', '; '.join(report['failures']))
+    return jsonify(report), 200 if ready else 503
+
+@api_views.get('/metrics', strict_slashes=False)
+def get_metrics():
+    """Return the request metrics of every worker in the Prometheus text format"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
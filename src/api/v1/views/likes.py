@@ -1,29 +1,86 @@
 #!/usr/bin/python3
 """Create APIs for likes"""
-from flask import jsonify, request
-from api.v1.views import app_views
+from flask import jsonify
+from api.v1.views import api_views
+from models import Like
+from models import Post
+from utils.auth import current_principal
 from utils.decorators import token_required
-from models.user import User
-from models.like import Like
-from models.post import Post
+from utils.like_buffer import like_buffer
+from utils.queries import query_budget
+from utils.response_cache import response_cache
+from utils.logger import logger
 
-@app_views.get('/posts/<string:post_id>/likes', strict_slashes=False)
+
+def likes_summary(post, likes_count: int, liked: bool) -> dict:
+    """Describe the likes of a post as seen by the current user"""
+    return {'post_id': post.id, 'likes_count': likes_count, 'liked': liked}
+
+
+@api_views.get('/posts/<string:post_id>/likes', strict_slashes=False)
+@query_budget(3)
 @token_required
+@response_cache.cached(lambda post_id: [f'post:{post_id}'], vary_on_user=True)
 def get_likes(email, post_id):
-    """Get the number of all likes"""
-    likes = Post.get(Post, post_id).likes
+    """Get the number of likes of a post, and whether the user liked it"""
     try:
-        return jsonify([like.to_dict() for like in likes]), 200
-    except AttributeError:
-        return jsonify({}), 204
-    
+        user_id = current_principal().id
+        post = Post.get(post_id)
+        # A like still in the write-behind buffer counts as the user's own
+        liked = like_buffer.pending(user_id, post.id)
+        if liked is None:
+            liked = Like.is_liked(user_id, post.id)
+        return jsonify(likes_summary(post, post.likes_count, liked)), 200
+    except AttributeError as e:
+        logger.exception(e)
+        return jsonify({'error': 'not found'}), 404
+    except Exception as e:
+        logger.exception(e)
+        return jsonify({'error': 'unknown error occurred'}), 500
 
-@app_views.post('/posts/<string:post_id>/likes', strict_slashes=False)
+
+@api_views.post('/posts/<string:post_id>/likes', strict_slashes=False)
 @token_required
 def create_like(email, post_id):
-    """Create a new like for an object"""
-    user_id = Post.get_user_by_email(email).id
-    new_like = Like(user_id=user_id, post_id=post_id)
-    new_like.save()
-    likes = Post.get(Post, post_id).likes
-    return jsonify([like.to_dict() for like in likes]), 201
+    """Like a post. Liking it again changes nothing.
+    With the write-behind buffer on, the like is accepted and written later"""
+    try:
+        user_id = current_principal().id
+        post = Post.get(post_id)
+        likes_count = post.likes_count
+        if like_buffer.enabled:
+            like_buffer.record(user_id, post.id, True)
+            return jsonify(likes_summary(post, likes_count, True)), 202
+        if Like.add(user_id, post.id):
+            logger.info('User %s liked post %s', user_id, post_id)
+            return jsonify(likes_summary(post, likes_count + 1, True)), 201
+        return jsonify(likes_summary(post, likes_count, True)), 200
+    except AttributeError as e:
+        logger.exception(e)
+        return jsonify({'error': 'not found'}), 404
+    except Exception as e:
+        logger.exception(e)
+        return jsonify({'error': 'unknown error occurred'}), 500
+
+
+@api_views.delete('/posts/<string:post_id>/likes', strict_slashes=False)
+@token_required
+def delete_like(email, post_id):
+    """Unlike a post. Unliking a post that is not liked changes nothing"""
+    try:
+        user_id = current_principal().id
+        post = Post.get(post_id)
+        likes_count = post.likes_count
+        if like_buffer.enabled:
+            like_buffer.record(user_id, post.id, False)
+            return jsonify(likes_summary(post, likes_count, False)), 202
+        if Like.remove(user_id, post.id):
+            logger.info('User %s unliked post %s', user_id, post_id)
+            likes_count -= 1
+        return jsonify(likes_summary(post, likes_count, False)), 200
+    except AttributeError as e:
+        logger.exception(e)
+        return jsonify({'error': 'not found'}), 404
+    except Exception as e:
+        logger.exception(e)
+        return jsonify({'error': 'unknown error occurred'}), 500
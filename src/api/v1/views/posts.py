@@ -1,51 +1,107 @@
 #!/usr/bin/python3
 """Define endpoints to access posts"""
-from datetime import datetime
-from utils.decorators import token_required
+from utils.auth import current_principal
+from utils.conditional import conditional
+from utils.decorators import expandable, sparse_fields, token_required
 from json import JSONDecodeError
-from flask import jsonify, request
+from flask import g, jsonify, request
 from api.v1.views import api_views
 from models import User
 from models import Post
 from utils.logger import logger
+from utils.fields import get_with_fields, load_fields
+from utils.includes import include_columns, include_tags, load_includes, with_includes
+from utils.pagination import keyset_paginate
+from utils.queries import query_budget
+from utils.response_cache import response_cache
+from utils.streaming import stream_json_array
 
 @api_views.get('/posts', strict_slashes=False)
+@query_budget(4)
 @token_required
+@sparse_fields(Post)
+@expandable(Post)
+@response_cache.cached(lambda: ['posts:list'] + include_tags(g.includes))
 def get_posts(email):
-    """Get all posts in the database."""
+    """Get all posts in the database.
+    Pass `cursor` (empty for the first page) to page newest first by keyset;
+    the cursor of the next page is sent back in the X-Next-Cursor header.
+    The legacy `offset` parameter is still honoured when no cursor is given.
+    `fields` limits the columns selected and returned, see utils/fields.py.
+    `include` embeds authors, comment previews and counts, see utils/includes.py.
+    Answers 304 when the client has the current page, see utils/conditional.py"""
     try:
-        limit, offset = 20, int(request.args.get('offset', 0))
-        posts = Post.query.offset(offset).limit(limit).all()
-        response = jsonify([post.to_dict() for post in posts]), 200
-        logger.info(f'{len(posts)} posts retrieved successfully')
-        return response
+        limit = 20
+        query = load_fields(Post.query, Post, g.fields, include_columns(g.includes))
+        query = load_includes(query, Post, g.includes)
+        if 'cursor' in request.args:
+            posts, next_cursor = keyset_paginate(query, Post,
+                                                 request.args.get('cursor'), limit)
+        else:
+            offset, next_cursor = int(request.args.get('offset', 0)), None
+            posts = list(query.offset(offset).limit(limit))
+        posts, serialize = with_includes(posts, Post, g.includes, g.fields)
+
+        def render():
+            response = stream_json_array(posts, 'posts', serialize, fields=g.fields)
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            return response
+        return conditional(posts, render, next_cursor)
+    except ValueError as e:
+        logger.exception(e)
+        return jsonify({'error': 'invalid cursor or offset'}), 400
     except AttributeError as e:
         logger.exception(e)
         return jsonify({'error': 'not found'}), 404
 
 @api_views.get('/posts/<string:id>', strict_slashes=False)
+@query_budget(2)
 @token_required
+@sparse_fields(Post)
+@response_cache.cached(lambda id: [f'post:{id}'])
 def get_post(email, id):
     try:
-        post = Post.query.get(id)
-        result = jsonify(post.to_dict()), 200
-        logger.info(f'Post {post.id} retrieved successfully')
-        return result
+        post = get_with_fields(Post, id, g.fields)
+        response = conditional(post, lambda: jsonify(post.to_dict(g.fields)))
+        logger.info('Post %s retrieved successfully', post.id)
+        return response
     except AttributeError as e:
         logger.exception(e)
         return jsonify({'error': 'not found'}), 404
 
 @api_views.get('/users/<string:id>/posts', strict_slashes=False)
+@query_budget(5)
 @token_required
+@sparse_fields(Post)
+@expandable(Post)
+@response_cache.cached(lambda id: [f'user:{id}', f'user:{id}:posts', 'posts:list']
+                       + include_tags(g.includes))
 def get_posts_by_user(email, id):
+    """Get the posts of a user, newest first, one page at a time.
+    Pages by keyset when `cursor` is given, otherwise `offset` is the page number"""
     try:
-        user = User.query.get(id)
-        offset = request.args.get('offset', 0)
+        user = User.get(id)
         limit = 20
-        posts = user.posts[offset * limit: offset * limit + limit]
-        response = jsonify([post.to_dict() for post in posts]), 200
-        logger.info(f'{len(posts)} posts retrieved successfully')
-        return response
+        query = load_fields(Post.query, Post, g.fields, include_columns(g.includes))
+        query = load_includes(query, Post, g.includes).filter_by(user_id=user.id)
+        if 'cursor' in request.args:
+            posts, next_cursor = keyset_paginate(query, Post, request.args.get('cursor'), limit)
+        else:
+            offset, next_cursor = request.args.get('offset', 0, type=int), None
+            posts = query.order_by(Post.create_at.desc(), Post.id.desc())\
+                .offset(offset * limit).limit(limit).all()
+        posts, serialize = with_includes(posts, Post, g.includes, g.fields)
+
+        def render():
+            response = stream_json_array(posts, 'posts', serialize, fields=g.fields)
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            return response
+        return conditional(posts, render, next_cursor)
+    except ValueError as e:
+        logger.exception(e)
+        return jsonify({'error': 'invalid cursor'}), 400
     except AttributeError as e:
         logger.exception(e)
         return jsonify({'error': 'not found'}), 404
@@ -54,13 +110,13 @@ def get_posts_by_user(email, id):
 @token_required
 def post_something(email):
     try:
-        user_id = User.get_user_by_email(email).id
+        user_id = current_principal().id
         data = request.get_json()
         title = data['title']
         content = data['content']
         post = Post(title=title, content=content, user_id=user_id)
         post.save()
-        logger.info(f'Post {post.id} created successfully')
+        logger.info('Post %s created successfully', post.id)
         return jsonify(post.to_dict()), 201
     except KeyError as e:
         logger.exception(e)
@@ -77,20 +133,19 @@ def post_something(email):
 def edit_post(email, id):
     """Edit the published content"""
     try:
-        user = User.get_user_by_email(email)
+        user = current_principal()
         data = request.get_json()
-        post = Post.query.get(id)
+        post = Post.get(id)
         title = data.get('title', post.title)
         content = data.get('content', post.content)
         if post.user_id == user.id:
             post.title = title
-            post.updated_at = datetime.now()
             post.content = content
             post.save()
-            logger.info(f'Post {post.id} updated successfully')
+            logger.info('Post %s updated successfully', post.id)
             return jsonify(post.to_dict())
         else:
-            logger.error(f'User {user.id} not allowed to edit post {post.id}')
+            logger.error('User %s not allowed to edit post %s', user.id, post.id)
             return jsonify({'error': 'forbidden'}), 403
     except AttributeError as e:
         logger.exception(e)
@@ -103,14 +158,14 @@ def edit_post(email, id):
 @token_required
 def delete_post(email, id):
     try:
-        user = User.get_user_by_email(email)
-        post = Post.query.get(id)
+        user = current_principal()
+        post = Post.get(id)
         if post.user_id == user.id:
             post.delete()
-            logger.info(f'Post {post.id} deleted successfully')
+            logger.info('Post %s deleted successfully', post.id)
             return jsonify({}), 204
         else:
-            logger.error(f'User {user.id} not allowed to delete post {post.id}')
+            logger.error('User %s not allowed to delete post %s', user.id, post.id)
             return jsonify({'error': 'forbidden'}), 403
     except AttributeError as e:
         logger.exception(e)
@@ -1,9 +1,8 @@
 #!/usr/bin/python3
 """This file contain views that define endpoints used to interact with user
 authentication."""
-from flask import jsonify, request, make_response
+from flask import current_app, jsonify, request, make_response
 import jwt
-from werkzeug.security import check_password_hash
 from os import environ
 from api.v1.views import api_views
 from datetime import timedelta, datetime
@@ -11,9 +10,17 @@ from models.user import User
 from flasgger.utils import swag_from
 from utils.helpers import avoid_danger_in_json
 from utils.logger import logger
+from utils.mail import mailer
+from utils.passwords import PasswordsBusy, check_password_hash, passwords
 
 SECRET_KEY = environ.get("SECRET_KEY")
 
+@api_views.errorhandler(PasswordsBusy)
+def passwords_busy(e):
+    """Turn requests away while the password hashing queue is full"""
+    logger.warning('Password hashing queue full, request turned away')
+    return jsonify({'error': 'too many requests, try again later'}), 503, {'Retry-After': '1'}
+
 @api_views.post('/users/auth/login', strict_slashes=False)
 @swag_from('documentation/users/login.yml', methods=['POST'])
 def login():
@@ -29,17 +36,24 @@ def login():
             return jsonify({'error': 'user doesnot exist'}), 404
         if check_password_hash(user.password, auth.get('password')):
             # information is valid and user exists
+            if passwords.needs_rehash(user.password):
+                # Hashed with older parameters, only now is the password known
+                user.__setattr__('password', auth.get('password'))
+                user.save()
+                logger.info('Password hash of user %s upgraded', user.id)
             token = jwt.encode({'email': auth.get('email'),
                                 'exp': datetime.utcnow() + timedelta(hours=24)},
                                 SECRET_KEY)
             response = make_response(jsonify(
                 {'token': token, 'redirectUrl': '/api/v1/'}
                 ), 200)
-            logger.info(f'User {user.id} logged in successfully')
+            logger.info('User %s logged in successfully', user.id)
             return response
         else:
-            logger.error(f'User {user.id} provided invalid password')
+            logger.error('User %s provided invalid password', user.id)
             return jsonify({'error': 'invalid password'}), 400
+    except PasswordsBusy:
+        raise
     except Exception as e:
         logger.exception(e)
         return jsonify({'error': 'not a JSON'}), 400
@@ -62,7 +76,7 @@ def register():
         new_user = User(email=email, password=password, first_name=first_name,
                         last_name=last_name, sex=gender, country=country, age=age, title=title, phone=phone)
         new_user.save()
-        logger.info(f'User with id {new_user.id} created successfully')
+        logger.info('User with id %s created successfully', new_user.id)
         return jsonify({'email': new_user.email}), 201
     except KeyError as e:
         logger.exception(e)
@@ -78,17 +92,36 @@ def forgot_password():
     try:
         data = avoid_danger_in_json(**request.get_json())
         email = data.get('email')
+        # The link is only ever given back to tests and the debugger
+        give_back = current_app.config['CS_ENV'] == 'test' or current_app.debug
+        if not mailer.enabled and not give_back:
+            logger.error('Password reset requested but no mail server is set')
+            return jsonify({'error': 'password reset is unavailable'}), 503
+        # A link built from the Host header could point the email at any host
+        base_url = current_app.config.get('CS_PUBLIC_URL') or \
+            (request.host_url.rstrip('/') if give_back else None)
+        if base_url is None:
+            logger.error('Password reset requested but CS_PUBLIC_URL is not set')
+            return jsonify({'error': 'password reset is unavailable'}), 503
         user = User.get_user_by_email(email)
         if user:
             # The user exists
             token = jwt.encode({'email': email, 'exp': datetime.utcnow() + timedelta(minutes=15)}, SECRET_KEY)
             user.__setattr__('reset_token', token)
             user.save()
-            logger.info(f'Password reset link sent to user {user.id}')
-            return jsonify({
-                "message": "Password reset link sent to your email",
-                "token": f'{request.host_url}api/v1/users/auth/reset_password/{token}'
-            }), 200
+            link = f'{base_url}/api/v1/users/auth/reset_password/{token}'
+            if not mailer.enabled:
+                logger.info('Password reset link returned to user %s', user.id)
+                return jsonify({
+                    "message": "Password reset link sent to your email",
+                    "token": link
+                }), 200
+            # Queued, a slow mail server must not hold the request
+            if not mailer.send(email, 'Reset your CaseShare password',
+                               f'Follow this link within 15 minutes to choose a new password:\n{link}\n'):
+                return jsonify({'error': 'too many requests, try again later'}), 503, {'Retry-After': '5'}
+            logger.info('Password reset link queued for user %s', user.id)
+            return jsonify({"message": "Password reset link sent to your email"}), 200
         else:
             logger.error('User does not exist')
             return jsonify({'error': 'user doesnot exist'}), 404
@@ -106,13 +139,15 @@ def reset_password(token):
         new_password = avoid_danger_in_json(**request.get_json()).get('new_password')
         user.__setattr__('password', new_password)
         user.save()
-        logger.info(f'Password reset successfully for user {user.id}')
+        logger.info('Password reset successfully for user %s', user.id)
         return jsonify({
             "message": "Password reset successfully"
         }), 200
     except AttributeError as e:
         logger.exception(e)
         return jsonify({'error': 'user doesnot exist'}), 404
+    except PasswordsBusy:
+        raise
     except Exception as e:
         logger.exception(e)
         return jsonify({'error': 'not a JSON'}), 400
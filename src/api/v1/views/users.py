@@ -2,29 +2,42 @@
 """This file contain views that define basic endpoints for working with
 users. These include CRUD operations on the users table. Authentication is handled in a
 separate file. See user_auth.py"""
-from flask import jsonify, request
-from werkzeug.security import generate_password_hash
-from os import environ
+from flask import current_app, g, jsonify, request
+from os import environ, path
 from api.v1.views import api_views
 from models.user import User
+from models.purge_job import PurgeJob
 from flasgger.utils import swag_from
-from utils.decorators import token_required
+from utils.auth import current_principal, current_user
+from utils.conditional import conditional
+from utils.decorators import sparse_fields, token_required
+from utils.fields import get_with_fields, load_fields
 from utils.helpers import avoid_danger_in_json
 from utils.logger import logger
+from utils.passwords import PasswordsBusy, check_password_hash
+from utils.purge import count_owned_rows, delete_account, schedule_purge
+from utils.queries import query_budget
+from utils.response_cache import response_cache
+from utils.streaming import stream_json_array
+
+# Absolute, swag_from would resolve a relative path from utils/decorators.py
+DOCS = path.join(path.dirname(__file__), 'documentation', 'users')
 
 @api_views.get('/users', strict_slashes=False)
-@swag_from('documentation/users/get_users.yml', methods=['GET'])
+@swag_from(path.join(DOCS, 'get_users.yml'), methods=['GET'])
+@query_budget(2)
 @token_required
+@sparse_fields(User)
+@response_cache.cached(lambda: ['users:list'])
 def get_users(email=None):
     """Retrieve all user from the database"""
     try:
         page = request.args.get('page', 0, type=int)
         limit = 20
         offset = page * limit
-        users = User.query.offset(offset).limit(limit).all()
-        response = jsonify([user.to_dict() for user in users]), 200
-        logger.info(f'{len(users)} users retrieved successfully')
-        return response
+        query = load_fields(User.query, User, g.fields)
+        users = list(query.offset(offset).limit(limit))
+        return conditional(users, lambda: stream_json_array(users, 'users', fields=g.fields))
     except ValueError as e:
         logger.exception(e)
         return jsonify({'error': 'Invalid page number'}), 400
@@ -33,40 +46,46 @@ def get_users(email=None):
         return jsonify({'error': 'Not Found'}), 404
 
 @api_views.get('/users/me', strict_slashes=False)
-@swag_from('documentation/users/get_myself.yml', methods=['GET'])
+@swag_from(path.join(DOCS, 'get_myself.yml'), methods=['GET'])
+@query_budget(2)
 @token_required
+@sparse_fields(User)
+@response_cache.cached(lambda: [f'user:{current_principal().id}'], vary_on_user=True)
 def get_myself(email=None):
     try:
         if email:
-            user = User.get_user_by_email(email)
-            response = jsonify(user.to_dict()), 200
-            logger.info(f'User {user.id} retrieved successfully')
+            user = current_user()
+            response = conditional(user, lambda: jsonify(user.to_dict(g.fields)))
+            logger.info('User %s retrieved successfully', user.id)
             return response
     except AttributeError as e:
         logger.exception(e)
         return jsonify({'error': 'Not Found'}), 404
 
 @api_views.get('/users/<string:id>', strict_slashes=False)
-@swag_from('documentation/users/get_user.yml', methods=['GET'])
+@swag_from(path.join(DOCS, 'get_user.yml'), methods=['GET'])
+@query_budget(2)
 @token_required
+@sparse_fields(User)
+@response_cache.cached(lambda id: [f'user:{id}'])
 def get_user(email, id):
     """Get a user by id"""
     try:
-        user = User.query.get(id)
-        response = jsonify(user.to_dict()), 200
-        logger.info(f'User {user.id}retrieved successfully')
+        user = get_with_fields(User, id, g.fields)
+        response = conditional(user, lambda: jsonify(user.to_dict(g.fields)))
+        logger.info('User %sretrieved successfully', user.id)
         return response
     except AttributeError as e:
         logger.exception(e)
         return jsonify({'error': 'not found'}), 404
     
 @api_views.put('/users/me', strict_slashes=False)
-@swag_from('documentation/users/update_user.yml', methods=['PUT'])
+@swag_from(path.join(DOCS, 'update_user.yml'), methods=['PUT'])
 @token_required
 def update_myself(email):
     """Make changes to information stored under the same user"""
     try:
-        user = User.get_user_by_email(email)
+        user = current_user()
         data = avoid_danger_in_json(**request.get_json())
         user.title = data.get('title', user.title)
         user.first_name = data.get('first_name', user.first_name)
@@ -76,7 +95,7 @@ def update_myself(email):
         user.phone = data.get('phone', user.phone)
         user.age = data.get('age', user.age)
         user.save()
-        logger.info(f'User {user.id} updated successfully')
+        logger.info('User %s updated successfully', user.id)
         return jsonify(user.to_dict()), 200
     except AttributeError as e:
         logger.exception(e)
@@ -86,27 +105,29 @@ def update_myself(email):
         return jsonify({'error': 'not a JSON'}), 400
     
 @api_views.put('/users/me/change_password', strict_slashes=False)
-@swag_from('documentation/users/change_password.yml', methods=['PUT'])
+@swag_from(path.join(DOCS, 'change_password.yml'), methods=['PUT'])
 @token_required
 def change_password(email):
     """Change, not reset password"""
     try:
-        user = User.get_user_by_email(email)
+        user = current_user()
         data = request.get_json()
         old_password = data['old_password']
         new_password = data['new_password']
-        if user.password == generate_password_hash(old_password):
+        if check_password_hash(user.password, old_password):
             # The user does know the old password
             user.__setattr__('password', new_password)
             user.save()
-            logger.info(f'Password changed successfully for user {user.id}')
+            logger.info('Password changed successfully for user %s', user.id)
             return jsonify({}), 200
         else:
-            logger.error(f'User {user.id}provided invalid old password')
+            logger.error('User %sprovided invalid old password', user.id)
             return jsonify({'error': 'invalid password'}), 400
     except AttributeError as e:
         logger.exception(e)
         return jsonify({'error': 'not found'}), 404
+    except PasswordsBusy:
+        raise
     except Exception as e:
         logger.exception(e)
         return jsonify({'error': 'not a JSON'}), 400
@@ -115,12 +136,37 @@ def change_password(email):
 @api_views.delete('/users/me', strict_slashes=False)
 @token_required
 def delete_user(email):
-    """Delete a user's account"""
+    """Delete a user's account.
+    The database cascades the delete to everything the user owns. Accounts too
+    large to delete within a request are marked deleted and purged in the
+    background instead, the returned job can be polled for progress"""
     try:
-        user = User.get_user_by_email(email)
-        user.delete()
-        logger.info(f'User {user.id} deleted successfully')
-        return jsonify({}), 204
+        user = current_user()
+        threshold = current_app.config['CS_PURGE_THRESHOLD']
+        owned = count_owned_rows(user.id, threshold)
+        if owned <= threshold:
+            delete_account(user)
+            logger.info('User %s deleted successfully', user.id)
+            return jsonify({}), 204
+        job = schedule_purge(current_app._get_current_object(), user, owned)
+        return jsonify(job.to_dict()), 202
     except AttributeError as e:
         logger.exception(e)
         return jsonify({'error': 'Not Found'}), 404
+
+
+@api_views.get('/users/purges/<string:id>', strict_slashes=False)
+@token_required
+def get_purge(email, id):
+    """Report the progress of the background purge of a deleted account to its
+    owner. The token still names the account while it is marked deleted; once
+    the purge is done the account is gone and the job is not found"""
+    try:
+        job = PurgeJob.query.get(id)
+        owner = User.query.filter_by(email=email).first()
+        if owner is None or owner.id != job.user_id:
+            return jsonify({'error': 'not found'}), 404
+        return jsonify(job.to_dict()), 200
+    except AttributeError as e:
+        logger.exception(e)
+        return jsonify({'error': 'not found'}), 404
@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+"""Measures the throughput and latency of the API endpoints on a database
+seeded by benchmarks/seed.py, and writes them as JSON to diff between
+releases. Requests go through the Flask test client, or to a running
+server with --url. Ids in the paths are drawn from the seeded rows with
+--seed, so two runs request the same things. Run from src/:
+    python -m benchmarks.endpoints --requests 500 --output before.json
+    python -m benchmarks.endpoints --compare before.json after.json"""
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import jwt
+from sqlalchemy import func, select
+from api.v1.app import app, test_client
+from benchmarks.seed import email
+from models import Comment, Like, Post, User
+from utils.database import db
+
+# (name, method, path); {post} and {user} are replaced by seeded ids. The
+# likes added are removed right after, leaving the dataset as seeded
+ENDPOINTS = (
+    ('list posts', 'GET', '/api/v1/posts'),
+    ('list posts by cursor', 'GET', '/api/v1/posts?cursor='),
+    ('list posts with includes', 'GET',
+     '/api/v1/posts?cursor=&include=author,comment_preview,counts'),
+    ('list posts, two fields', 'GET', '/api/v1/posts?cursor=&fields=title,likes_count'),
+    ('get post', 'GET', '/api/v1/posts/{post}'),
+    ('list posts of user', 'GET', '/api/v1/users/{user}/posts?cursor='),
+    ('list comments of post', 'GET', '/api/v1/posts/{post}/comments'),
+    ('get likes of post', 'GET', '/api/v1/posts/{post}/likes'),
+    ('list users', 'GET', '/api/v1/users'),
+    ('get myself', 'GET', '/api/v1/users/me'),
+    ('get user', 'GET', '/api/v1/users/{user}'),
+    ('like post', 'POST', '/api/v1/posts/{post}/likes'),
+    ('unlike post', 'DELETE', '/api/v1/posts/{post}/likes'),
+)
+SAMPLE = 200
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(latencies: list, p: float) -> float:
+    """Nearest-rank percentile of sorted latencies"""
+    return latencies[max(0, math.ceil(p / 100 * len(latencies)) - 1)]
+
+
+def summarize(latencies: list, statuses: list, queries: list, elapsed: float) -> dict:
+    """Return the figures of one endpoint, latencies in milliseconds"""
+    latencies = sorted(latencies)
+    summary = {'requests': len(latencies),
+               'errors': sum(status >= 400 for status in statuses),
+               'throughput_rps': round(len(latencies) / elapsed, 1),
+               'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3)}
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = round(percentile(latencies, p) * 1000, 3)
+    summary['max_ms'] = round(latencies[-1] * 1000, 3)
+    if queries:
+        # Sent back by the app with CS_ENV=dev or test, see utils/queries.py
+        summary['queries_per_request'] = round(sum(queries) / len(queries), 2)
+    return summary
+
+
+def sample_ids(model, rng: random.Random, count: int = SAMPLE) -> list:
+    """Return about count ids of model, picked at random through the primary
+    key index so it stays cheap on tables of millions of rows"""
+    ids = []
+    for _ in range(count):
+        start = str(uuid.UUID(int=rng.getrandbits(128)))
+        id = db.session.scalar(select(model.id).where(model.id >= start)
+                               .order_by(model.id).limit(1))
+        ids.append(id or db.session.scalar(select(model.id).order_by(model.id).limit(1)))
+    return ids
+
+
+class Client:
+    """Sends requests through the test client, or to url if given, keeping
+    one client per thread"""
+
+    def __init__(self, url: str = None, verify: bool = True):
+        self.url = url.rstrip('/') if url else None
+        self.verify = verify
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, headers: dict):
+        """Return the status and the X-Query-Count header of the response"""
+        if self.url is None:
+            if not hasattr(self._local, 'client'):
+                self._local.client = test_client()
+            response = self._local.client.open(path, method=method, headers=headers)
+            response.get_data()
+            return response.status_code, response.headers.get('X-Query-Count')
+        if not hasattr(self._local, 'session'):
+            import requests
+            self._local.session = requests.Session()
+        response = self._local.session.request(method, self.url + path, headers=headers,
+                                               verify=self.verify)
+        return response.status_code, response.headers.get('X-Query-Count')
+
+
+def run(client: Client, paths: list, method: str, headers: dict, concurrency: int) -> dict:
+    """Send one request per path, concurrency at a time, and summarize them"""
+    def timed(path):
+        started = time.perf_counter()
+        status, queries = client.request(method, path, headers)
+        return time.perf_counter() - started, status, queries
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(timed, paths))
+    else:
+        results = [timed(path) for path in paths]
+    elapsed = time.perf_counter() - started
+    return summarize([r[0] for r in results], [r[1] for r in results],
+                     [int(r[2]) for r in results if r[2] is not None], elapsed)
+
+
+def benchmark(client: Client, count: int, concurrency: int, warmup: int, seed: int) -> dict:
+    """Run every endpoint and return the report"""
+    rng = random.Random(seed)
+    with app.app_context():
+        posts, users = sample_ids(Post, rng), sample_ids(User, rng)
+        rows = {model.__tablename__: db.session.scalar(select(func.count()).select_from(model))
+                for model in (User, Post, Comment, Like)}
+    token = jwt.encode({'email': email(0), 'exp': datetime.utcnow() + timedelta(hours=6)},
+                       app.config['SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    picks = [(rng.choice(posts), rng.choice(users)) for _ in range(warmup + count)]
+    endpoints = {}
+    for name, method, template in ENDPOINTS:
+        paths = [template.format(post=post, user=user) for post, user in picks]
+        run(client, paths[:warmup], method, headers, concurrency)
+        summary = run(client, paths[warmup:], method, headers, concurrency)
+        endpoints[f'{method} {template} ({name})'] = summary
+        print(f'{name}: {summary}')
+    return {'meta': {'date': datetime.utcnow().isoformat(timespec='seconds'),
+                     'revision': _revision(), 'python': platform.python_version(),
+                     'target': client.url or 'test client', 'requests': count,
+                     'concurrency': concurrency, 'seed': seed, 'rows': rows,
+                     'boot_seconds': app.config.get('CS_BOOT_SECONDS'),
+                     'config': {key: app.config.get(key) for key in
+                                ('CS_IDENTITY_CACHE', 'CS_RESPONSE_CACHE',
+                                 'CS_JSON_PROVIDER', 'CS_LIKE_WRITE_BEHIND')}},
+            'endpoints': endpoints}
+
+
+def compare(before: dict, after: dict):
+    """Print how each endpoint moved from one report to the other"""
+    for name, new in after['endpoints'].items():
+        old = before['endpoints'].get(name)
+        if old is None:
+            print(f'{name}: new')
+            continue
+        changes = []
+        for key in ('throughput_rps', 'p50_ms', 'p99_ms'):
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            changes.append(f'{key} {old[key]} -> {new[key]} ({change:+.1f}%)')
+        print(f'{name}: ' + ', '.join(changes))
+
+
+def _revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=200, help='per endpoint')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=20, help='requests not measured')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--url', help='a running server, e.g. https://localhost:5000')
+    parser.add_argument('--insecure', action='store_true',
+                        help='accept the self-signed certificate of a local server')
+    parser.add_argument('--output', help='file to write the JSON report to')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    args = parser.parse_args()
+    if args.compare:
+        with open(args.compare[0]) as before, open(args.compare[1]) as after:
+            compare(json.load(before), json.load(after))
+        return
+    report = benchmark(Client(args.url, not args.insecure), args.requests,
+                       args.concurrency, args.warmup, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+"""Seeds the database of the app with users, posts, comments and likes for
+the endpoint benchmarks. The same --seed always gives the same rows, ids
+included, so results can be compared between releases. Rows are inserted in
+bulk with the counters the app would have kept. Texts come from a pool drawn
+with Faker once, generating each one would take hours at 10m rows.
+Point CS_MYSQL_DB at a scratch database. Importing the app leaves the
+schema alone, whatever CS_ENV is: the seeder creates the missing tables
+itself, and only --drop empties the database first.
+Run from src/: python -m benchmarks.seed --scale 1m [--seed 42] [--drop]"""
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from faker import Faker
+from werkzeug.security import generate_password_hash
+from api.v1.app import app
+from models import Comment, Like, Post, User
+from utils.database import db
+
+# Rows in total, users are derived from it with the ratios below
+SCALES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+POSTS_PER_USER = 4
+COMMENTS_PER_POST = 5
+LIKES_PER_POST = 10
+ROWS_PER_USER = 1 + POSTS_PER_USER * (1 + COMMENTS_PER_POST + LIKES_PER_POST)
+PASSWORD = 'benchmark'
+CHUNK = 5000
+POOL = 2000
+START = datetime(2024, 1, 1)
+
+
+def email(index: int) -> str:
+    """Email of the index-th seeded user, user 0 is the one benchmarks log in as"""
+    return f'bench{index}@example.com'
+
+
+def plan(rows: int) -> dict:
+    """Return how many rows of each table make up about rows rows"""
+    users = max(1, rows // ROWS_PER_USER)
+    posts = users * POSTS_PER_USER
+    return {'users': users, 'posts': posts, 'comments': posts * COMMENTS_PER_POST,
+            'likes': posts * min(LIKES_PER_POST, users - 1)}
+
+
+class Seeder:
+    """Generates the rows of a scale from a seed"""
+
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        fake = Faker()
+        Faker.seed(seed)
+        self.names = [(fake.first_name(), fake.last_name()) for _ in range(POOL)]
+        self.titles = [fake.sentence(nb_words=8)[:128] for _ in range(POOL)]
+        self.contents = [fake.paragraph(nb_sentences=10)[:2048] for _ in range(POOL)]
+        self.comments = [fake.sentence(nb_words=20)[:512] for _ in range(POOL)]
+        self.jobs = [fake.job()[:256] for _ in range(POOL)]
+        self.countries = [fake.country_code() for _ in range(POOL)]
+        self.password = generate_password_hash(PASSWORD)
+
+    def id(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def moment(self) -> datetime:
+        return START + timedelta(seconds=self.rng.randrange(365 * 86400))
+
+    def users(self, count: int, ids: list):
+        for index in range(count):
+            first_name, last_name = self.rng.choice(self.names)
+            now = self.moment()
+            ids.append(self.id())
+            yield {'id': ids[-1], 'email': email(index), 'password': self.password,
+                   'first_name': first_name, 'last_name': last_name,
+                   'country': self.rng.choice(self.countries),
+                   'title': self.rng.choice(self.jobs),
+                   'phone': f'07{self.rng.randrange(10 ** 8):08d}',
+                   'sex': self.rng.choice(('F', 'M')), 'age': self.rng.randint(18, 80),
+                   'otp': 0, 'create_at': now, 'update_at': now}
+
+    def posts(self, user_ids: list, ids: list):
+        likes = min(LIKES_PER_POST, len(user_ids) - 1)
+        for user_id in user_ids:
+            for _ in range(POSTS_PER_USER):
+                now = self.moment()
+                ids.append(self.id())
+                yield {'id': ids[-1], 'user_id': user_id,
+                       'title': self.rng.choice(self.titles),
+                       'content': self.rng.choice(self.contents),
+                       'likes_count': likes, 'comments_count': COMMENTS_PER_POST,
+                       'create_at': now, 'update_at': now}
+
+    def post_comments(self, user_ids: list, post_ids: list):
+        for post_id in post_ids:
+            for _ in range(COMMENTS_PER_POST):
+                now = self.moment()
+                yield {'id': self.id(), 'post_id': post_id,
+                       'user_id': self.rng.choice(user_ids),
+                       'content': self.rng.choice(self.comments),
+                       'create_at': now, 'update_at': now}
+
+    def post_likes(self, user_ids: list, post_ids: list):
+        # User 0 likes nothing, so the like benchmarks leave the data as seeded
+        likers = user_ids[1:]
+        count = min(LIKES_PER_POST, len(likers))
+        for post_id in post_ids:
+            # A user likes a post at most once
+            for user_id in self.rng.sample(likers, count):
+                now = self.moment()
+                yield {'id': self.id(), 'post_id': post_id, 'user_id': user_id,
+                       'create_at': now, 'update_at': now}
+
+
+def insert(model, rows) -> int:
+    """Insert rows CHUNK at a time, one transaction each. Return the count"""
+    table, chunk, total = model.__table__, [], 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK:
+            total += _flush(table, chunk)
+    if chunk:
+        total += _flush(table, chunk)
+    print(f'{model.__tablename__}: {total} rows')
+    return total
+
+
+def _flush(table, chunk: list) -> int:
+    db.session.execute(table.insert(), chunk)
+    db.session.commit()
+    count = len(chunk)
+    chunk.clear()
+    return count
+
+
+def seed(rows: int, seed: int = 42) -> dict:
+    """Insert the dataset of about rows rows, return the rows per table"""
+    seeder = Seeder(seed)
+    counts = plan(rows)
+    user_ids, post_ids = [], []
+    return {'users': insert(User, seeder.users(counts['users'], user_ids)),
+            'posts': insert(Post, seeder.posts(user_ids, post_ids)),
+            'comments': insert(Comment, seeder.post_comments(user_ids, post_ids)),
+            'likes': insert(Like, seeder.post_likes(user_ids, post_ids))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scale', default='10k',
+                        help=f'one of {", ".join(SCALES)} or a number of rows')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--drop', action='store_true', help='empty the database first')
+    args = parser.parse_args()
+    rows = SCALES[args.scale] if args.scale in SCALES else int(args.scale)
+    with app.app_context():
+        if args.drop:
+            db.drop_all()
+        db.create_all()
+        started = time.perf_counter()
+        counts = seed(rows, args.seed)
+        print(f'{sum(counts.values())} rows seeded in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
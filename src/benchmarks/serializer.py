@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+"""Microbenchmark of BaseModel.to_dict on a 20-row list response.
+Compares the serializer against the column walk it replaced, which is kept
+here as the reference. Run from src/: python -m benchmarks.serializer"""
+import timeit
+from datetime import datetime
+from models import Post, User
+from models.base_model import time
+
+
+def reference_to_dict(obj):
+    """BaseModel.to_dict as it was before the per-model serializer"""
+    dict = {}
+    for column in obj.__table__.columns:
+        if isinstance(getattr(obj, column.name), datetime):
+            dict[column.name] = getattr(obj, column.name).strftime(time)
+        else:
+            dict[column.name] = getattr(obj, column.name)
+    try:
+        del dict['filepath']
+    except KeyError:
+        pass
+    if isinstance(obj, User):
+        for key in ('password', 'reset_token', 'otp', 'otp_expiry'):
+            dict.pop(key, None)
+    return dict
+
+
+def rows(count: int = 20) -> list:
+    now = datetime.utcnow()
+    users = [User(email=f'user{i}@example.com', first_name='Ada', last_name='Lovelace',
+                  country='RW', title='Nurse', phone='0780000000', sex='F', age=30,
+                  otp=0, create_at=now, update_at=now) for i in range(count)]
+    posts = [Post(title=f'Case {i}', content='Presenting complaint ' * 20,
+                  user_id=users[i].id, likes_count=i, comments_count=i,
+                  create_at=now, update_at=now) for i in range(count)]
+    return users + posts
+
+
+def main(number: int = 2000):
+    objects = rows()
+    for obj in objects:
+        assert obj.to_dict() == reference_to_dict(obj)
+    before = timeit.timeit(lambda: [reference_to_dict(obj) for obj in objects], number=number)
+    after = timeit.timeit(lambda: [obj.to_dict() for obj in objects], number=number)
+    per_list = 1e6 / number
+    print(f'reference: {before * per_list:.1f} us per 20 users + 20 posts')
+    print(f'serializer: {after * per_list:.1f} us per 20 users + 20 posts')
+    print(f'speedup: {before / after:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+"""Settings of gunicorn, read from the CS_ variables of utils/config.py.
+gunicorn loads this file itself when started from src/:
+    gunicorn wsgi:app
+The app is imported once by the master and the workers are forked from it,
+so they boot at once and share its memory. Whatever the master opened that
+cannot be shared is reset in post_fork: pooled database connections, which
+two processes must never use together, and the thread writing the logs.
+The workers append to the same log files, which only the master rotates.
+Workers are recycled after CS_MAX_REQUESTS requests to bound slow leaks.
+Each worker keeps its metrics in CS_METRICS_DIR, a temporary directory
+unless set, so /api/v1/metrics adds up all of them."""
+import multiprocessing
+import os
+import tempfile
+
+if not os.environ.get('CS_METRICS_DIR'):
+    os.environ['CS_METRICS_DIR'] = os.path.join(tempfile.gettempdir(), 'caseshare-metrics')
+
+from utils.config import Config
+
+WORKER_CLASSES = ('sync', 'gthread', 'gevent')
+
+if Config.CS_WORKER_CLASS not in WORKER_CLASSES:
+    raise ValueError(f'CS_WORKER_CLASS must be one of {", ".join(WORKER_CLASSES)}')
+
+# Hashing on every core would leave none for the requests waiting behind it
+if not 0 <= Config.CS_PASSWORD_WORKERS <= multiprocessing.cpu_count():
+    raise ValueError('CS_PASSWORD_WORKERS must be between 0 and the number of CPUs')
+
+bind = Config.CS_BIND
+workers = Config.CS_WORKERS or multiprocessing.cpu_count() * 2 + 1
+worker_class = Config.CS_WORKER_CLASS
+# Each worker would only know the writes it served, see utils/routing.py
+if Config.CS_REPLICA_URIS and Config.CS_REPLICA_STICKY_STORE != 'redis' and workers > 1:
+    raise ValueError('CS_REPLICA_STICKY_STORE must be redis with replicas and several workers')
+# gunicorn turns sync workers into gthread ones given more than one thread
+threads = Config.CS_THREADS if worker_class == 'gthread' else 1
+# Greenlets of a gevent worker
+worker_connections = Config.CS_WORKER_CONNECTIONS
+preload_app = Config.CS_PRELOAD
+max_requests = Config.CS_MAX_REQUESTS
+max_requests_jitter = Config.CS_MAX_REQUESTS_JITTER
+# Longer than the default 2s so connections from a balancer get reused.
+# Sync workers close every connection after its response
+keepalive = Config.CS_KEEPALIVE
+timeout = Config.CS_WORKER_TIMEOUT
+graceful_timeout = Config.CS_WORKER_TIMEOUT
+if Config.CERT and Config.KEY:
+    certfile = Config.CERT
+    keyfile = Config.KEY
+# utils.metrics, imported by the master in on_starting
+metrics = None
+
+
+def on_starting(server):
+    """Forget the metrics of the workers of a previous run"""
+    os.makedirs(Config.CS_METRICS_DIR, exist_ok=True)
+    for name in os.listdir(Config.CS_METRICS_DIR):
+        if name.endswith('.json'):
+            os.remove(os.path.join(Config.CS_METRICS_DIR, name))
+    # Imported here, child_exit runs in a signal handler of the master
+    global metrics
+    from utils.metrics import metrics
+
+
+def post_fork(server, worker):
+    """Leave the master's connections and threads to the master"""
+    from utils.logger import start_logging, stop_rotating
+    stop_rotating()
+    start_logging()
+    if preload_app:
+        from utils.database import db
+        from wsgi import app
+        with app.app_context():
+            for engine in db.engines.values():
+                # close=False: the master's connections are dropped, not closed
+                engine.dispose(close=False)
+
+
+def when_ready(server):
+    server.log.info('Serving on %s with %s %s workers', bind, workers, worker_class)
+    if Config.CS_LOG_MAX_BYTES:
+        from utils.logger import rotate_logs
+        rotate_logs(Config.CS_LOG_ROTATE_INTERVAL)
+
+
+def worker_exit(server, worker):
+    """Write what the worker still holds before it goes"""
+    from utils.like_buffer import like_buffer
+    from utils.mail import mailer
+    from utils.metrics import metrics
+    if like_buffer.enabled:
+        like_buffer.flush_at_exit()
+    if mailer.enabled:
+        mailer.flush()
+    if metrics.enabled and metrics.directory:
+        metrics.sync()
+
+
+def child_exit(server, worker):
+    """Keep the counters of a worker that exited, not its requests in flight,
+    and remove its file before a new worker can reuse its pid"""
+    # Without preloading, the master never ran metrics.init_app
+    metrics.directory = metrics.directory or Config.CS_METRICS_DIR
+    metrics.mark_process_dead(worker.pid)
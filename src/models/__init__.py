@@ -8,6 +8,7 @@ from models.direct_message import Message
 from models.document import Document
 from models.image import Image
 from models.post import Post
+from models.purge_job import PurgeJob
 from models.like import Like
 from models.video import Video
 from utils.database import db
@@ -4,6 +4,9 @@ Contains class BaseModel
 """
 
 from datetime import datetime
+from sqlalchemy import inspect
+from sqlalchemy.dialects import mysql
+from utils.cache import identity_cache
 from utils.database import db
 import uuid
 from utils.logger import logger
@@ -11,41 +14,90 @@ from utils.logger import logger
 time = "%Y-%m-%dT%H:%M:%S.%f"
 
 
+def format_datetime(value: datetime) -> str:
+    """Format a datetime like value.strftime(time), only faster.
+    isoformat zero-pads years below 1000 and appends the offset of aware
+    datetimes where strftime does neither, so those keep using strftime"""
+    if value.tzinfo is None and value.year >= 1000:
+        return value.isoformat(timespec='microseconds')
+    return value.strftime(time)
+
+# Callables run as listener(instance, action) after a successful commit
+write_listeners = []
+
+
+def on_write(listener):
+    """Register a listener to be told about every object saved, updated or
+    deleted through BaseModel, e.g. to invalidate caches. Usable as a decorator"""
+    write_listeners.append(listener)
+    return listener
+
+
 class BaseModel:
     """The BaseModel class from which future classes will be derived"""
 
     id = db.Column(db.String(60), primary_key=True)
     create_at = db.Column(db.DateTime, default=datetime.utcnow)
-    update_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Moved by every UPDATE of the row, ORM or not, so it can back ETags and
+    # Last-Modified. Microseconds on MySQL tell apart writes within a second
+    update_at = db.Column(db.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql'),
+                          default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def __init__(self, *args, **kwargs):
         setattr(self, 'id', str(uuid.uuid4()))
         for key, value in kwargs.items():
             setattr(self, key, value)
 
+    @classmethod
+    def get(cls, id):
+        """Get an object by primary key. Models setting __cache_identity__
+        are read through the identity cache, see utils/cache.py"""
+        if getattr(cls, '__cache_identity__', False):
+            return identity_cache.get(cls, id)
+        return cls.query.get(id)
+
     def __repr__(self):
         """Define a base way to print models"""
         return f"{self.__class__.__name__} <{self.id}>"
 
-    def to_dict(self):
-        """Define a base way to jsonify models, dealing with datetime objects"""
+    def to_dict(self, fields: tuple = None):
+        """Define a base way to jsonify models, dealing with datetime objects.
+        Columns named in __serialize_exclude__ are left out, and only the
+        columns in fields are kept when it is given"""
+        values = self.__dict__
         dict = {}
-        for column in self.__table__.columns:
-            if isinstance(getattr(self, column.name), datetime):
-                dict[column.name] = getattr(self, column.name).strftime(time)
-            else:
-                dict[column.name] = getattr(self, column.name)
-        try:
-            del dict['filepath']
-        except KeyError:
-            pass
+        for key, is_datetime in self._serialized_columns(fields):
+            # Loaded values are read directly, expired ones go through the ORM
+            value = values[key] if key in values else getattr(self, key)
+            if is_datetime and isinstance(value, datetime):
+                value = format_datetime(value)
+            dict[key] = value
         return dict
 
+    @classmethod
+    def _serialized_columns(cls, fields: tuple = None) -> tuple:
+        """Return (key, is_datetime) for every serialized column, or only for
+        those in fields, computed once per model class and set of fields"""
+        serializers = cls.__dict__.get('_serializers')
+        if serializers is None:
+            exclude = set(getattr(cls, '__serialize_exclude__', ()))
+            columns = tuple((column.key, isinstance(column.type, db.DateTime))
+                            for column in cls.__table__.columns
+                            if column.key not in exclude)
+            serializers = cls._serializers = {None: columns}
+        columns = serializers.get(fields)
+        if columns is None:
+            columns = tuple(column for column in serializers[None] if column[0] in fields)
+            if len(serializers) < 256:
+                serializers[fields] = columns
+        return columns
+
     def save(self):
         """Save an object to the database"""
         try:
             db.session.add(self)
             db.session.commit()
+            self._written('save')
             return True
         except Exception as e:
             logger.exception(e)
@@ -57,9 +109,10 @@ class BaseModel:
             for k, v in kwargs.items():
                 if k in self.__table__.columns.keys():
                     self.__dict__[k] = v
-                    self.update_at = datetime.now()
+                    self.update_at = datetime.utcnow()
             db.session.add(self)
             db.session.commit()
+            self._written('update')
             return True
         except Exception as e:
             logger.exception(e)
@@ -70,7 +123,41 @@ class BaseModel:
         try:
             db.session.delete(self)
             db.session.commit()
+            self._written('delete')
             return True
         except Exception as e:
             logger.exception(e)
             return False
+
+    def _identity(self):
+        """Return the primary key without refreshing an expired object"""
+        state = inspect(self, raiseerr=False)
+        if state is not None and state.identity:
+            return state.identity[0]
+        return self.id
+
+    def _cache_tags(self) -> list:
+        """Return the response cache tags a write of this row invalidates,
+        see utils/response_cache.py"""
+        return []
+
+    def _cascaded(self) -> list:
+        """Return (model, criterion) for the cached rows the database deletes
+        along with this one through ON DELETE CASCADE. No ORM event reports
+        them, so caches look them up before the delete is flushed"""
+        return []
+
+    def _written(self, action: str):
+        """Tell the write listeners that this object was committed"""
+        for listener in write_listeners:
+            try:
+                listener(self, action)
+            except Exception as e:
+                logger.exception(e)
+
+
+@on_write
+def _invalidate_identity(instance, action):
+    """Write-through invalidation of the identity cache"""
+    if getattr(instance, '__cache_identity__', False):
+        identity_cache.invalidate(type(instance), instance._identity())
@@ -1,11 +1,37 @@
 #!/usr/bin/python
 """holds calss comment"""
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
 from .base_model import BaseModel
+from .post import Post
+from utils.cache import identity_cache
 from utils.database import db
 
 class Comment(BaseModel, db.Model):
     """Representation of comment"""
     __tablename__ = "comments"
+    __cache_identity__ = True
+    # Serves keyset pagination of a post's comments, see utils/pagination.py
+    __table_args__ = (db.Index('ix_comments_post_id_create_at_id', 'post_id', 'create_at', 'id'),)
     content = db.Column(db.String(512), nullable=False)
-    user_id = db.Column(db.String(60), db.ForeignKey("users.id"), nullable=False)
-    post_id = db.Column(db.String(60), db.ForeignKey("posts.id"), nullable=False)
\ No newline at end of file
+    user_id = db.Column(db.String(60), db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    post_id = db.Column(db.String(60), db.ForeignKey("posts.id", ondelete="CASCADE"), nullable=False)
+
+    def _cache_tags(self) -> list:
+        # The post shows how many comments it has
+        return [f'comment:{self._identity()}', f'post:{self.post_id}:comments',
+                'comments:list'] + Post.counter_tags(self.post_id)
+
+
+@event.listens_for(Comment, 'after_insert')
+def _comment_added(mapper, connection, target):
+    """Count the new comment on its post in the same transaction"""
+    Post.bump_counters(connection, target.post_id, comments=1)
+    identity_cache.invalidate_on_commit(object_session(target), Post, target.post_id)
+
+
+@event.listens_for(Comment, 'after_delete')
+def _comment_deleted(mapper, connection, target):
+    """Uncount the deleted comment on its post in the same transaction"""
+    Post.bump_counters(connection, target.post_id, comments=-1)
+    identity_cache.invalidate_on_commit(object_session(target), Post, target.post_id)
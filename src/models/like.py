@@ -1,10 +1,115 @@
 #!/usr/bin/python
+"""holds class like"""
+import uuid
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
 from .base_model import BaseModel
+from .post import Post
+from utils.cache import identity_cache
 from utils.database import db
+from utils.logger import logger
+from utils.response_cache import response_cache
 
 class Like(BaseModel, db.Model):
     """Representation of likes"""
 
     __tablename__ = "likes"
-    user_id = db.Column(db.String(60), db.ForeignKey("users.id"), nullable=False)
-    post_id = db.Column(db.String(60), db.ForeignKey("posts.id"), nullable=False)
+    # A user likes a post at most once, and liking can be a single INSERT
+    __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='uq_likes_user_id_post_id'),)
+    user_id = db.Column(db.String(60), db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    post_id = db.Column(db.String(60), db.ForeignKey("posts.id", ondelete="CASCADE"), nullable=False)
+
+    def _cache_tags(self) -> list:
+        # The post shows how many likes it has
+        return Post.counter_tags(self.post_id)
+
+    @staticmethod
+    def add(user_id: str, post_id: str) -> bool:
+        """Like a post with one idempotent INSERT, counting it on the post in
+        the same transaction. Return True if the like is new"""
+        likes, now = Like.__table__, datetime.utcnow()
+        statement = likes.insert()\
+            .prefix_with('IGNORE', dialect='mysql')\
+            .prefix_with('OR IGNORE', dialect='sqlite')\
+            .values(id=str(uuid.uuid4()), user_id=user_id, post_id=post_id,
+                    create_at=now, update_at=now)
+        return Like._write(statement, post_id, 1)
+
+    @staticmethod
+    def remove(user_id: str, post_id: str) -> bool:
+        """Unlike a post, return True if there was a like to remove"""
+        likes = Like.__table__
+        statement = likes.delete().where(likes.c.user_id == user_id,
+                                         likes.c.post_id == post_id)
+        return Like._write(statement, post_id, -1)
+
+    @staticmethod
+    def toggle_many(post_id: str, liked: list, unliked: list) -> int:
+        """Apply many likes and unlikes of one post in one transaction, with
+        one multi-row INSERT and one DELETE. Return the change in likes_count"""
+        likes, now = Like.__table__, datetime.utcnow()
+        delta = changed = 0
+        try:
+            if liked:
+                rows = [{'id': str(uuid.uuid4()), 'user_id': user_id, 'post_id': post_id,
+                         'create_at': now, 'update_at': now} for user_id in liked]
+                statement = likes.insert()\
+                    .prefix_with('IGNORE', dialect='mysql')\
+                    .prefix_with('OR IGNORE', dialect='sqlite')\
+                    .values(rows)
+                added = db.session.execute(statement).rowcount
+                delta, changed = delta + added, changed + added
+            if unliked:
+                statement = likes.delete().where(likes.c.post_id == post_id,
+                                                 likes.c.user_id.in_(unliked))
+                removed = db.session.execute(statement).rowcount
+                delta, changed = delta - removed, changed + removed
+            if delta:
+                Post.bump_counters(db.session, post_id, likes=delta)
+            db.session.commit()
+        except Exception as e:
+            logger.exception(e)
+            db.session.rollback()
+            raise
+        if delta:
+            identity_cache.invalidate(Post, post_id)
+        if changed:
+            response_cache.invalidate(*Post.counter_tags(post_id))
+        return delta
+
+    @staticmethod
+    def is_liked(user_id: str, post_id: str) -> bool:
+        """Check whether a user likes a post, using the unique index"""
+        return db.session.query(Like.query.filter_by(user_id=user_id, post_id=post_id)
+                                .exists()).scalar()
+
+    @staticmethod
+    def _write(statement, post_id: str, delta: int) -> bool:
+        try:
+            changed = db.session.execute(statement).rowcount == 1
+            if changed:
+                Post.bump_counters(db.session, post_id, likes=delta)
+            db.session.commit()
+        except Exception as e:
+            logger.exception(e)
+            db.session.rollback()
+            raise
+        if changed:
+            identity_cache.invalidate(Post, post_id)
+            response_cache.invalidate(*Post.counter_tags(post_id))
+        return changed
+
+
+@event.listens_for(Like, 'after_insert')
+def _like_added(mapper, connection, target):
+    """Count a like saved through the ORM on its post in the same transaction"""
+    Post.bump_counters(connection, target.post_id, likes=1)
+    identity_cache.invalidate_on_commit(object_session(target), Post, target.post_id)
+
+
+@event.listens_for(Like, 'after_delete')
+def _like_deleted(mapper, connection, target):
+    """Uncount a like deleted through the ORM in the same transaction"""
+    Post.bump_counters(connection, target.post_id, likes=-1)
+    identity_cache.invalidate_on_commit(object_session(target), Post, target.post_id)
@@ -7,8 +7,41 @@ from utils.database import db
 class Post(BaseModel, db.Model):
     """Reperesentation of post"""
     __tablename__ = "posts"
-    user_id = db.Column(db.String(60), db.ForeignKey("users.id"), nullable=False)
+    __cache_identity__ = True
+    # Serve keyset pagination over (create_at, id), see utils/pagination.py
+    __table_args__ = (db.Index('ix_posts_create_at_id', 'create_at', 'id'),
+                      db.Index('ix_posts_user_id_create_at_id', 'user_id', 'create_at', 'id'))
+    user_id = db.Column(db.String(60), db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     title = db.Column(db.String(128), nullable=False)
     content = db.Column(db.String(2048), nullable=False)
-    comments = db.relationship("Comment", backref="post", cascade="all, delete, delete-orphan")
-    likes = db.relationship("Like", backref="like", cascade="all, delete, delete, delete-orphan")
\ No newline at end of file
+    # Denormalized so reading them never loads the likes or comments
+    likes_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comments_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # passive_deletes leaves the delete to the ON DELETE CASCADE foreign keys
+    # instead of loading every child row into the session first
+    comments = db.relationship("Comment", backref="post", cascade="all, delete-orphan",
+                               passive_deletes=True)
+    likes = db.relationship("Like", backref="like", cascade="all, delete-orphan",
+                            passive_deletes=True)
+
+    def _cache_tags(self) -> list:
+        return [f'post:{self._identity()}', f'user:{self.user_id}:posts', 'posts:list']
+
+    def _cascaded(self) -> list:
+        from models.comment import Comment
+        return [(Comment, Comment.post_id == self._identity())]
+
+    @staticmethod
+    def counter_tags(post_id: str) -> list:
+        """Return the response cache tags showing the counters of a post"""
+        return [f'post:{post_id}', 'posts:list']
+
+    @staticmethod
+    def bump_counters(connection, post_id: str, likes: int = 0, comments: int = 0):
+        """Add to the counters of a post on a connection or session, within the
+        caller's transaction. The addition happens in SQL so concurrent writers
+        never overwrite each other"""
+        posts = Post.__table__
+        connection.execute(posts.update().where(posts.c.id == post_id).values(
+            likes_count=posts.c.likes_count + likes,
+            comments_count=posts.c.comments_count + comments))
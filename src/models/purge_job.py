@@ -0,0 +1,14 @@
+#!/usr/bin/python
+"""holds class PurgeJob"""
+from .base_model import BaseModel
+from utils.database import db
+
+
+class PurgeJob(BaseModel, db.Model):
+    """Progress of the background purge of a deleted account"""
+    __tablename__ = "purge_jobs"
+    # Not a foreign key: the user row is the last thing the job deletes
+    user_id = db.Column(db.String(60), nullable=False, index=True)
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    total = db.Column(db.Integer, nullable=False, default=0)
+    purged = db.Column(db.Integer, nullable=False, default=0)
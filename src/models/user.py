@@ -2,13 +2,17 @@
 """holds class User"""
 
 from typing import Any
+from sqlalchemy import or_, select
 from .base_model import BaseModel
 from utils.database import db
-from werkzeug.security import generate_password_hash
+from utils.passwords import generate_password_hash
 
 class User(BaseModel, db.Model):
     """Representation of a user"""
     __tablename__ = 'users'
+    __cache_identity__ = True
+    # Never sent to clients
+    __serialize_exclude__ = ('password', 'reset_token', 'otp', 'otp_expiry')
     email = db.Column(db.String(128), unique=True, index=True, nullable=False)
     password = db.Column(db.String(128), nullable=False)
     first_name = db.Column(db.String(128), nullable=False)
@@ -21,12 +25,16 @@ class User(BaseModel, db.Model):
     reset_token = db.Column(db.String(256))
     otp = db.Column(db.Integer, default=0)
     otp_expiry = db.Column(db.DateTime)
-    images = db.relationship("Image", backref="user", cascade="all, delete, delete-orphan")
-    videos = db.relationship("Video", backref="user", cascade="all, delete, delete-orphan")
-    posts = db.relationship("Post", backref="user", cascade="all, delete, delete-orphan")
-    likes = db.relationship("Like", backref="user", cascade="all, delete, delete-orphan")
-    comments = db.relationship("Comment", backref="user", cascade="all, delete, delete-orphan")
-    documents = db.relationship("Document", backref="user", cascade="all, delete, delete-orphan")
+    # Set when a large account is waiting to be purged, see utils/purge.py
+    deleted_at = db.Column(db.DateTime)
+    # passive_deletes leaves the delete to the ON DELETE CASCADE foreign keys
+    # instead of loading every child row into the session first
+    images = db.relationship("Image", backref="user", cascade="all, delete-orphan", passive_deletes=True)
+    videos = db.relationship("Video", backref="user", cascade="all, delete-orphan", passive_deletes=True)
+    posts = db.relationship("Post", backref="user", cascade="all, delete-orphan", passive_deletes=True)
+    likes = db.relationship("Like", backref="user", cascade="all, delete-orphan", passive_deletes=True)
+    comments = db.relationship("Comment", backref="user", cascade="all, delete-orphan", passive_deletes=True)
+    documents = db.relationship("Document", backref="user", cascade="all, delete-orphan", passive_deletes=True)
 
     def __setattr__(self, __name: str, __value: Any):
         """Set attributes of the user"""
@@ -35,18 +43,21 @@ class User(BaseModel, db.Model):
         else:
             super.__setattr__(self, __name, __value)
 
-    def to_dict(self):
-        """Return a dictionary representation of the user"""
-        user_dict = super().to_dict()
-        user_dict.pop('password', None)
-        user_dict.pop('reset_token', None)
-        user_dict.pop('otp', None)
-        user_dict.pop('otp_expiry', None)
-        return user_dict
+    def _cache_tags(self) -> list:
+        return [f'user:{self._identity()}', 'users:list']
+
+    def _cascaded(self) -> list:
+        from models import Comment, Like, Post
+        id = self._identity()
+        posts = select(Post.id).where(Post.user_id == id)
+        # Comments and likes left on other posts change their counters
+        return [(Post, Post.user_id == id),
+                (Comment, or_(Comment.user_id == id, Comment.post_id.in_(posts))),
+                (Like, Like.user_id == id)]
 
     @staticmethod
     def get_user_by_email(email: str) -> 'User':
-        return User.query.filter_by(email=email).first()
+        return User.query.filter_by(email=email, deleted_at=None).first()
     
     @staticmethod
     def get_all_users() -> list:
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from flasgger import Swagger
+from sqlalchemy import inspect
+from api.v1.app import app, create_app
+from models import PurgeJob
+from utils.database import db
+from utils.like_buffer import like_buffer
+from utils.metrics import metrics
+from utils.purge import claim_purge
+
+
+class TestCreateApp(unittest.TestCase):
+    """Contain tests for the app factory and the schema command"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        uri = f'sqlite:///{os.path.join(self.directory.name, "app.db")}'
+        self.app = create_app(overrides={'SQLALCHEMY_DATABASE_URI': uri, 'CS_METRICS': False})
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        db.engine.dispose()
+        self.context.pop()
+        self.directory.cleanup()
+
+    def test_no_schema_at_boot(self):
+        """Test that creating the app leaves the database alone"""
+        self.assertFalse(self.app.config['CS_METRICS'])
+        self.assertIsInstance(self.app.config['CS_BOOT_SECONDS'], float)
+        self.assertEqual(inspect(db.engine).get_table_names(), [])
+
+    def test_apps_kept_apart(self):
+        """Test that a second app leaves the helpers of the served one alone"""
+        self.assertFalse(metrics.enabled)
+        self.assertIs(like_buffer.app, self.app)
+        with app.app_context():
+            self.assertTrue(metrics.enabled)
+            self.assertIs(like_buffer.app, app)
+        instance = metrics.instance()
+        metrics.init_app(self.app)
+        self.assertIs(metrics.instance(), instance)
+
+    def test_init_db(self):
+        """Test that init-db creates the tables, and drops them once confirmed"""
+        runner = self.app.test_cli_runner()
+        result = runner.invoke(args=['init-db'])
+        self.assertEqual(result.output, 'Tables created\n')
+        self.assertIn('posts', inspect(db.engine).get_table_names())
+        result = runner.invoke(args=['init-db', '--drop'], input='n\n')
+        self.assertEqual(result.exit_code, 1)
+        result = runner.invoke(args=['init-db', '--drop'], input='y\n')
+        self.assertEqual(result.exit_code, 0)
+
+    def test_resume_purges(self):
+        """Test that resume-purges finishes the jobs left unfinished only"""
+        runner = self.app.test_cli_runner()
+        runner.invoke(args=['init-db'])
+        stuck = PurgeJob(user_id='6607', status='running', total=10, purged=4)
+        done = PurgeJob(user_id='1234', status='done', total=10, purged=10)
+        db.session.add_all([stuck, done])
+        db.session.commit()
+        result = runner.invoke(args=['resume-purges', '--idle', '0'])
+        self.assertIn(f'Resuming purge {stuck.id} of user 6607', result.output)
+        self.assertTrue(result.output.endswith('1 purges resumed\n'))
+        self.assertEqual(db.session.get(PurgeJob, stuck.id).status, 'done')
+        result = runner.invoke(args=['resume-purges'])
+        self.assertEqual(result.output, '0 purges resumed\n')
+
+    def test_resume_skips_claimed(self):
+        """Test that resume-purges leaves a job claimed after it was listed,
+        like one a worker dequeues meanwhile"""
+        runner = self.app.test_cli_runner()
+        runner.invoke(args=['init-db'])
+        queued = PurgeJob(user_id='6607', status='pending', total=10, purged=0)
+        db.session.add(queued)
+        db.session.commit()
+        with patch('api.v1.commands.unfinished_purges') as mock_unfinished:
+            mock_unfinished.return_value = [('6607', queued.id, 'pending', queued.update_at)]
+            self.assertTrue(claim_purge(queued.id))
+            result = runner.invoke(args=['resume-purges', '--idle', '0'])
+        self.assertIn(f'Purge {queued.id} was taken by another worker', result.output)
+        self.assertTrue(result.output.endswith('0 purges resumed\n'))
+        self.assertEqual(db.session.get(PurgeJob, queued.id).purged, 0)
+
+    def test_spec_built_once(self):
+        """Test that the Swagger spec is built on its first request only"""
+        client = self.app.test_client()
+        client.environ_base['wsgi.url_scheme'] = 'https'
+        with patch.object(Swagger, 'get_apispecs', return_value={'paths': {}}) as mock_specs:
+            self.assertEqual(client.get('/apispec_1.json').json, {'paths': {}})
+            client.get('/apispec_1.json')
+        mock_specs.assert_called_once()
@@ -0,0 +1,49 @@
+import unittest
+from unittest.mock import patch
+from api.v1.app import test_client, app
+
+
+class TestAdminEndpoints(unittest.TestCase):
+    """Contain tests for the archive import and export endpoints"""
+
+    def setUp(self) -> None:
+        """Initialize a test client"""
+        self.client = test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.admins = app.config['CS_ADMIN_EMAILS']
+        app.config['CS_ADMIN_EMAILS'] = {'admin@example.com'}
+
+    def tearDown(self) -> None:
+        app.config['CS_ADMIN_EMAILS'] = self.admins
+        self.app_context.pop()
+
+    @patch('utils.decorators.jwt.decode')
+    def test_admins_only(self, mock_decode):
+        """Test that other users are turned away"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+        response = self.client.get('/api/v1/admin/export',
+                                   headers={'Authorization': 'Bearer token'})
+        self.assertEqual(response.status_code, 403)
+
+    @patch('api.v1.views.admin.import_ndjson')
+    @patch('utils.decorators.jwt.decode')
+    def test_import(self, mock_decode, mock_import):
+        """Test that the body is imported line by line"""
+        mock_decode.return_value = {'email': 'Admin@example.com'}
+        mock_import.return_value = {'imported': {'posts': 2, 'comments': 0},
+                                    'failed': 0, 'errors': []}
+        response = self.client.post('/api/v1/admin/import', data=b'{"a": 1}\n{"b": 2}\n',
+                                    headers={'Authorization': 'Bearer token'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['imported']['posts'], 2)
+        self.assertEqual(list(mock_import.call_args.args[0]), [b'{"a": 1}\n', b'{"b": 2}\n'])
+
+    @patch('utils.decorators.jwt.decode')
+    def test_export_unknown_type(self, mock_decode):
+        """Test that unknown types are rejected"""
+        mock_decode.return_value = {'email': 'admin@example.com'}
+        response = self.client.get('/api/v1/admin/export?types=posts,likes',
+                                   headers={'Authorization': 'Bearer token'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json, {'error': 'unknown types: likes'})
@@ -0,0 +1,111 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from api.v1.app import test_client, app
+from utils.metrics import metrics
+
+
+class TestBatchEndpoint(unittest.TestCase):
+    """Contain tests for the batch endpoint"""
+
+    def setUp(self) -> None:
+        """Initialize a test client"""
+        self.client = test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self) -> None:
+        self.app_context.pop()
+
+    @patch('models.User.get_user_by_email')
+    @patch('utils.decorators.jwt.decode')
+    def test_batch_authenticates_once(self, mock_decode, mock_get_user):
+        """Test that sub-requests reuse the token decoded for the batch"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+        user = MagicMock(id='6607')
+        user.to_dict.return_value = {'id': '6607'}
+        mock_get_user.return_value = user
+
+        response = self.client.post('/api/v1/batch', json=[
+            {'method': 'GET', 'path': '/api/v1/users/me'},
+            {'path': '/api/v1/users/me?fields=id'},
+            {'path': '/api/v1/users/me'}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 3)
+        for result in response.json:
+            self.assertEqual(result['status'], 200)
+            self.assertEqual(result['body'], {'id': '6607'})
+        mock_decode.assert_called_once()
+
+    @patch('models.Post.get')
+    @patch('models.User.get_user_by_email')
+    @patch('utils.decorators.jwt.decode')
+    def test_batch_keeps_order(self, mock_decode, mock_get_user, mock_get_post):
+        """Test that results come back in the order of the requests"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+        mock_get_user.return_value = MagicMock(id='6607')
+        mock_get_post.return_value = None
+
+        response = self.client.post('/api/v1/batch', json=[
+            {'path': '/api/v1/posts/ax3934'},
+            {'method': 'DELETE', 'path': '/api/v1/posts/ax3934'},
+            {'path': '/api/v1/nothing/here'}])
+        self.assertEqual([result['status'] for result in response.json], [404, 404, 404])
+        self.assertEqual(response.json[0]['body'], {'error': 'not found'})
+
+    @patch('models.User.get_user_by_email')
+    @patch('utils.decorators.jwt.decode')
+    def test_batch_closes_streamed_calls(self, mock_decode, mock_get_user):
+        """Test that streamed sub-responses are closed, so they are recorded"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+        mock_get_user.return_value = MagicMock(id='6607')
+        def recorded():
+            return sum(sum(entry[:-1]) for key, entry in metrics.requests.items()
+                       if key[0] == 'api_views.get_posts')
+        before = recorded()
+        # Streamed bodies are only buffered in test mode
+        with patch.dict(app.config, {'CS_ENV': 'production'}):
+            response = self.client.post('/api/v1/batch', json=[
+                {'path': '/api/v1/posts'}, {'path': '/api/v1/posts?offset=0'}])
+        self.assertEqual([result['body'] for result in response.json], [[], []])
+        self.assertEqual(metrics.in_flight, 0)
+        self.assertEqual(recorded(), before + 2)
+
+    @patch('utils.decorators.jwt.decode')
+    def test_batch_rejects_outside_api(self, mock_decode):
+        """Test that only API endpoints can be called, and not batch itself"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+
+        response = self.client.post('/api/v1/batch', json=[
+            {'method': 'POST', 'path': '/api/v1/batch'},
+            {'path': '/apidocs/'},
+            {'method': 'PATCH', 'path': '/api/v1/posts'},
+            {'path': 'api/v1/posts'},
+            'GET /api/v1/posts'])
+        self.assertEqual([result['status'] for result in response.json], [404, 404, 400, 400, 400])
+
+    @patch('utils.decorators.jwt.decode')
+    def test_batch_too_large(self, mock_decode):
+        """Test that batches are capped"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+
+        response = self.client.post('/api/v1/batch', json=[{'path': '/api/v1/'}] * 21)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json, {'error': 'at most 20 requests per batch'})
+
+    @patch('utils.decorators.jwt.decode')
+    def test_batch_not_a_list(self, mock_decode):
+        """Test that the body must be a list of requests"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+
+        response = self.client.post('/api/v1/batch', json={'path': '/api/v1/posts'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json, {'error': 'expected a list of requests'})
+
+    def test_batch_requires_token(self):
+        """Test that a batch without a token is refused"""
+        response = self.client.post('/api/v1/batch', json=[{'path': '/api/v1/posts'}])
+        self.assertEqual(response.status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
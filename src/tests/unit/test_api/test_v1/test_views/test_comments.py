@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 from api.v1.app import test_client, app
 
 
@@ -16,21 +16,78 @@ class TestComments(unittest.TestCase):
         """ Method called after the test method has been called and the result recorded """
         self.app_context.pop()
 
+    @patch('models.Comment.query')
     @patch('models.Post.query')
     @patch('utils.decorators.jwt.decode')
-    def test_get_comments(self, mock_decode, mock_query):
-        """ Test get comments """
+    def test_get_comments(self, mock_decode, mock_query, mock_comment_q):
+        """ Test get comments reads one page with LIMIT/OFFSET in SQL """
         mock_decode.return_value = {'email': 'abc@example.net'}
         mock_query.get.return_value = MagicMock(user_id='6607',
                                                 content='test',
-                                                id='1443')
+                                                id='ax3934')
         result = MagicMock()
         result.to_dict.return_value = {'id': '1443', 'user_id': '6607',
                                        'content': 'test', 'post_id': 'ax3934'}
-        mock_query.get.return_value.comments = [result]
-        response = self.client.get('/api/v1/posts/ax3934/comments')
+        mock_offset = mock_comment_q.filter_by.return_value.order_by.return_value.offset
+        mock_offset.return_value.limit.return_value.__iter__.return_value = iter([result])
+        response = self.client.get('/api/v1/posts/ax3934/comments?offset=1')
         self.assertEqual(response.status_code, 200)
         self.assertDictEqual(response.json[0], result.to_dict.return_value)
+        mock_comment_q.filter_by.assert_called_once_with(post_id='ax3934')
+        mock_offset.assert_called_once_with(20)
+        mock_offset.return_value.limit.assert_called_once_with(20)
+
+    @patch('models.Comment.query')
+    @patch('models.Post.query')
+    @patch('utils.decorators.jwt.decode')
+    def test_get_comments_with_cursor(self, mock_decode, mock_query, mock_comment_q):
+        """ Test get comments pages by keyset when a cursor is given """
+        mock_decode.return_value = {'email': 'abc@example.net'}
+        mock_query.get.return_value = MagicMock(id='ax3934')
+        mock_limit = mock_comment_q.filter_by.return_value.order_by.return_value.limit
+        mock_limit.return_value.all.return_value = []
+        response = self.client.get('/api/v1/posts/ax3934/comments?cursor=')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [])
+        mock_limit.assert_called_once_with(21)
+
+    @patch('api.v1.views.comment.load_includes')
+    @patch('models.Comment.query')
+    @patch('models.Post.query')
+    @patch('utils.decorators.jwt.decode')
+    def test_get_comments_include_author(self, mock_decode, mock_query, mock_comment_q,
+                                         mock_load_includes):
+        """ Test get comments embeds the redacted author of each comment """
+        mock_decode.return_value = {'email': 'abc@example.net'}
+        mock_query.get.return_value = MagicMock(id='ax3934')
+        comment = MagicMock()
+        comment.to_dict.return_value = {'id': '1443'}
+        comment.user.to_dict.return_value = {'id': '6607'}
+        query = mock_load_includes.return_value.filter_by.return_value
+        query.order_by.return_value.offset.return_value.limit.return_value.__iter__\
+            .return_value = iter([comment])
+        response = self.client.get('/api/v1/posts/ax3934/comments?include=author')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [{'id': '1443', 'author': {'id': '6607'}}])
+        mock_load_includes.assert_called_once_with(mock_comment_q, ANY, ('author',))
+
+    @patch('utils.decorators.jwt.decode')
+    def test_get_comments_unknown_include(self, mock_decode):
+        """ Test get comments rejects what comments cannot embed """
+        mock_decode.return_value = {'email': 'abc@example.net'}
+        response = self.client.get('/api/v1/posts/ax3934/comments?include=counts')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json, {'error': 'unknown includes: counts'})
+
+    @patch('models.Post.query')
+    @patch('utils.decorators.jwt.decode')
+    def test_get_comments_invalid_cursor(self, mock_decode, mock_query):
+        """ Test get comments rejects a tampered cursor """
+        mock_decode.return_value = {'email': 'abc@example.net'}
+        mock_query.get.return_value = MagicMock(id='ax3934')
+        response = self.client.get('/api/v1/posts/ax3934/comments?cursor=garbage')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json, {'error': 'invalid cursor'})
 
     @patch('models.Post.query')
     @patch('utils.decorators.jwt.decode')
@@ -0,0 +1,26 @@
+import unittest
+from unittest.mock import patch
+from api.v1.app import test_client
+
+
+class TestStatus(unittest.TestCase):
+    """Contain tests for the readiness endpoint"""
+
+    def setUp(self) -> None:
+        self.client = test_client()
+
+    def test_ready(self):
+        """Test that a ready worker answers 200 with its report"""
+        response = self.client.get('/api/v1/status')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['status'], 'OK')
+        self.assertIn('primary', response.json['pools'])
+
+    @patch('api.v1.views.index.health.check')
+    def test_not_ready(self, mock_check):
+        """Test that a saturated worker answers 503"""
+        mock_check.return_value = ({'status': 'UNAVAILABLE',
+                                    'failures': ['primary pool 100% used']}, False)
+        response = self.client.get('/api/v1/status')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json['failures'], ['primary pool 100% used'])
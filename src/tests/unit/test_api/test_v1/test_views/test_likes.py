@@ -0,0 +1,148 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from api.v1.app import test_client, app
+
+
+class TestLikeEndpoints(unittest.TestCase):
+    """Contain tests for like endpoints"""
+
+    def setUp(self) -> None:
+        """Initialize a test client"""
+        self.client = test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    def tearDown(self) -> None:
+        self.app_context.pop()
+
+    @patch('models.Like.is_liked')
+    @patch('models.Post.get')
+    @patch('models.User.get_user_by_email')
+    @patch('utils.decorators.jwt.decode')
+    def test_get_likes(self, mock_decode, mock_get_user, mock_get_post, mock_is_liked):
+        """Test that the like count is read from the post, not the likes"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+        mock_get_user.return_value = MagicMock(id='6607')
+        mock_get_post.return_value = MagicMock(id='ax3934', likes_count=12)
+        mock_is_liked.return_value = True
+
+        response = self.client.get('/api/v1/posts/ax3934/likes')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'post_id': 'ax3934', 'likes_count': 12, 'liked': True})
+        mock_is_liked.assert_called_once_with('6607', 'ax3934')
+
+    @patch('models.Post.get')
+    @patch('models.User.get_user_by_email')
+    @patch('utils.decorators.jwt.decode')
+    def test_get_likes_post_not_found(self, mock_decode, mock_get_user, mock_get_post):
+        """Test that likes of an inexistent post cannot be read"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+        mock_get_user.return_value = MagicMock(id='6607')
+        mock_get_post.return_value = None
+
+        response = self.client.get('/api/v1/posts/ax3934/likes')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json, {'error': 'not found'})
+
+    @patch('models.Like.add')
+    @patch('models.Post.get')
+    @patch('models.User.get_user_by_email')
+    @patch('utils.decorators.jwt.decode')
+    def test_create_like(self, mock_decode, mock_get_user, mock_get_post, mock_add):
+        """Test that liking a post counts the new like"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+        mock_get_user.return_value = MagicMock(id='6607')
+        mock_get_post.return_value = MagicMock(id='ax3934', likes_count=12)
+        mock_add.return_value = True
+
+        response = self.client.post('/api/v1/posts/ax3934/likes')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json, {'post_id': 'ax3934', 'likes_count': 13, 'liked': True})
+        mock_add.assert_called_once_with('6607', 'ax3934')
+
+    @patch('models.Like.add')
+    @patch('models.Post.get')
+    @patch('models.User.get_user_by_email')
+    @patch('utils.decorators.jwt.decode')
+    def test_create_like_is_idempotent(self, mock_decode, mock_get_user, mock_get_post, mock_add):
+        """Test that liking a post twice changes nothing"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+        mock_get_user.return_value = MagicMock(id='6607')
+        mock_get_post.return_value = MagicMock(id='ax3934', likes_count=12)
+        mock_add.return_value = False
+
+        response = self.client.post('/api/v1/posts/ax3934/likes')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'post_id': 'ax3934', 'likes_count': 12, 'liked': True})
+
+    @patch('models.Like.add')
+    @patch('models.Post.get')
+    @patch('models.User.get_user_by_email')
+    @patch('utils.decorators.jwt.decode')
+    def test_create_like_error(self, mock_decode, mock_get_user, mock_get_post, mock_add):
+        """Test that a database error returns 500"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+        mock_get_user.return_value = MagicMock(id='6607')
+        mock_get_post.return_value = MagicMock(id='ax3934', likes_count=12)
+        mock_add.side_effect = Exception('deadlock')
+
+        response = self.client.post('/api/v1/posts/ax3934/likes')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json, {'error': 'unknown error occurred'})
+
+    @patch('models.Like.remove')
+    @patch('models.Post.get')
+    @patch('models.User.get_user_by_email')
+    @patch('utils.decorators.jwt.decode')
+    def test_delete_like(self, mock_decode, mock_get_user, mock_get_post, mock_remove):
+        """Test that unliking a post uncounts the like"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+        mock_get_user.return_value = MagicMock(id='6607')
+        mock_get_post.return_value = MagicMock(id='ax3934', likes_count=12)
+        mock_remove.return_value = True
+
+        response = self.client.delete('/api/v1/posts/ax3934/likes')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'post_id': 'ax3934', 'likes_count': 11, 'liked': False})
+        mock_remove.assert_called_once_with('6607', 'ax3934')
+
+
+    @patch('utils.like_buffer.like_buffer.record')
+    @patch('models.Like.add')
+    @patch('models.Post.get')
+    @patch('models.User.get_user_by_email')
+    @patch('utils.decorators.jwt.decode')
+    def test_create_like_write_behind(self, mock_decode, mock_get_user, mock_get_post,
+                                      mock_add, mock_record):
+        """Test that with write-behind on, the like is buffered instead of written"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+        mock_get_user.return_value = MagicMock(id='6607')
+        mock_get_post.return_value = MagicMock(id='ax3934', likes_count=12)
+
+        with patch('utils.like_buffer.like_buffer.enabled', True):
+            response = self.client.post('/api/v1/posts/ax3934/likes')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json, {'post_id': 'ax3934', 'likes_count': 12, 'liked': True})
+        mock_record.assert_called_once_with('6607', 'ax3934', True)
+        mock_add.assert_not_called()
+
+    @patch('utils.like_buffer.like_buffer.pending')
+    @patch('models.Like.is_liked')
+    @patch('models.Post.get')
+    @patch('models.User.get_user_by_email')
+    @patch('utils.decorators.jwt.decode')
+    def test_get_likes_sees_buffered_like(self, mock_decode, mock_get_user, mock_get_post,
+                                          mock_is_liked, mock_pending):
+        """Test that a user sees their own buffered toggle before it is written"""
+        mock_decode.return_value = {'email': 'abc@example.com'}
+        mock_get_user.return_value = MagicMock(id='6607')
+        mock_get_post.return_value = MagicMock(id='ax3934', likes_count=12)
+        mock_pending.return_value = False
+
+        response = self.client.get('/api/v1/posts/ax3934/likes')
+        self.assertEqual(response.json['liked'], False)
+        mock_pending.assert_called_once_with('6607', 'ax3934')
+        mock_is_liked.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
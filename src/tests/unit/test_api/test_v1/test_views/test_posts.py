@@ -1,6 +1,8 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from datetime import datetime
+from unittest.mock import ANY, patch, MagicMock
 from api.v1.app import test_client, app
+from utils.streaming import stream_json_array
 
 class TestPostEndpoints(unittest.TestCase):
     """Contain tests for post endpoints"""
@@ -23,17 +25,17 @@ class TestPostEndpoints(unittest.TestCase):
         mock_query.offset.return_value = MagicMock()
         mock_limit = mock_query.offset.return_value.limit
         mock_limit.return_value = MagicMock()
-        mock_all = mock_limit.return_value.all
         result = MagicMock()
         result.to_dict.return_value = {'id': 'ax2736'}
-        mock_all.return_value = [result]
+        # The page is streamed straight from the query
+        mock_limit.return_value.__iter__.return_value = iter([result])
 
         response = self.client.get('/api/v1/posts')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json, [{'id': 'ax2736'}])
         mock_query.offset.assert_called_once_with(0)
         mock_limit.assert_called_once_with(20)
-        mock_all.assert_called_once()
+        mock_limit.return_value.__iter__.assert_called_once()
 
     @patch('utils.decorators.jwt.decode')
     @patch('models.Post.query')
@@ -43,17 +45,75 @@ class TestPostEndpoints(unittest.TestCase):
         mock_query.offset.return_value = MagicMock()
         mock_limit = mock_query.offset.return_value.limit
         mock_limit.return_value = MagicMock()
-        mock_all = mock_limit.return_value.all
-        mock_all.return_value = []
+        mock_limit.return_value.__iter__.return_value = iter([])
 
         response = self.client.get('/api/v1/posts')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json, [])
         mock_query.offset.assert_called_once_with(0)
         mock_limit.assert_called_once_with(20)
-        mock_all.assert_called_once()
+        mock_limit.return_value.__iter__.assert_called_once()
+
+    @patch('utils.decorators.jwt.decode')
+    @patch('models.Post.query')
+    def test_get_posts_with_cursor(self, mock_query, mock_jwt):
+        """Test that an empty cursor reads the first page by keyset and
+        sends the cursor of the next page in a header"""
+        mock_jwt.return_value = {'email': 'abc@example.com'}
+        rows = []
+        for i in range(21):
+            row = MagicMock(id=str(i), create_at=datetime(2023, 5, 19))
+            row.to_dict.return_value = {'id': str(i)}
+            rows.append(row)
+        mock_limit = mock_query.order_by.return_value.limit
+        mock_limit.return_value.all.return_value = rows
+
+        response = self.client.get('/api/v1/posts?cursor=')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 20)
+        self.assertIn('X-Next-Cursor', response.headers)
+        mock_limit.assert_called_once_with(21)
+        mock_query.offset.assert_not_called()
+
+    @patch('utils.decorators.jwt.decode')
+    @patch('models.Post.query')
+    def test_get_posts_invalid_cursor(self, mock_query, mock_jwt):
+        """Test that a tampered cursor is rejected"""
+        mock_jwt.return_value = {'email': 'abc@example.com'}
+
+        response = self.client.get('/api/v1/posts?cursor=garbage')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json, {'error': 'invalid cursor or offset'})
+
+
+    @patch('api.v1.views.posts.load_fields')
+    @patch('utils.decorators.jwt.decode')
+    @patch('models.Post.query')
+    def test_get_posts_with_fields(self, mock_query, mock_jwt, mock_load_fields):
+        """Test that requested fields are pushed down to the query and serialization"""
+        mock_jwt.return_value = {'email': 'abc@example.com'}
+        query = mock_load_fields.return_value
+        result = MagicMock()
+        result.to_dict.return_value = {'id': 'ax2736', 'title': 'A case'}
+        query.offset.return_value.limit.return_value.__iter__.return_value = iter([result])
+
+        response = self.client.get('/api/v1/posts?fields=id,title')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [{'id': 'ax2736', 'title': 'A case'}])
+        mock_load_fields.assert_called_once_with(mock_query, ANY, ('id', 'title'), ())
+        result.to_dict.assert_called_once_with(('id', 'title'))
+
+    @patch('utils.decorators.jwt.decode')
+    @patch('models.Post.query')
+    def test_get_posts_unknown_fields(self, mock_query, mock_jwt):
+        """Test that fields a post does not have are rejected before any query"""
+        mock_jwt.return_value = {'email': 'abc@example.com'}
+
+        response = self.client.get('/api/v1/posts?fields=title,author')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json, {'error': 'unknown fields: author'})
+        mock_query.offset.assert_not_called()
 
-    
     @patch('models.Post.query')
     @patch('utils.decorators.jwt.decode')
     @patch('api.v1.views.posts.jsonify')
@@ -69,6 +129,22 @@ class TestPostEndpoints(unittest.TestCase):
         mock_query.get.assert_called_once_with('6607')
         mock_jsonify.assert_called_once()
 
+    @patch('models.Post.query')
+    @patch('utils.decorators.jwt.decode')
+    def test_get_post_not_modified(self, mock_jwt_decode, mock_query):
+        """Test that a client holding the current version gets 304 unserialized"""
+        mock_jwt_decode.return_value = {'email': 'test@example.net'}
+        post = MagicMock(id='6607', update_at=datetime(2023, 11, 5, 14, 3, 9))
+        post.to_dict.return_value = {'id': '6607'}
+        mock_query.get.return_value = post
+
+        etag = self.client.get('/api/v1/posts/6607').headers['ETag']
+        post.to_dict.reset_mock()
+        response = self.client.get('/api/v1/posts/6607', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        post.to_dict.assert_not_called()
+
     @patch('models.Post.query')
     @patch('utils.decorators.jwt.decode')
     def test_get_post_not_found(self,
@@ -82,23 +158,47 @@ class TestPostEndpoints(unittest.TestCase):
         self.assertEqual(response.json, {'error': 'not found'})
         mock_query.get.assert_called_once_with('6607')
     
+    @patch('models.Post.query')
     @patch('models.User.query')
     @patch('utils.decorators.jwt.decode')
-    @patch('api.v1.views.posts.jsonify')
-    def test_get_post_for_user_success(self, mock_jsonify,
-                                       mock_jwt_decode, mock_user):
-        """Test if one can see posts for another user"""
+    def test_get_post_for_user_success(self, mock_jwt_decode, mock_user, mock_post):
+        """Test if one can see posts for another user, read a page at a time
+        with LIMIT instead of loading the whole relationship"""
         mock_jwt_decode.return_value = {'email': 'test@example.net'}
         mock_user.get.return_value = MagicMock(id='6607')
-        mock_posts = mock_user.return_value.posts
+        mock_order = mock_post.filter_by.return_value.order_by
+        mock_offset = mock_order.return_value.offset
         result = MagicMock()
         result.to_dict.return_value = {'id': 'ax2736'}
-        mock_posts.return_value = [result]
+        mock_offset.return_value.limit.return_value.all.return_value = [result]
 
-        response = self.client.get('/api/v1/users/6607/posts/')
+        with patch('api.v1.views.posts.stream_json_array',
+                   wraps=stream_json_array) as mock_stream:
+            response = self.client.get('/api/v1/users/6607/posts/?offset=2')
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [{'id': 'ax2736'}])
+        # Streamed like every list
+        mock_stream.assert_called_once()
         mock_user.get.assert_called_once_with('6607')
-        mock_jsonify.assert_called_once()
+        mock_post.filter_by.assert_called_once_with(user_id='6607')
+        mock_offset.assert_called_once_with(40)
+        mock_offset.return_value.limit.assert_called_once_with(20)
+
+    @patch('models.Post.query')
+    @patch('models.User.query')
+    @patch('utils.decorators.jwt.decode')
+    def test_get_post_for_user_with_cursor(self, mock_jwt_decode, mock_user, mock_post):
+        """Test if a user's posts can be paged by keyset"""
+        mock_jwt_decode.return_value = {'email': 'test@example.net'}
+        mock_user.get.return_value = MagicMock(id='6607')
+        mock_limit = mock_post.filter_by.return_value.order_by.return_value.limit
+        mock_limit.return_value.all.return_value = []
+
+        response = self.client.get('/api/v1/users/6607/posts/?cursor=')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [])
+        self.assertNotIn('X-Next-Cursor', response.headers)
+        mock_limit.assert_called_once_with(21)
 
     @patch('models.User.query')
     @patch('utils.decorators.jwt.decode')
@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from api.v1.app import test_client
+from api.v1.app import app, test_client
+from utils.passwords import PasswordsBusy
 
 class TestLoginEndpoint(unittest.TestCase):
 
@@ -74,6 +75,36 @@ class TestLoginEndpoint(unittest.TestCase):
         self.assertEqual(response.status_code, 400)
         mock_jsonify.assert_called_once_with({'error': 'invalid password'})
 
+    @patch('api.v1.views.user_auth.passwords.needs_rehash')
+    @patch('api.v1.views.user_auth.check_password_hash')
+    @patch('models.User.get_user_by_email')
+    def test_login_upgrades_hash(self, mock_get, mock_check, mock_rehash):
+        """Test if a hash made with old parameters is replaced on login"""
+        user = MagicMock(password='pbkdf2:sha256:260000$salt$hash')
+        mock_get.return_value = user
+        mock_check.return_value = True
+        mock_rehash.return_value = True
+        response = self.client.post('/api/v1/users/auth/login', json={
+            'email': 'abc@example.com',
+            'password': 'secret'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(user.password, 'secret')
+        user.save.assert_called_once()
+
+    @patch('api.v1.views.user_auth.check_password_hash')
+    @patch('models.User.get_user_by_email')
+    def test_login_busy(self, mock_get, mock_check):
+        """Test if logins are turned away while the hashing queue is full"""
+        mock_get.return_value = MagicMock(password='hashed_password')
+        mock_check.side_effect = PasswordsBusy
+        response = self.client.post('/api/v1/users/auth/login', json={
+            'email': 'abc@example.com',
+            'password': 'secret'
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
     @patch('api.v1.views.user_auth.jsonify')
     def test_invalid_json_data(self, mock_jsonify):
         """Test if an error code is returned if the data given is not json"""
@@ -157,6 +188,71 @@ class TestLoginEndpoint(unittest.TestCase):
         mock_jsonify.assert_called_once()
         mock_encode.assert_called_once()
 
+    @patch('api.v1.views.user_auth.mailer')
+    @patch('api.v1.views.user_auth.jwt.encode')
+    @patch('models.User.get_user_by_email')
+    def test_forgot_password_emails_link(self, mock_get, mock_encode, mock_mailer):
+        """Test if the reset link is queued for email, not returned, with mail on"""
+        mock_get.return_value = MagicMock(email='abc@example.com')
+        mock_encode.return_value = "some string"
+        mock_mailer.enabled = True
+        mock_send = mock_mailer.send
+        mock_send.return_value = True
+
+        with patch.dict(app.config, {'CS_PUBLIC_URL': 'https://caseshare.example'}):
+            response = self.client.post('/api/v1/users/auth/forgot_password', json={
+                'email': 'abc@example.com'
+            }, headers={'Host': 'evil.example'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('token', response.json)
+        self.assertEqual(mock_send.call_args.args[0], 'abc@example.com')
+        self.assertIn('https://caseshare.example/api/v1/users/auth/reset_password/some string',
+                      mock_send.call_args.args[2])
+        self.assertNotIn('evil.example', mock_send.call_args.args[2])
+
+    @patch('api.v1.views.user_auth.mailer')
+    @patch('models.User.get_user_by_email')
+    def test_forgot_password_without_public_url(self, mock_get, mock_mailer):
+        """Test if no reset email is sent outside tests without CS_PUBLIC_URL"""
+        mock_mailer.enabled = True
+        with patch.dict(app.config, {'CS_ENV': 'production', 'DEBUG': False,
+                                     'CS_PUBLIC_URL': ''}):
+            response = self.client.post('/api/v1/users/auth/forgot_password', json={
+                'email': 'abc@example.com'
+            }, headers={'Host': 'evil.example'})
+        self.assertEqual(response.status_code, 503)
+        mock_get.assert_not_called()
+        mock_mailer.send.assert_not_called()
+
+    @patch('api.v1.views.user_auth.mailer')
+    @patch('api.v1.views.user_auth.jwt.encode')
+    @patch('models.User.get_user_by_email')
+    def test_forgot_password_mail_queue_full(self, mock_get, mock_encode, mock_mailer):
+        """Test if a full mail queue is answered with a 503, never the link"""
+        mock_get.return_value = MagicMock(email='abc@example.com')
+        mock_encode.return_value = "some string"
+        mock_mailer.enabled = True
+        mock_mailer.send.return_value = False
+
+        response = self.client.post('/api/v1/users/auth/forgot_password', json={
+            'email': 'abc@example.com'
+        })
+        self.assertEqual(response.status_code, 503)
+        self.assertNotIn('token', response.json)
+
+    @patch('api.v1.views.user_auth.mailer')
+    @patch('models.User.get_user_by_email')
+    def test_forgot_password_without_mail(self, mock_get, mock_mailer):
+        """Test if the link is not given back outside tests when mail is off"""
+        mock_mailer.enabled = False
+        with patch.dict(app.config, {'CS_ENV': 'production', 'DEBUG': False}):
+            response = self.client.post('/api/v1/users/auth/forgot_password', json={
+                'email': 'abc@example.com'
+            })
+        self.assertEqual(response.status_code, 503)
+        self.assertNotIn('token', response.json)
+        mock_get.assert_not_called()
+
     @patch('api.v1.views.user_auth.jwt.decode')
     @patch('api.v1.views.user_auth.jsonify')
     @patch('models.User.get_user_by_email')
@@ -22,14 +22,14 @@ class TestUserEndpoints(unittest.TestCase):
         mock_query.offset.return_value = MagicMock()
         mock_limit = mock_query.offset.return_value.limit
         mock_limit.return_value = MagicMock()
-        mock_all = mock_limit.return_value.all
-        mock_all.return_value = MagicMock()
+        mock_limit.return_value.__iter__.return_value = iter([])
 
         response = self.client.get('/api/v1/users')
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [])
         mock_query.offset.assert_called_once_with(0)
         mock_limit.assert_called_once_with(20)
-        mock_all.assert_called_once()
+        mock_limit.return_value.__iter__.assert_called_once()
 
     @patch('models.User.get_user_by_email')
     @patch('utils.decorators.jwt.decode')
@@ -101,12 +101,12 @@ class TestUserEndpoints(unittest.TestCase):
 
     @patch('utils.decorators.jwt.decode')
     @patch('models.User.get_user_by_email')
-    @patch('api.v1.views.users.generate_password_hash')
+    @patch('api.v1.views.users.check_password_hash')
     def test_change_password_success(self, mock_hash, mock_get_user_by_email, mock_jwt_decode):
         """Test that the change password feature works well when all data is supplied"""
         mock_jwt_decode.return_value = {'email': 'abc@example.com'}
         mock_get_user_by_email.return_value = MagicMock(email='abc@example.com', password='123456')
-        mock_hash.return_value = '123456'
+        mock_hash.return_value = True
         response = self.client.put('/api/v1/users/me/change_password', json={
             'old_password': '123456', 'new_password': 'Test123456'})
         self.assertEqual(response.status_code, 200)
@@ -115,12 +115,12 @@ class TestUserEndpoints(unittest.TestCase):
 
     @patch('utils.decorators.jwt.decode')
     @patch('models.User.get_user_by_email')
-    @patch('api.v1.views.users.generate_password_hash')
+    @patch('api.v1.views.users.check_password_hash')
     def test_update_myself_failure_wrong_old_pwd(self, mock_hash, mock_get_user_by_email, mock_jwt_decode):
         """Test that the change password feature will not work if the old password is wrong"""
         mock_jwt_decode.return_value = {'email': 'abc@example.com'}
         mock_get_user_by_email.return_value = MagicMock(email='abc@example.com', password='123456')
-        mock_hash.return_value = '12356'
+        mock_hash.return_value = False
         response = self.client.put('/api/v1/users/me/change_password', json={
             'old_password': '123456', 'new_password': 'Test123456'})
         self.assertEqual(response.status_code, 400)
@@ -128,24 +128,90 @@ class TestUserEndpoints(unittest.TestCase):
 
     @patch('utils.decorators.jwt.decode')
     @patch('models.User.get_user_by_email')
-    @patch('api.v1.views.users.generate_password_hash')
+    @patch('api.v1.views.users.check_password_hash')
     def test_update_myself_failure_not_json(self, mock_hash, mock_get_user_by_email, mock_jwt_decode):
         """Test that the change password feature will not work if data passed not json"""
         mock_jwt_decode.return_value = {'email': 'abc@example.com'}
         mock_get_user_by_email.return_value = MagicMock(email='abc@example.com', password='123456')
-        mock_hash.return_value = '123456'
+        mock_hash.return_value = True
         response = self.client.put('/api/v1/users/me/change_password', json='whatever')
         mock_hash.assert_not_called()
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.json, {'error': 'not a JSON'})
 
+    @patch('api.v1.views.users.delete_account')
+    @patch('api.v1.views.users.count_owned_rows')
     @patch('utils.decorators.jwt.decode')
     @patch('models.User.get_user_by_email')
-    def test_delete_user_success(self, mock_get_user_by_email, mock_jwt_decode):
+    def test_delete_user_success(self, mock_get_user_by_email, mock_jwt_decode, mock_count,
+                                 mock_delete):
         """Test that a user can delete their account"""
         mock_jwt_decode.return_value = {'email': 'abc@example.net'}
         mock_get_user_by_email.return_value = MagicMock(email='abc@example.com')
-        mock_get_user_by_email.return_value.delete.return_value = True
+        mock_delete.return_value = True
+        mock_count.return_value = 12
         response = self.client.delete('/api/v1/users/me')
         self.assertEqual(response.status_code, 204)
-        mock_get_user_by_email.assert_called_once_with('abc@example.net')
\ No newline at end of file
+        mock_get_user_by_email.assert_called_once_with('abc@example.net')
+        mock_delete.assert_called_once_with(mock_get_user_by_email.return_value)
+
+    @patch('api.v1.views.users.schedule_purge')
+    @patch('api.v1.views.users.count_owned_rows')
+    @patch('utils.decorators.jwt.decode')
+    @patch('models.User.get_user_by_email')
+    def test_delete_large_user_in_background(self, mock_get_user_by_email, mock_jwt_decode,
+                                             mock_count, mock_schedule):
+        """Test that a large account is marked deleted and purged in the background"""
+        mock_jwt_decode.return_value = {'email': 'abc@example.net'}
+        mock_get_user_by_email.return_value = MagicMock(id='6607')
+        mock_count.return_value = app.config['CS_PURGE_THRESHOLD'] + 1
+        job = {'id': 'job1', 'user_id': '6607', 'status': 'pending', 'purged': 0}
+        mock_schedule.return_value.to_dict.return_value = job
+        response = self.client.delete('/api/v1/users/me')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json, job)
+        mock_get_user_by_email.return_value.delete.assert_not_called()
+        mock_schedule.assert_called_once()
+        # Counted only as far as the threshold
+        mock_count.assert_called_once_with('6607', app.config['CS_PURGE_THRESHOLD'])
+
+    @patch('models.User.query')
+    @patch('models.PurgeJob.query')
+    @patch('utils.decorators.jwt.decode')
+    def test_get_purge(self, mock_jwt_decode, mock_query, mock_user_query):
+        """Test that the owner of a purge can poll its progress"""
+        mock_jwt_decode.return_value = {'email': 'abc@example.com'}
+        mock_user_query.filter_by.return_value.first.return_value = MagicMock(id='6607')
+        mock_query.get.return_value = MagicMock(user_id='6607')
+        mock_query.get.return_value.to_dict.return_value = {'id': 'job1', 'purged': 500}
+        response = self.client.get('/api/v1/users/purges/job1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'id': 'job1', 'purged': 500})
+        mock_query.get.assert_called_once_with('job1')
+        mock_user_query.filter_by.assert_called_once_with(email='abc@example.com')
+
+    @patch('models.User.query')
+    @patch('models.PurgeJob.query')
+    @patch('utils.decorators.jwt.decode')
+    def test_get_purge_of_another_user(self, mock_jwt_decode, mock_query, mock_user_query):
+        """Test that polling the purge of another account returns 404"""
+        mock_jwt_decode.return_value = {'email': 'abc@example.com'}
+        mock_user_query.filter_by.return_value.first.return_value = MagicMock(id='1234')
+        mock_query.get.return_value = MagicMock(user_id='6607')
+        response = self.client.get('/api/v1/users/purges/job1')
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_purge_without_token(self):
+        """Test that polling a purge needs a token"""
+        response = self.client.get('/api/v1/users/purges/job1')
+        self.assertEqual(response.status_code, 403)
+
+    @patch('models.User.query')
+    @patch('models.PurgeJob.query')
+    @patch('utils.decorators.jwt.decode')
+    def test_get_purge_not_found(self, mock_jwt_decode, mock_query, mock_user_query):
+        """Test that polling an unknown purge returns 404"""
+        mock_jwt_decode.return_value = {'email': 'abc@example.com'}
+        mock_query.get.return_value = None
+        response = self.client.get('/api/v1/users/purges/job1')
+        self.assertEqual(response.status_code, 404)
\ No newline at end of file
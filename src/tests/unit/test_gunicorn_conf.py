@@ -0,0 +1,76 @@
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from utils.config import Config
+
+PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'gunicorn.conf.py')
+
+
+def load_conf():
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestGunicornConf(unittest.TestCase):
+    """Test the gunicorn settings and hooks"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.patcher = patch.multiple(Config, CS_METRICS_DIR=self.directory.name,
+                                      CS_WORKER_CLASS='sync', CS_THREADS=4, CS_WORKERS=3)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.directory.cleanup()
+
+    def test_worker_classes(self):
+        """Test that only gthread workers get threads, and unknown classes fail"""
+        conf = load_conf()
+        self.assertEqual((conf.worker_class, conf.threads, conf.workers), ('sync', 1, 3))
+        Config.CS_WORKER_CLASS = 'gthread'
+        self.assertEqual(load_conf().threads, 4)
+        Config.CS_WORKER_CLASS = 'eventlet'
+        with self.assertRaises(ValueError):
+            load_conf()
+
+    def test_password_workers_bounded(self):
+        """Test that hashing may not be allowed every core of the host"""
+        with patch.object(Config, 'CS_PASSWORD_WORKERS', os.cpu_count() + 1):
+            with self.assertRaises(ValueError):
+                load_conf()
+
+    def test_replicas_need_shared_sticky_store(self):
+        """Test that several workers with replicas need the Redis sticky store"""
+        with patch.multiple(Config, CS_REPLICA_URIS=['mysql://replica'],
+                            CS_REPLICA_STICKY_STORE='memory'):
+            with self.assertRaises(ValueError):
+                load_conf()
+            Config.CS_WORKERS = 1
+            self.assertEqual(load_conf().workers, 1)
+            Config.CS_WORKERS = 3
+            Config.CS_REPLICA_STICKY_STORE = 'redis'
+            self.assertEqual(load_conf().workers, 3)
+
+    def test_dead_worker_metrics(self):
+        """Test that old metrics are cleared and exited workers keep their counters"""
+        conf = load_conf()
+        with open(os.path.join(self.directory.name, '1.json'), 'w') as f:
+            json.dump({'in_flight': 2}, f)
+        conf.on_starting(MagicMock())
+        self.assertEqual(os.listdir(self.directory.name), [])
+        snapshot = {'requests': [[['get_posts', 'GET', 200], [1, 0.1]]], 'queries': [],
+                    'query_seconds': {}, 'in_flight': 2, 'caches': {}, 'routes': {}}
+        with open(os.path.join(self.directory.name, '7-1.json'), 'w') as f:
+            json.dump(snapshot, f)
+        with patch.object(conf.metrics, 'directory', None):
+            conf.child_exit(MagicMock(), MagicMock(pid=7))
+            conf.child_exit(MagicMock(), MagicMock(pid=8))
+        self.assertEqual(os.listdir(self.directory.name), ['exited.json'])
+        with open(os.path.join(self.directory.name, 'exited.json')) as f:
+            self.assertEqual(json.load(f), dict(snapshot, in_flight=0))
@@ -1,6 +1,7 @@
 import unittest
 from unittest import mock
-from models.base_model import BaseModel
+from datetime import datetime, timezone
+from models.base_model import BaseModel, format_datetime, time
 from models import Post
 from faker import Faker
 from flask import Flask
@@ -56,6 +57,42 @@ class BaseModelTestCase(unittest.TestCase):
         self.assertIn('create_at', dct)
         self.assertIn('update_at', dct)
 
+    def test_to_dict_matches_strftime(self):
+        """Test if to_dict gives exactly what formatting each column with strftime gave"""
+        self.post.title = 'A case'
+        self.post.create_at = datetime(2023, 11, 5, 14, 3, 9)
+        self.post.update_at = datetime(2023, 11, 5, 14, 3, 9, 120)
+        expected = {}
+        for column in Post.__table__.columns:
+            value = getattr(self.post, column.name)
+            expected[column.name] = value.strftime(time) if isinstance(value, datetime) else value
+        self.assertEqual(self.post.to_dict(), expected)
+        self.assertEqual(list(self.post.to_dict()), list(expected))
+
+    def test_to_dict_with_fields(self):
+        """Test if only the requested fields are serialized"""
+        self.post.title = 'A case'
+        self.post.create_at = datetime(2023, 11, 5, 14, 3, 9)
+        self.assertEqual(self.post.to_dict(('title', 'create_at')),
+                         {'title': 'A case', 'create_at': '2023-11-05T14:03:09.000000'})
+
+    def test_update_at_moves_on_update(self):
+        """Test if every UPDATE of a row, ORM or Core, refreshes update_at"""
+        self.assertIsNotNone(Post.__table__.c.update_at.onupdate)
+
+    def test_format_datetime(self):
+        """Test if format_datetime agrees with strftime, edge cases included"""
+        for value in (datetime(2023, 11, 5, 14, 3, 9), datetime(2023, 11, 5, 14, 3, 9, 7),
+                      datetime(999, 1, 1), datetime(2023, 1, 1, tzinfo=timezone.utc)):
+            self.assertEqual(format_datetime(value), value.strftime(time))
+
+    def test_serialized_columns_cached_per_model(self):
+        """Test if the column list is built once for each model class"""
+        columns = Post._serialized_columns()
+        self.assertIs(Post._serialized_columns(), columns)
+        self.assertIn(('create_at', True), columns)
+        self.assertIn(('title', False), columns)
+
     @mock.patch('utils.database.db.session')
     def test_save_success(self, mock_session):
         # Mock the necessary dependencies
@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from flask import Flask, g
+from models import User
+from utils.auth import Principal, PrincipalCache, current_principal, current_user, principal_cache
+
+
+class TestPrincipalCache(unittest.TestCase):
+    """Test resolving the user behind a token once per token"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        principal_cache.clear()
+
+    def tearDown(self):
+        self.app_context.pop()
+        principal_cache.clear()
+
+    @patch('models.User.get_user_by_email')
+    def test_resolved_once_per_token(self, mock_get):
+        """Test if the user is looked up once and then served from the cache"""
+        mock_get.return_value = MagicMock(id='6607', email='abc@example.com')
+        g.token, g.email = 'token', 'abc@example.com'
+        self.assertEqual(current_principal(), Principal('6607', 'abc@example.com'))
+        self.assertIs(current_user(), mock_get.return_value)
+
+        # A new request with the same token
+        del g.principal, g.user
+        self.assertEqual(current_principal(), Principal('6607', 'abc@example.com'))
+        mock_get.assert_called_once_with('abc@example.com')
+
+    @patch('models.User.get_user_by_email')
+    def test_unknown_user_is_not_cached(self, mock_get):
+        """Test if a token whose user does not exist resolves to None every time"""
+        mock_get.return_value = None
+        g.token, g.email = 'token', 'abc@example.com'
+        self.assertIsNone(current_principal())
+        self.assertIsNone(current_user())
+        self.assertNotIn('token', principal_cache)
+
+    @patch('models.User.get_user_by_email')
+    def test_ttl_respects_token_expiry(self, mock_get):
+        """Test if an expired token is never cached"""
+        mock_get.return_value = MagicMock(id='6607', email='abc@example.com')
+        g.token, g.email, g.token_exp = 'token', 'abc@example.com', 1
+        current_principal()
+        self.assertNotIn('token', principal_cache)
+
+    @patch('utils.database.db.session')
+    def test_user_write_invalidates(self, mock_session):
+        """Test if saving a user forgets every token resolved to them"""
+        principal_cache.set('t1', Principal('6607', 'abc@example.com'))
+        principal_cache.set('t2', Principal('6607', 'abc@example.com'))
+        principal_cache.set('t3', Principal('6608', 'xyz@example.com'))
+        user = User()
+        user.id = '6607'
+        user.save()
+        self.assertNotIn('t1', principal_cache)
+        self.assertNotIn('t2', principal_cache)
+        self.assertIn('t3', principal_cache)
+
+    def test_eviction_cleans_index(self):
+        """Test if evicted tokens are removed from the per-user index"""
+        cache = PrincipalCache(maxsize=1, ttl=60)
+        cache.set('t1', Principal('6607', 'abc@example.com'))
+        cache.set('t2', Principal('6608', 'xyz@example.com'))
+        self.assertNotIn('6607', cache._tokens)
+        self.assertEqual(cache._tokens['6608'], {'t2'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import io
+import json
+import unittest
+from flask import Flask
+from models import Comment, Post, User
+from utils.bulk import MAX_LINE, export_ndjson, import_ndjson, parse_line, read_lines
+from utils.database import db
+
+
+class TestParseLine(unittest.TestCase):
+    """Test the checks applied to each imported line"""
+
+    def test_post(self):
+        """Test if a post line gives its columns"""
+        model, row = parse_line(b'{"email": "a@b.c", "title": "A case", "content": "x",'
+                                b' "create_at": "2023-11-05T14:03:09.000120"}\n')
+        self.assertIs(model, Post)
+        self.assertEqual(row['email'], 'a@b.c')
+        self.assertEqual(row['create_at'].microsecond, 120)
+        self.assertIn('id', row)
+
+    def test_invalid(self):
+        """Test if invalid lines are rejected with a message"""
+        for line, message in (('[]', 'expected an object'),
+                              ('{"type": "like"}', 'unknown type like'),
+                              ('{"type": "comment", "user_id": "u", "content": "x"}',
+                               'missing post_id'),
+                              ('{"title": "t", "content": "c"}', 'missing user_id or email'),
+                              ('{"title": 3, "content": "c", "user_id": "u"}',
+                               'title must be a non empty string'),
+                              (json.dumps({'title': 't' * 129, 'content': 'c', 'user_id': 'u'}),
+                               'title longer than 128 characters'),
+                              ('{"type": ["post"]}', "unknown type ['post']"),
+                              ('{"title": "t", "content": "c", "user_id": "u", "create_at": 123}',
+                               'create_at must be an ISO 8601 string')):
+            with self.assertRaises(ValueError) as error:
+                parse_line(line)
+            self.assertEqual(str(error.exception), message)
+
+    def test_long_lines_cut(self):
+        """Test if a line longer than the limit is read in bounded memory"""
+        stream = io.BytesIO(b'x' * (MAX_LINE * 3) + b'\n{"a": 1}\n')
+        lines = list(read_lines(stream))
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(len(lines[0]), MAX_LINE)
+        with self.assertRaises(ValueError):
+            parse_line(lines[0])
+
+
+class TestImportExport(unittest.TestCase):
+    """Test NDJSON imports and exports against a database"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.user = User(email='dr@example.com', password='x', first_name='A', last_name='B')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def lines(self, *rows):
+        return [json.dumps(row).encode() + b'\n' for row in rows]
+
+    def test_import(self):
+        """Test if posts and comments are imported with their counters"""
+        report = import_ndjson(self.lines(
+            {'id': 'p1', 'email': 'dr@example.com', 'title': 'A case', 'content': 'x'},
+            {'type': 'comment', 'post_id': 'p1', 'user_id': self.user.id, 'content': 'y'},
+            {'type': 'comment', 'post_id': 'p1', 'user_id': self.user.id, 'content': 'z'},
+            {'type': 'comment', 'post_id': 'p2', 'user_id': self.user.id, 'content': 'z'},
+            {'email': 'ghost@example.com', 'title': 'A case', 'content': 'x'}), chunk_size=2)
+        self.assertEqual(report['imported'], {'posts': 1, 'comments': 2})
+        self.assertEqual(report['errors'], [{'line': 4, 'error': 'unknown post'},
+                                            {'line': 5, 'error': 'unknown user'}])
+        self.assertEqual(db.session.get(Post, 'p1').comments_count, 2)
+
+    def test_import_wrong_types(self):
+        """Test if lines with values of the wrong type are reported, not fatal"""
+        report = import_ndjson(self.lines(
+            {'id': 'p1', 'user_id': self.user.id, 'title': 'A case', 'content': 'x'},
+            {'user_id': self.user.id, 'title': 'A case', 'content': 'x', 'create_at': 123},
+            {'type': ['post'], 'user_id': self.user.id, 'title': 'A case', 'content': 'x'},
+            {'id': 'p2', 'user_id': self.user.id, 'title': 'A case', 'content': 'x'}),
+            chunk_size=1)
+        self.assertEqual(report['imported']['posts'], 2)
+        self.assertEqual([error['line'] for error in report['errors']], [2, 3])
+
+    def test_import_conflicts(self):
+        """Test if rows clashing with existing ones are reported, not the chunk"""
+        post = {'id': 'p1', 'user_id': self.user.id, 'title': 'A case', 'content': 'x'}
+        import_ndjson(self.lines(post))
+        report = import_ndjson(self.lines(post, dict(post, id='p2')))
+        self.assertEqual(report['imported']['posts'], 1)
+        self.assertEqual(report['errors'], [{'line': 1, 'error': 'conflicts with an existing row'}])
+
+    def test_export(self):
+        """Test if an export can be imported back"""
+        import_ndjson(self.lines(
+            {'id': 'p1', 'user_id': self.user.id, 'title': 'A case', 'content': 'x'},
+            {'type': 'comment', 'post_id': 'p1', 'user_id': self.user.id, 'content': 'y'}))
+        exported = ''.join(export_ndjson(batch_size=1)).splitlines()
+        self.assertEqual([json.loads(line)['type'] for line in exported], ['post', 'comment'])
+        db.session.execute(Comment.__table__.delete())
+        db.session.execute(Post.__table__.delete())
+        db.session.commit()
+        report = import_ndjson(line.encode() for line in exported)
+        self.assertEqual(report['imported'], {'posts': 1, 'comments': 1})
+        self.assertEqual(db.session.get(Post, 'p1').comments_count, 1)
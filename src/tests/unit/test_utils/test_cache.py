@@ -0,0 +1,154 @@
+import unittest
+from unittest import mock
+from unittest.mock import MagicMock
+from flask import Flask, g
+from models import Comment, Post
+from utils.cache import LRUCache, IdentityCache, _collect_cascaded, identity_cache
+from utils.config import Config
+from utils.database import db
+
+
+class TestLRUCache(unittest.TestCase):
+    """Test the in-process LRU+TTL cache"""
+
+    def test_get_set(self):
+        """Test if a stored value can be read back"""
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('b', 'default'), 'default')
+
+    def test_evicts_least_recently_used(self):
+        """Test if the least recently used entry goes when the cache is full"""
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 2)
+
+    @mock.patch('utils.cache.time.monotonic')
+    def test_entries_expire(self, mock_monotonic):
+        """Test if entries are dropped once their TTL has passed"""
+        cache = LRUCache(maxsize=2, ttl=60)
+        mock_monotonic.return_value = 100
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=10)
+        mock_monotonic.return_value = 115
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+    def test_non_positive_ttl_is_not_stored(self):
+        """Test if a value that would already be expired is not stored"""
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1, ttl=0)
+        self.assertIsNone(cache.get('a'))
+
+    def test_delete_and_clear(self):
+        """Test if entries can be dropped one by one or all at once"""
+        cache = LRUCache(maxsize=4, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class TestIdentityCache(unittest.TestCase):
+    """Test the read-through primary key cache"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.from_object(Config)
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.cache = IdentityCache()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    @mock.patch('models.Post.query')
+    def test_disabled_reads_database(self, mock_query):
+        """Test if a disabled cache goes straight to the database"""
+        self.cache.init_app(self.app)
+        self.assertIs(self.cache.get(Post, 'ax2736'), mock_query.get.return_value)
+        mock_query.get.assert_called_once_with('ax2736')
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 0, 'ratio': 0.0})
+
+    @mock.patch('utils.cache.IdentityCache._load')
+    @mock.patch('utils.cache.db.session')
+    @mock.patch('models.Post.query')
+    def test_read_through(self, mock_query, mock_session, mock_load):
+        """Test if a miss reads the database and fills the cache, then hits"""
+        self.app.config['CS_IDENTITY_CACHE'] = 'memory'
+        self.cache.init_app(self.app)
+        mock_session.identity_map.get.return_value = None
+        post = Post(title='test', content='test', user_id='6607')
+        mock_query.get.return_value = post
+
+        with mock.patch('utils.cache.inspect') as mock_inspect:
+            state = mock_inspect.return_value
+            state.modified, state.unloaded, state.identity = False, set(), (post.id,)
+            state.mapper.column_attrs = [MagicMock(key='id'), MagicMock(key='title')]
+            state.dict = {'id': post.id, 'title': 'test'}
+            self.assertIs(self.cache.get(Post, post.id), post)
+
+        self.assertIs(self.cache.get(Post, post.id), mock_load.return_value)
+        mock_query.get.assert_called_once_with(post.id)
+        mock_load.assert_called_once_with(Post, {'id': post.id, 'title': 'test'})
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'ratio': 0.5})
+
+    @mock.patch('utils.cache.db.session')
+    @mock.patch('models.Post.query')
+    def test_primary_after_change(self, mock_query, mock_session):
+        """Test if with replicas only rows changed within the lag window are
+        read from the primary on a miss"""
+        self.app.config.update(CS_IDENTITY_CACHE='memory', CS_REPLICA_URIS=['sqlite://'],
+                               CS_REPLICA_STICKY_SECONDS=5)
+        self.cache.init_app(self.app)
+        mock_session.identity_map.get.return_value = None
+        on_primary = []
+        mock_query.get.side_effect = lambda ident: on_primary.append(g.get('db_primary'))
+        with self.app.test_request_context('/posts/ax2736'):
+            self.cache.get(Post, 'ax2736')
+            self.cache.invalidate(Post, 'ax2736')
+            self.cache.get(Post, 'ax2736')
+            self.cache.get(Post, 'other')
+        self.assertEqual([bool(primary) for primary in on_primary], [False, True, False])
+
+    @mock.patch('utils.cache.db.session')
+    def test_invalidate(self, mock_session):
+        """Test if an invalidated row is read from the database again"""
+        self.app.config['CS_IDENTITY_CACHE'] = 'memory'
+        self.cache.init_app(self.app)
+        self.cache.backend.set(IdentityCache.key(Post, 'ax2736'), {'id': 'ax2736'})
+        self.cache.invalidate(Post, 'ax2736')
+        self.assertIsNone(self.cache.backend.get('posts:ax2736'))
+
+    @mock.patch('utils.database.db.session')
+    def test_model_write_invalidates(self, mock_session):
+        """Test if saving a cached model drops its cache entry"""
+        post = Post(title='test', content='test', user_id='6607')
+        with mock.patch('models.base_model.identity_cache') as mock_cache:
+            post.save()
+            post.delete()
+        mock_cache.invalidate.assert_called_with(Post, post.id)
+        self.assertEqual(mock_cache.invalidate.call_count, 2)
+
+    def test_cascaded_rows_invalidated(self):
+        """Test if rows the database deletes with a post are forgotten on commit"""
+        session = MagicMock(info={}, deleted=[Post(id='p', user_id='u')])
+        session.scalars.return_value = ['c1', 'c2']
+        with mock.patch.object(identity_cache, 'backend', MagicMock()):
+            _collect_cascaded(session, None, None)
+        self.assertEqual(session.info['identity_invalidations'],
+                         {(Comment, 'c1'), (Comment, 'c2')})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from datetime import datetime
+from flask import Flask, g, jsonify
+from models import Post
+from utils.conditional import conditional, validators
+
+
+class TestConditional(unittest.TestCase):
+    """Test the ETag and Last-Modified handling of GETs"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.post = Post(title='A case', likes_count=1, comments_count=0,
+                         update_at=datetime(2023, 11, 5, 14, 3, 9, 120))
+
+    def render(self):
+        self.rendered = True
+        return jsonify({'id': self.post.id})
+
+    def get(self, headers=None, rows=None):
+        self.rendered = False
+        with self.app.test_request_context(headers=headers or {}):
+            g.includes = None
+            return conditional(self.post if rows is None else rows, self.render)
+
+    def test_validators_change_with_version(self):
+        """Test if the ETag moves with update_at and the counters"""
+        etag, last_modified = validators(self.post)
+        self.assertEqual(last_modified, datetime(2023, 11, 5, 14, 3, 9, 120))
+        self.post.likes_count = 2
+        self.assertNotEqual(validators(self.post)[0], etag)
+
+    def test_validators_of_list(self):
+        """Test if a list is versioned by all its rows, without a date"""
+        other = Post(update_at=datetime(2024, 1, 1))
+        etag, last_modified = validators([self.post, other], 'cursor')
+        self.assertIsNone(last_modified)
+        self.assertNotEqual(etag, validators([self.post, other])[0])
+        self.assertNotEqual(etag, validators([self.post], 'cursor')[0])
+        self.assertIsNone(validators([])[1])
+
+    def test_list_ignores_if_modified_since(self):
+        """Test if a list whose rows changed is sent again to a client
+        holding only a date, newer than every row left on the page"""
+        response = self.get({'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'},
+                            rows=[self.post])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response.headers)
+
+    def test_fresh_request(self):
+        """Test if a request without validators gets the full response"""
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.rendered)
+        self.assertEqual(response.get_etag()[0], validators(self.post)[0])
+        self.assertEqual(response.headers['Last-Modified'], 'Sun, 05 Nov 2023 14:03:09 GMT')
+
+    def test_if_none_match(self):
+        """Test if a matching ETag gets 304 without rendering"""
+        etag = validators(self.post)[0]
+        response = self.get({'If-None-Match': f'"{etag}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(self.rendered)
+        self.assertEqual(response.get_etag()[0], etag)
+
+    def test_if_none_match_stale(self):
+        """Test if an old ETag gets the full response"""
+        response = self.get({'If-None-Match': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.rendered)
+
+    def test_if_modified_since(self):
+        """Test if an unchanged resource gets 304 by date"""
+        response = self.get({'If-Modified-Since': 'Sun, 05 Nov 2023 14:03:09 GMT'})
+        self.assertEqual(response.status_code, 304)
+        response = self.get({'If-Modified-Since': 'Sun, 05 Nov 2023 14:03:08 GMT'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_includes_are_not_conditional(self):
+        """Test if responses embedding other rows carry no validators"""
+        with self.app.test_request_context():
+            g.includes = ('author',)
+            response = conditional(self.post, lambda: jsonify({}))
+        self.assertIsNone(response.get_etag()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
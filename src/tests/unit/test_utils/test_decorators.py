@@ -1,7 +1,8 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from flask import Flask
-from utils.decorators import token_required
+from flask import Flask, g, jsonify
+from models import Post
+from utils.decorators import BATCH_AUTH, sparse_fields, token_required
 
 class TestTokenRequiredDecorator(unittest.TestCase):
     def setUp(self):
@@ -21,6 +22,19 @@ class TestTokenRequiredDecorator(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data, b'Success')
 
+    @patch('jwt.decode')
+    def test_token_required_exposes_token_on_g(self, mock_decode):
+        mock_decode.return_value = {'email': 'test@example.com', 'exp': 1700000000}
+
+        @self.app.route('/')
+        @token_required
+        def test_route(email):
+            return jsonify([g.token, g.email, g.token_exp]), 200
+
+        response = self.client.get('/', headers={'Authorization': 'Bearer valid_token'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), ['valid_token', 'test@example.com', 1700000000])
+
     @patch('jwt.decode')
     def test_token_required_invalid_token(self, mock_decode):
         mock_decode.side_effect = Exception('Invalid token')
@@ -34,6 +48,18 @@ class TestTokenRequiredDecorator(unittest.TestCase):
         self.assertEqual(response.status_code, 403)
         self.assertEqual(response.get_json(), {'error': 'invalid or missing token'})
 
+    @patch('jwt.decode')
+    def test_token_required_batch_auth(self, mock_decode):
+        @self.app.route('/')
+        @token_required
+        def test_route(email):
+            return jsonify([email, g.token]), 200
+
+        response = self.client.get('/', environ_base={BATCH_AUTH: ('tok', 'test@example.com', None)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), ['test@example.com', 'tok'])
+        mock_decode.assert_not_called()
+
     def test_token_required_no_token(self):
         @self.app.route('/')
         @token_required
@@ -44,5 +70,31 @@ class TestTokenRequiredDecorator(unittest.TestCase):
         self.assertEqual(response.status_code, 403)
         self.assertEqual(response.get_json(), {'error': 'invalid or missing token'})
 
+
+class TestSparseFieldsDecorator(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.client = self.app.test_client()
+
+        @self.app.route('/')
+        @sparse_fields(Post)
+        def test_route():
+            return jsonify(g.fields), 200
+
+    def test_sparse_fields_valid(self):
+        response = self.client.get('/?fields=id,title')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), ['id', 'title'])
+
+    def test_sparse_fields_missing(self):
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.get_json())
+
+    def test_sparse_fields_invalid(self):
+        response = self.client.get('/?fields=title,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(), {'error': 'unknown fields: secret'})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from models import Post, User
+from utils.fields import get_with_fields, load_fields, parse_fields
+
+
+class TestFields(unittest.TestCase):
+    """Test the parsing and loading of sparse fieldsets"""
+
+    def test_parse_fields(self):
+        """Test if fields are split, trimmed and deduplicated in order"""
+        self.assertEqual(parse_fields(Post, 'id, title,create_at,title'),
+                         ('id', 'title', 'create_at'))
+
+    def test_parse_no_parameter(self):
+        """Test if a missing parameter means every field"""
+        self.assertIsNone(parse_fields(Post, None))
+
+    def test_parse_empty(self):
+        """Test if an empty parameter is rejected"""
+        with self.assertRaises(ValueError):
+            parse_fields(Post, ' , ')
+
+    def test_parse_unknown_field(self):
+        """Test if fields the model does not have are rejected"""
+        with self.assertRaisesRegex(ValueError, 'unknown fields: author'):
+            parse_fields(Post, 'title,author')
+
+    def test_parse_sensitive_field(self):
+        """Test if columns a user never serializes cannot be requested"""
+        for field in ('password', 'reset_token', 'otp', 'otp_expiry'):
+            with self.assertRaises(ValueError):
+                parse_fields(User, f'email,{field}')
+
+    @patch('utils.fields.load_only')
+    def test_load_fields(self, mock_load_only):
+        """Test if only the requested columns and those always needed are selected"""
+        query = MagicMock()
+        self.assertIs(load_fields(query, Post, ('title',)), query.options.return_value)
+        mock_load_only.assert_called_once_with(Post.id, Post.create_at, Post.update_at, Post.title)
+
+    def test_load_all_fields(self):
+        """Test if the query is left alone when no fields are requested"""
+        query = MagicMock()
+        self.assertIs(load_fields(query, Post, None), query)
+        query.options.assert_not_called()
+
+    @patch('models.Post.get')
+    def test_get_without_fields(self, mock_get):
+        """Test if a full object still goes through Model.get"""
+        self.assertIs(get_with_fields(Post, 'ax3934'), mock_get.return_value)
+        mock_get.assert_called_once_with('ax3934')
+
+
+if __name__ == '__main__':
+    unittest.main()
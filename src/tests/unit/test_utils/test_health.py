@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from flask import Flask
+from utils.database import db
+from utils.health import HealthCheck, pool_stats
+
+
+class TestHealthCheck(unittest.TestCase):
+    """Test the readiness report and its thresholds"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = \
+            f'sqlite:///{os.path.join(self.directory.name, "health.db")}'
+        self.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': 2, 'max_overflow': 0}
+        db.init_app(self.app)
+        self.health = HealthCheck()
+        self.health.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        db.engine.dispose()
+        self.context.pop()
+        self.directory.cleanup()
+
+    def test_ready(self):
+        """Test if a worker with idle dependencies is ready"""
+        report, ready = self.health.check()
+        self.assertTrue(ready)
+        self.assertEqual(report['status'], 'OK')
+        self.assertEqual(report['pools']['primary']['capacity'], 2)
+        self.assertIn('latency', report['database']['primary'])
+        self.assertEqual(report['caches']['identity'], {'backend': 'off'})
+        self.assertEqual(set(report['queues']), {'likes', 'purges', 'logs', 'mails'})
+
+    def test_pool_saturated(self):
+        """Test if a busy pool turns the worker away from traffic"""
+        connections = [db.engine.connect() for _ in range(2)]
+        try:
+            self.assertEqual(pool_stats(db.engine.pool)['usage'], 1.0)
+            report, ready = self.health.check()
+        finally:
+            for connection in connections:
+                connection.close()
+        self.assertFalse(ready)
+        self.assertEqual(report['failures'], ['primary pool 100% used', 'primary unreachable'])
+        self.assertEqual(report['database']['primary'], {'error': 'pool exhausted'})
+
+    def test_slow_database_and_queues(self):
+        """Test if the latency and queue thresholds apply"""
+        self.health.max_latency = 0.1
+        self.health.max_queue = 3
+        with patch.object(HealthCheck, '_ping_database', return_value={'latency': 0.25}), \
+                patch('utils.health.pending_purges', return_value=4):
+            report, ready = self.health.check()
+        self.assertFalse(ready)
+        self.assertEqual(report['failures'], ['primary answered in 0.250s', '4 purges queued'])
+
+    def test_probes_cached(self):
+        """Test if the database is probed once per TTL"""
+        with patch.object(HealthCheck, '_ping_database',
+                          return_value={'latency': 0.001}) as mock_ping:
+            self.health.check()
+            self.health.check()
+            self.assertEqual(mock_ping.call_count, 1)
+            self.health._probed -= self.health.probe_ttl
+            self.health.check()
+            self.assertEqual(mock_ping.call_count, 2)
+
+    def test_cache_down_reported_only(self):
+        """Test if a failing Redis is reported without failing the check"""
+        backend = MagicMock()
+        backend.ping.side_effect = ConnectionError
+        with patch('utils.health.identity_cache', MagicMock(backend=backend)):
+            report, ready = self.health.check()
+        self.assertTrue(ready)
+        self.assertEqual(report['caches']['identity'],
+                         {'backend': 'redis', 'ok': False, 'error': 'ConnectionError'})
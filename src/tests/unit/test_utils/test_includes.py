@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from flask import Flask
+from models import Comment, Post
+from utils.includes import (comment_previews, include_columns, load_includes,
+                            parse_includes, with_includes)
+
+
+class TestIncludes(unittest.TestCase):
+    """Test the expansion of related rows into list responses"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['CS_COMMENT_PREVIEW_SIZE'] = 3
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_parse_includes(self):
+        """Test if includes are split, trimmed and deduplicated"""
+        self.assertEqual(parse_includes(Post, 'author, counts,author'), ('author', 'counts'))
+        self.assertIsNone(parse_includes(Post, None))
+        self.assertIsNone(parse_includes(Post, ''))
+
+    def test_parse_unknown_include(self):
+        """Test if includes a model cannot embed are rejected"""
+        with self.assertRaisesRegex(ValueError, 'unknown includes: counts'):
+            parse_includes(Comment, 'author,counts')
+
+    def test_include_columns(self):
+        """Test if the columns read by the includes are listed"""
+        self.assertEqual(include_columns(('author', 'comment_preview', 'counts')),
+                         ('user_id', 'likes_count', 'comments_count'))
+        self.assertEqual(include_columns(None), ())
+
+    @patch('utils.includes.selectinload')
+    def test_load_includes(self, mock_selectinload):
+        """Test if authors are eager loaded in one batch"""
+        query = MagicMock()
+        self.assertIs(load_includes(query, Post, ('author',)), query.options.return_value)
+        mock_selectinload.assert_called_once_with(Post.user)
+        self.assertIs(load_includes(query, Post, ('counts',)), query)
+
+    @patch('utils.database.db.session')
+    def test_comment_previews(self, mock_session):
+        """Test if previews of every post come from a single query"""
+        comments = [MagicMock(post_id='p1'), MagicMock(post_id='p1'), MagicMock(post_id='p3')]
+        mock_session.scalars.return_value = comments
+
+        previews = comment_previews(['p1', 'p2', 'p3'], 3)
+        self.assertEqual(previews, {'p1': comments[:2], 'p2': [], 'p3': comments[2:]})
+        mock_session.scalars.assert_called_once()
+
+    @patch('utils.database.db.session')
+    def test_comment_previews_no_posts(self, mock_session):
+        self.assertEqual(comment_previews([], 3), {})
+        mock_session.scalars.assert_not_called()
+
+    def test_without_includes(self):
+        """Test if rows are left alone without includes"""
+        rows = MagicMock()
+        self.assertEqual(with_includes(rows, Post, None), (rows, None))
+
+    @patch('utils.includes.comment_previews')
+    def test_with_includes(self, mock_previews):
+        """Test if each row embeds its author, previews and counts"""
+        post = MagicMock(id='p1', likes_count=4, comments_count=1)
+        post.to_dict.return_value = {'id': 'p1'}
+        post.user.to_dict.return_value = {'id': '6607'}
+        comment = MagicMock()
+        comment.to_dict.return_value = {'id': 'c1'}
+        mock_previews.return_value = {'p1': [comment]}
+
+        rows, serialize = with_includes(iter([post]), Post,
+                                        ('author', 'comment_preview', 'counts'), ('id',))
+        self.assertEqual(rows, [post])
+        self.assertEqual(serialize(post), {'id': 'p1', 'author': {'id': '6607'},
+                                           'comment_preview': [{'id': 'c1'}],
+                                           'counts': {'likes': 4, 'comments': 1}})
+        post.to_dict.assert_called_once_with(('id',))
+        mock_previews.assert_called_once_with(['p1'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from utils import json_provider
+from utils.json_provider import OrjsonProvider, json_provider_class
+
+
+@unittest.skipIf(json_provider.orjson is None, 'orjson is not installed')
+class TestOrjsonProvider(unittest.TestCase):
+    """Test that the orjson provider answers like Flask's default one"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.default = DefaultJSONProvider(self.app)
+        self.app.json = OrjsonProvider(self.app)
+
+    def test_same_values(self):
+        """Test if both providers encode to the same values"""
+        obj = {'b': 1, 'a': [None, True, 'é'], 'when': datetime(2023, 11, 5, 14, 3, 9)}
+        self.assertEqual(self.app.json.loads(self.app.json.dumps(obj)),
+                         self.default.loads(self.default.dumps(obj)))
+
+    def test_sorted_keys(self):
+        """Test if keys are sorted like jsonify sorts them"""
+        self.assertEqual(self.app.json.dumps({'b': 1, 'a': 2}), '{"a":2,"b":1}')
+
+    def test_response(self):
+        """Test if jsonify goes through orjson"""
+        with self.app.app_context():
+            response = self.app.json.response({'id': '6607'})
+        self.assertEqual(response.get_json(), {'id': '6607'})
+        self.assertEqual(response.mimetype, 'application/json')
+
+    def test_invalid_json(self):
+        """Test if invalid JSON raises a ValueError, like json.loads"""
+        with self.assertRaises(ValueError):
+            self.app.json.loads('{not json')
+
+
+class TestJsonProviderClass(unittest.TestCase):
+    """Test the selection of the JSON provider"""
+
+    def test_stdlib(self):
+        self.assertIs(json_provider_class('stdlib'), DefaultJSONProvider)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            json_provider_class('simplejson')
+
+    @mock.patch('utils.json_provider.orjson', None)
+    def test_auto_without_orjson(self):
+        """Test if auto falls back to the standard library"""
+        self.assertIs(json_provider_class('auto'), DefaultJSONProvider)
+        with self.assertRaises(ValueError):
+            json_provider_class('orjson')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+from unittest import mock
+from unittest.mock import MagicMock
+from sqlalchemy.exc import IntegrityError
+from utils.like_buffer import LikeBuffer
+
+
+class TestLikeBuffer(unittest.TestCase):
+    """Test the write-behind buffer for likes"""
+
+    def setUp(self):
+        self.buffer = LikeBuffer()
+        self.buffer.app = MagicMock()
+        self.buffer._start = MagicMock()
+
+    def test_record_keeps_last_toggle(self):
+        """Test if only the last toggle of a user on a post is kept"""
+        self.buffer.record('u1', 'p1', True)
+        self.buffer.record('u1', 'p1', False)
+        self.buffer.record('u1', 'p1', True)
+        self.assertEqual(len(self.buffer), 1)
+        self.assertIs(self.buffer.pending('u1', 'p1'), True)
+        self.assertIsNone(self.buffer.pending('u2', 'p1'))
+
+    def test_record_wakes_flusher_when_full(self):
+        """Test if the flusher is woken once the size threshold is reached"""
+        self.buffer.max_pending = 2
+        self.buffer.record('u1', 'p1', True)
+        self.assertFalse(self.buffer._wake.is_set())
+        self.buffer.record('u2', 'p1', True)
+        self.assertTrue(self.buffer._wake.is_set())
+
+    @mock.patch('models.Like.toggle_many')
+    def test_flush_groups_by_post(self, mock_toggle):
+        """Test if one write is made per post with its likes and unlikes"""
+        self.buffer.record('u1', 'p1', True)
+        self.buffer.record('u2', 'p1', False)
+        self.buffer.record('u1', 'p2', True)
+
+        self.assertEqual(self.buffer.flush(), 3)
+        mock_toggle.assert_any_call('p1', ['u1'], ['u2'])
+        mock_toggle.assert_any_call('p2', ['u1'], [])
+        self.assertEqual(mock_toggle.call_count, 2)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertIsNone(self.buffer.pending('u1', 'p1'))
+
+    @mock.patch('models.Like.toggle_many')
+    def test_flush_empty(self, mock_toggle):
+        """Test if flushing an empty buffer writes nothing"""
+        self.assertEqual(self.buffer.flush(), 0)
+        mock_toggle.assert_not_called()
+
+    @mock.patch('models.Like.toggle_many')
+    def test_flush_requeues_failed_post(self, mock_toggle):
+        """Test if toggles of a post that failed are kept for the next flush"""
+        mock_toggle.side_effect = Exception('deadlock')
+        self.buffer.record('u1', 'p1', True)
+
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertIs(self.buffer.pending('u1', 'p1'), True)
+
+    @mock.patch('utils.like_buffer.logger')
+    @mock.patch('models.Like.toggle_many')
+    def test_flush_drops_unwritable_post(self, mock_toggle, mock_logger):
+        """Test if toggles failing an integrity check, like those of a deleted
+        post, are dropped and logged at once"""
+        mock_toggle.side_effect = IntegrityError('INSERT', {}, Exception('foreign key'))
+        self.buffer.record('u1', 'p1', True)
+        self.buffer.record('u2', 'p1', False)
+
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(mock_logger.error.call_args.args[1:3], (2, 'p1'))
+
+    @mock.patch('utils.like_buffer.logger')
+    @mock.patch('models.Like.toggle_many')
+    def test_flush_retries_capped(self, mock_toggle, mock_logger):
+        """Test if a post failing every flush is dropped after max_retries"""
+        self.buffer.max_retries = 2
+        mock_toggle.side_effect = Exception('deadlock')
+        self.buffer.record('u1', 'p1', True)
+        for _ in range(3):
+            self.assertEqual(len(self.buffer), 1)
+            self.buffer.flush()
+        self.assertEqual(len(self.buffer), 0)
+        mock_logger.error.assert_called_once()
+        # A post writing again starts over
+        self.buffer.record('u1', 'p1', True)
+        self.buffer.flush()
+        mock_toggle.side_effect = None
+        self.buffer.flush()
+        self.assertEqual(self.buffer._failures, {})
+
+    @mock.patch('utils.like_buffer.logger')
+    @mock.patch('models.Like.toggle_many')
+    def test_flush_at_exit_logs_dropped(self, mock_toggle, mock_logger):
+        """Test if toggles that cannot be written on exit are counted in the log"""
+        mock_toggle.side_effect = Exception('gone away')
+        self.buffer.record('u1', 'p1', True)
+        self.buffer.record('u2', 'p2', False)
+
+        self.assertEqual(self.buffer.flush_at_exit(), 2)
+        mock_logger.error.assert_called_once_with('%s buffered likes dropped at exit', 2)
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_requeue_keeps_newer_toggle(self):
+        """Test if a toggle made during a failed flush is not overwritten"""
+        self.buffer.record('u1', 'p1', False)
+        self.buffer._requeue('p1', ['u1', 'u2'], [])
+        self.assertIs(self.buffer.pending('u1', 'p1'), False)
+        self.assertIs(self.buffer.pending('u2', 'p1'), True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import gzip
+import json
+import logging
+import os
+import tempfile
+import unittest
+from queue import SimpleQueue
+from unittest.mock import patch
+from utils.logger import (BatchFileHandler, BatchQueueListener, ErrorHandler, InfoHandler,
+                          JsonFormatter, LazyQueueHandler, SampleFilter)
+
+
+def make_record(msg, *args, level=logging.INFO, **extra):
+    record = logging.LogRecord('test', level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestBatchFileHandler(unittest.TestCase):
+    """Test the batched, rotating log files"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'info.log')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def read(self):
+        with open(self.path, encoding='utf-8') as f:
+            return f.read()
+
+    def test_batches_writes(self):
+        """Test if records only reach the file once a batch is full"""
+        handler = BatchFileHandler(self.path, batch_size=3)
+        handler.emit(make_record('one'))
+        handler.emit(make_record('two'))
+        self.assertEqual(self.read(), '')
+        handler.emit(make_record('three'))
+        self.assertEqual(self.read(), 'one\ntwo\nthree\n')
+        handler.close()
+
+    def test_rotation_compressed(self):
+        """Test if a full file is rotated and gzipped"""
+        handler = BatchFileHandler(self.path, max_bytes=10, backup_count=2)
+        handler.emit(make_record('first line'))
+        handler.emit(make_record('second'))
+        handler.close()
+        with gzip.open(self.path + '.1.gz', 'rt') as f:
+            self.assertEqual(f.read(), 'first line\n')
+        self.assertEqual(self.read(), 'second\n')
+
+    def test_no_rotation_when_shared(self):
+        """Test if a handler sharing its file never renames it"""
+        handler = BatchFileHandler(self.path, max_bytes=10, backup_count=2)
+        handler.rotating = False
+        handler.emit(make_record('first line'))
+        handler.emit(make_record('second'))
+        handler.close()
+        self.assertFalse(os.path.exists(self.path + '.1.gz'))
+        self.assertEqual(self.read(), 'first line\nsecond\n')
+
+    def test_copy_truncate(self):
+        """Test if a full file is copied and emptied in place, and a writer
+        appending to it carries on in the same file"""
+        writer = BatchFileHandler(self.path)
+        writer.emit(make_record('first line'))
+        writer.flush()
+        rotator = BatchFileHandler(self.path, max_bytes=10, backup_count=2)
+        inode = os.stat(self.path).st_ino
+        self.assertTrue(rotator.copy_truncate())
+        self.assertFalse(rotator.copy_truncate())
+        writer.emit(make_record('second'))
+        writer.close()
+        with gzip.open(self.path + '.1.gz', 'rt') as f:
+            self.assertEqual(f.read(), 'first line\n')
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+        self.assertEqual(self.read(), 'second\n')
+
+    def test_level_handlers(self):
+        """Test if info and error records go to their own files"""
+        info = InfoHandler(self.path)
+        error = ErrorHandler(os.path.join(self.dir.name, 'error.log'))
+        for handler in (info, error):
+            handler.emit(make_record('fine'))
+            handler.emit(make_record('broken', level=logging.ERROR))
+            handler.close()
+        self.assertEqual(self.read(), 'fine\n')
+        with open(os.path.join(self.dir.name, 'error.log')) as f:
+            self.assertEqual(f.read(), 'broken\n')
+
+
+class TestPipeline(unittest.TestCase):
+    """Test the queue between the views and the files"""
+
+    def test_prepare_merges_message(self):
+        """Test if only the message is formatted before queueing"""
+        handler = LazyQueueHandler(SimpleQueue())
+        record = handler.prepare(make_record('Post %s created', 'abc'))
+        self.assertEqual(record.msg, 'Post abc created')
+        self.assertIsNone(record.args)
+
+    def test_listener_flushes_when_drained(self):
+        """Test if the listener flushes its handlers once the queue is empty"""
+        queue = SimpleQueue()
+        handler = logging.Handler()
+        with patch.object(handler, 'flush') as mock_flush, \
+                patch.object(handler, 'handle'):
+            listener = BatchQueueListener(queue, handler)
+            queue.put(make_record('one'))
+            listener.handle(make_record('two'))
+            mock_flush.assert_not_called()
+            queue.get()
+            listener.handle(make_record('three'))
+            mock_flush.assert_called_once()
+
+    def test_json_formatter(self):
+        """Test if records are written as JSON lines"""
+        line = JsonFormatter().format(make_record('User %s logged in', 'u1'))
+        entry = json.loads(line)
+        self.assertEqual(entry['message'], 'User u1 logged in')
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertNotIn('exc', entry)
+
+    @patch('utils.logger.random.random')
+    def test_sample_filter(self, mock_random):
+        """Test if only sampled records are dropped"""
+        sample = SampleFilter(0.1)
+        mock_random.return_value = 0.5
+        self.assertFalse(sample.filter(make_record('Request received', sample=True)))
+        self.assertTrue(sample.filter(make_record('Post created')))
+        mock_random.return_value = 0.05
+        self.assertTrue(sample.filter(make_record('Request received', sample=True)))
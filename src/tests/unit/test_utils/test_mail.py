@@ -0,0 +1,77 @@
+import smtplib
+import time
+import unittest
+from unittest.mock import patch
+from flask import Flask
+from utils.mail import Mailer
+
+
+class TestMailer(unittest.TestCase):
+    """Test the mail queue against a stand-in SMTP class"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.update(CS_MAIL_HOST='localhost', CS_MAIL_PORT=8025,
+                               CS_MAIL_STARTTLS=False, CS_MAIL_SENDER='no-reply@example.com',
+                               CS_MAIL_WORKERS=1, CS_MAIL_RETRY_DELAY=0.01,
+                               CS_MAIL_MAX_RETRIES=2)
+        self.mailer = Mailer()
+        with patch('utils.mail.atexit.register'):
+            self.mailer.init_app(self.app)
+        self.patcher = patch('utils.mail.smtplib.SMTP')
+        self.smtp = self.patcher.start()
+        self.connection = self.smtp.return_value
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def sent_to(self):
+        return [call.args[0]['To'] for call in self.connection.send_message.call_args_list]
+
+    def test_disabled(self):
+        """Test that nothing is queued without a mail host"""
+        mailer = Mailer()
+        mailer.init_app(Flask(__name__))
+        self.assertFalse(mailer.send('a@example.com', 'Hi', 'Hello'))
+        self.assertEqual(len(mailer), 0)
+
+    def test_connection_reused(self):
+        """Test that queued emails share one connection"""
+        for index in range(3):
+            self.assertTrue(self.mailer.send(f'{index}@example.com', 'Hi', 'Hello'))
+        self.assertTrue(self.mailer.flush(2))
+        self.assertEqual(self.sent_to(), ['0@example.com', '1@example.com', '2@example.com'])
+        self.smtp.assert_called_once_with('localhost', 8025, timeout=10.0)
+        self.assertEqual(self.connection.send_message.call_args.args[0]['From'],
+                         'no-reply@example.com')
+        self.assertEqual(self.mailer.stats(), {'sent': 3, 'failed': 0, 'queued': 0})
+
+    def test_temporary_failure_retried(self):
+        """Test that 4xx replies and lost connections are tried again"""
+        self.connection.send_message.side_effect = [
+            smtplib.SMTPDataError(451, 'try later'), OSError('reset'), None]
+        self.mailer.send('a@example.com', 'Hi', 'Hello')
+        deadline = time.monotonic() + 2
+        while not self.mailer.sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.mailer.stats()['sent'], 1)
+        self.assertEqual(self.connection.send_message.call_count, 3)
+
+    def test_permanent_failure_dropped(self):
+        """Test that 5xx replies are not tried again"""
+        self.connection.send_message.side_effect = smtplib.SMTPDataError(550, 'no such user')
+        self.mailer.send('a@example.com', 'Hi', 'Hello')
+        self.mailer.flush(2)
+        self.assertEqual(self.mailer.stats(), {'sent': 0, 'failed': 1, 'queued': 0})
+        self.assertEqual(self.connection.send_message.call_count, 1)
+
+    def test_reconnect_after_disconnect(self):
+        """Test that a connection closed by the server is opened again"""
+        self.connection.send_message.side_effect = [None, smtplib.SMTPServerDisconnected, None]
+        self.mailer.send('a@example.com', 'Hi', 'Hello')
+        self.mailer.flush(2)
+        self.mailer.send('b@example.com', 'Hi', 'Hello')
+        self.mailer.flush(2)
+        self.assertEqual(self.sent_to(), ['a@example.com', 'b@example.com', 'b@example.com'])
+        self.assertEqual(self.smtp.call_count, 2)
+        self.assertEqual(self.mailer.stats()['sent'], 2)
@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from flask import Flask, g
+from utils.metrics import Metrics, _observe
+
+
+class TestMetrics(unittest.TestCase):
+    """Test the request metrics and their Prometheus rendering"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.add_url_rule('/posts', 'get_posts', lambda: 'ok')
+        self.metrics = Metrics()
+        self.metrics.init_app(self.app)
+
+    def request(self, status=200, queries=0, path='/posts'):
+        with self.app.test_request_context(path):
+            self.metrics.start_request()
+            g.db_queries = g.get('db_queries', 0) + queries
+            self.metrics.end_request(self.app.response_class(status=status))
+
+    def test_observe(self):
+        """Test if values land in the first bucket they fit in"""
+        table = {}
+        for value in (0.5, 1, 3):
+            _observe(table, 'key', (1, 2), value)
+        self.assertEqual(table['key'], [2, 0, 1, 4.5])
+
+    def test_request_recorded(self):
+        """Test if each request is counted by endpoint, method and status"""
+        self.request()
+        self.request(status=404, queries=3)
+        self.request(path='/missing')
+        self.assertEqual(self.metrics.in_flight, 0)
+        self.assertEqual(set(self.metrics.requests),
+                         {('get_posts', 'GET', 200), ('get_posts', 'GET', 404),
+                          ('unmatched', 'GET', 200)})
+        self.assertEqual(self.metrics.queries['get_posts'][-1], 3)
+
+    def test_render(self):
+        """Test if the metrics are written in the Prometheus text format"""
+        self.request(queries=2)
+        text = self.metrics.render()
+        self.assertIn('# TYPE caseshare_request_duration_seconds histogram', text)
+        self.assertIn('caseshare_request_duration_seconds_bucket{endpoint="get_posts",'
+                      'method="GET",status="200",le="+Inf"} 1', text)
+        self.assertIn('caseshare_request_db_queries_bucket{endpoint="get_posts",le="1"} 0',
+                      text)
+        self.assertIn('caseshare_request_db_queries_bucket{endpoint="get_posts",le="2"} 1',
+                      text)
+        self.assertIn('caseshare_requests_in_flight 0', text)
+        self.assertIn('caseshare_cache_hit_ratio{cache="identity"}', text)
+
+    def test_disabled(self):
+        """Test if nothing is recorded when turned off"""
+        self.metrics.enabled = False
+        self.request()
+        self.assertEqual(self.metrics.requests, {})
+
+    def test_workers_added_up(self):
+        """Test if the snapshots of every worker are merged"""
+        with tempfile.TemporaryDirectory() as directory:
+            self.app.config['CS_METRICS_DIR'] = directory
+            self.metrics.init_app(self.app)
+            self.request()
+            other = self.metrics.snapshot()
+            other['in_flight'] = 2
+            with open(os.path.join(directory, '1-1.json'), 'w') as f:
+                json.dump(other, f)
+            text = self.metrics.render()
+            self.assertIn('caseshare_requests_in_flight 2', text)
+            self.assertIn('caseshare_request_duration_seconds_count{endpoint="get_posts",'
+                          'method="GET",status="200"} 2', text)
+            self.metrics.mark_process_dead(1)
+            self.assertNotIn('1-1.json', os.listdir(directory))
+            text = self.metrics.render()
+            self.assertIn('caseshare_requests_in_flight 0', text)
+            self.assertIn('caseshare_request_duration_seconds_count{endpoint="get_posts",'
+                          'method="GET",status="200"} 2', text)
+
+    def test_exited_workers_kept(self):
+        """Test if the counters of every exited worker add up, a new worker
+        reusing a pid overwriting none of them"""
+        with tempfile.TemporaryDirectory() as directory:
+            self.app.config['CS_METRICS_DIR'] = directory
+            self.metrics.init_app(self.app)
+            self.request()
+            snapshot = self.metrics.snapshot()
+            for name in ('1-1.json', '2-1.json', '1-2.json'):
+                with open(os.path.join(directory, name), 'w') as f:
+                    json.dump(snapshot, f)
+                self.metrics.mark_process_dead(int(name.split('-')[0]))
+            self.assertCountEqual(os.listdir(directory),
+                                  ['exited.json', os.path.basename(self.metrics._path)])
+            self.assertIn('caseshare_request_duration_seconds_count{endpoint="get_posts",'
+                          'method="GET",status="200"} 4', self.metrics.render())
+
+    def test_streamed_recorded_on_close(self):
+        """Test if a streamed response is timed until its body is sent"""
+        def body():
+            yield 'a'
+            time.sleep(0.05)
+            yield 'b'
+        self.app.add_url_rule('/stream', 'stream', lambda: self.app.response_class(body()))
+        self.app.before_request(self.metrics.start_request)
+        self.app.after_request(lambda response: self.metrics.end_request(response) or response)
+        response = self.app.test_client().get('/stream')
+        self.assertEqual(self.metrics.requests, {})
+        self.assertEqual(response.get_data(), b'ab')
+        response.close()
+        self.assertGreaterEqual(self.metrics.requests[('stream', 'GET', 200)][-1], 0.05)
+        self.assertEqual(self.metrics.in_flight, 0)
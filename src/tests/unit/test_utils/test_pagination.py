@@ -0,0 +1,50 @@
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+from models import Post
+from utils.pagination import encode_cursor, decode_cursor, keyset_paginate
+
+
+class TestPagination(unittest.TestCase):
+    """Test keyset pagination helpers"""
+
+    def test_cursor_round_trip(self):
+        """Test if a cursor decodes back to the key it was made from"""
+        create_at = datetime(2023, 5, 19, 10, 30, 1, 123456)
+        cursor = encode_cursor(create_at, 'ax2736')
+        self.assertIsInstance(cursor, str)
+        self.assertEqual(decode_cursor(cursor), (create_at, 'ax2736'))
+
+    def test_decode_invalid_cursor(self):
+        """Test if a tampered cursor raises ValueError"""
+        for cursor in ['not a cursor', 'e30', '']:
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_keyset_paginate_last_page(self):
+        """Test if no next cursor is returned when fewer rows than the limit exist"""
+        query = MagicMock()
+        mock_all = query.order_by.return_value.limit.return_value.all
+        mock_all.return_value = [MagicMock()]
+
+        rows, next_cursor = keyset_paginate(query, Post, None, 20)
+        self.assertEqual(len(rows), 1)
+        self.assertIsNone(next_cursor)
+        query.order_by.return_value.limit.assert_called_once_with(21)
+
+    def test_keyset_paginate_next_page(self):
+        """Test if the extra row is dropped and turned into the next cursor"""
+        query = MagicMock()
+        cursor = encode_cursor(datetime(2023, 5, 20), 'b')
+        rows = [MagicMock(create_at=datetime(2023, 5, 19), id=str(i)) for i in range(3)]
+        mock_filter = query.order_by.return_value.filter
+        mock_filter.return_value.limit.return_value.all.return_value = rows
+
+        page, next_cursor = keyset_paginate(query, Post, cursor, 2)
+        self.assertEqual(page, rows[:2])
+        self.assertEqual(decode_cursor(next_cursor), (datetime(2023, 5, 19), '1'))
+        mock_filter.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import tempfile
+import threading
+import unittest
+from flask import Flask
+from werkzeug.security import check_password_hash, generate_password_hash
+from utils.passwords import PasswordHasher, PasswordsBusy
+
+
+class TestPasswordHasher(unittest.TestCase):
+    """Test hashing passwords inline and in host-wide slots"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config.update(CS_PASSWORD_WORKERS=1, CS_PASSWORD_ITERATIONS=1000,
+                               CS_PASSWORD_QUEUE_TIMEOUT=0.05,
+                               CS_PASSWORD_SLOTS_DIR=self.directory.name)
+        self.hasher = PasswordHasher()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_inline_before_init(self):
+        """Test that hashes are made without slots until init_app"""
+        pwhash = self.hasher.hash('secret')
+        self.assertTrue(pwhash.startswith('pbkdf2:sha256:600000$'))
+        self.assertTrue(self.hasher.check(pwhash, 'secret'))
+
+    def test_slots(self):
+        """Test that hashes use the configured iterations, freeing their slot"""
+        self.hasher.init_app(self.app)
+        pwhash = self.hasher.hash('secret')
+        self.assertTrue(pwhash.startswith('pbkdf2:sha256:1000$'))
+        self.assertTrue(check_password_hash(pwhash, 'secret'))
+        self.assertTrue(self.hasher.check(pwhash, 'secret'))
+        self.assertFalse(self.hasher.check(pwhash, 'Secret'))
+
+    def test_busy(self):
+        """Test that a hash finding every slot taken gives up, then gets
+        the slot once it is released"""
+        self.hasher.init_app(self.app)
+        slot = self.hasher._acquire()
+        with self.assertRaises(PasswordsBusy):
+            self.hasher.hash('secret')
+        # Threads of one process wait for each other too
+        errors = []
+
+        def hash_in_thread():
+            try:
+                self.hasher.hash('secret')
+            except PasswordsBusy as e:
+                errors.append(e)
+        thread = threading.Thread(target=hash_in_thread)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(errors), 1)
+        slot.close()
+        self.assertTrue(self.hasher.hash('secret'))
+
+    def test_needs_rehash(self):
+        """Test that hashes with other parameters are spotted"""
+        self.hasher.init_app(self.app)
+        self.assertTrue(self.hasher.needs_rehash(generate_password_hash('secret')))
+        self.assertFalse(self.hasher.needs_rehash(
+            generate_password_hash('secret', 'pbkdf2:sha256:1000')))
@@ -0,0 +1,106 @@
+import unittest
+from unittest import mock
+from unittest.mock import MagicMock
+from utils import purge
+
+
+class TestPurge(unittest.TestCase):
+    """Test the background purge of deleted accounts"""
+
+    @mock.patch('utils.database.db.session')
+    def test_count_owned_rows(self, mock_session):
+        """Test if rows are counted across every owned table"""
+        mock_session.scalar.return_value = 3
+        self.assertEqual(purge.count_owned_rows('6607'), 3 * 7)
+
+    @mock.patch('utils.database.db.session')
+    def test_count_owned_rows_capped(self, mock_session):
+        """Test if counting stops at the first table taking it over the limit,
+        each table read no further than needed"""
+        mock_session.scalar.side_effect = [3, 5]
+        self.assertEqual(purge.count_owned_rows('6607', 7), 8)
+        self.assertEqual(mock_session.scalar.call_count, 2)
+        limit = mock_session.scalar.call_args.args[0].get_final_froms()[0].element._limit
+        self.assertEqual(limit, 5)
+
+    @mock.patch('utils.database.db.session')
+    def test_delete_account_uncounts_other_posts(self, mock_session):
+        """Test if likes and comments on other users' posts are uncounted
+        before the cascading delete, in the same transaction"""
+        user = MagicMock(id='6607')
+        mock_session.execute.return_value.all.side_effect = [[('p1', 2)], [('p2', 1)]]
+        with mock.patch('models.Post.bump_counters') as mock_bump:
+            self.assertTrue(purge.delete_account(user))
+        mock_bump.assert_any_call(mock_session, 'p1', likes=-2)
+        mock_bump.assert_any_call(mock_session, 'p2', comments=-1)
+        user.delete.assert_called_once()
+        mock_session.rollback.assert_not_called()
+
+    @mock.patch('utils.database.db.session')
+    def test_delete_account_failure(self, mock_session):
+        """Test if the uncounting is rolled back when the delete fails"""
+        user = MagicMock(id='6607')
+        user.delete.return_value = False
+        mock_session.execute.return_value.all.return_value = [('p1', 1)]
+        with mock.patch('models.Post.bump_counters'):
+            self.assertFalse(purge.delete_account(user))
+        mock_session.rollback.assert_called_once()
+
+    @mock.patch('utils.purge._start_worker')
+    @mock.patch('utils.database.db.session')
+    def test_schedule_purge(self, mock_session, mock_start):
+        """Test if the user is marked deleted and a job is queued"""
+        user = MagicMock(id='6607', deleted_at=None)
+        job = purge.schedule_purge(MagicMock(), user, 5000)
+
+        self.assertIsNotNone(user.deleted_at)
+        self.assertEqual(job.user_id, '6607')
+        self.assertEqual(job.total, 5000)
+        self.assertEqual(job.status, 'pending')
+        mock_session.commit.assert_called_once()
+        mock_start.assert_called_once()
+        self.assertEqual(purge.pending_purges(), 1)
+        purge._jobs.get_nowait()
+
+    @mock.patch('utils.database.db.session')
+    def test_purge_user_deletes_in_batches(self, mock_session):
+        """Test if rows are deleted in batches, each in its own transaction"""
+        job = MagicMock(purged=0)
+        mock_session.get.return_value = job
+        mock_session.execute.return_value.rowcount = 1
+        mock_session.scalar.return_value = 1
+        # Two batches for the first table, then nothing left anywhere
+        mock_session.scalars.return_value.all.side_effect = [['a', 'b'], ['c']] + [[]] * 7
+
+        self.assertTrue(purge.purge_user('6607', 'job1', 2))
+        self.assertEqual(job.purged, 3)
+        self.assertEqual(job.total, 7)
+        self.assertEqual(job.status, 'done')
+        # The claim, 2 batches of likes, each uncounted from its posts then
+        # deleted, + the user row
+        self.assertEqual(mock_session.execute.call_count, 6)
+
+    @mock.patch('utils.database.db.session')
+    def test_purge_user_claimed_elsewhere(self, mock_session):
+        """Test if a job another process claimed first is left alone"""
+        mock_session.execute.return_value.rowcount = 0
+        self.assertFalse(purge.purge_user('6607', 'job1', 2))
+        mock_session.get.assert_not_called()
+        mock_session.scalars.assert_not_called()
+
+    @mock.patch('utils.database.db.session')
+    def test_purge_user_failure(self, mock_session):
+        """Test if a failing purge is recorded as failed"""
+        job = MagicMock(purged=0)
+        mock_session.get.return_value = job
+        mock_session.execute.return_value.rowcount = 1
+        mock_session.scalar.return_value = 1
+        mock_session.scalars.side_effect = Exception('lost connection')
+
+        purge.purge_user('6607', 'job1', 2)
+        self.assertEqual(job.status, 'failed')
+        mock_session.rollback.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from unittest.mock import patch
+from flask import Flask, g
+from utils.database import db
+from utils.queries import (QueryBudgetExceeded, check_queries, fingerprint, query_budget,
+                           track_queries)
+from utils.streaming import stream_json_array
+
+
+class TestFingerprint(unittest.TestCase):
+    """Test the shapes statements are grouped by"""
+
+    def test_values_replaced(self):
+        """Test if statements differing only in values share a fingerprint"""
+        self.assertEqual(fingerprint("SELECT * FROM posts WHERE id = 'a1' LIMIT 20"),
+                         fingerprint('SELECT *  FROM posts\nWHERE id = %s LIMIT 5'))
+
+    def test_in_lists_collapsed(self):
+        """Test if IN lists of any length share a fingerprint"""
+        self.assertEqual(fingerprint('SELECT * FROM users WHERE id IN (%s, %s, %s)'),
+                         'SELECT * FROM users WHERE id IN (?)')
+        self.assertEqual(fingerprint('SELECT * FROM users WHERE id IN (?)'),
+                         'SELECT * FROM users WHERE id IN (?)')
+
+
+class TestQueryTracking(unittest.TestCase):
+    """Test the per request statement counts, N+1 flags and budgets"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', CS_ENV='test',
+                               CS_N_PLUS_ONE_THRESHOLD=3)
+        db.init_app(self.app)
+        self.app.add_url_rule('/posts', 'get_posts', query_budget(2)(lambda: 'ok'))
+        self.app.add_url_rule('/users', 'get_users', lambda: 'ok')
+        streamed = query_budget(2)(lambda: stream_json_array(self.lazy_rows(3), serialize=str))
+        self.app.add_url_rule('/comments', 'get_comments', streamed)
+        self.app.before_request(track_queries)
+        self.app.after_request(check_queries)
+
+    @staticmethod
+    def lazy_rows(count):
+        """Yield rows each running a statement, like lazy loads while streaming"""
+        for i in range(count):
+            db.session.execute(db.text(f'SELECT {i}'))
+            yield i
+
+    def run_request(self, path, statements):
+        with self.app.test_request_context(path):
+            track_queries()
+            for statement in statements:
+                db.session.execute(db.text(statement))
+            return check_queries(self.app.response_class())
+
+    def test_statements_counted(self):
+        """Test if the statements of the request are counted by shape"""
+        with self.app.test_request_context('/users'):
+            track_queries()
+            db.session.execute(db.text('SELECT 1'))
+            db.session.execute(db.text('SELECT 2'))
+            self.assertEqual(g.db_queries, 2)
+            self.assertEqual(g.query_shapes, {'SELECT ?': 2})
+            self.assertGreater(g.db_seconds, 0)
+
+    def test_query_count_header(self):
+        """Test if the count is sent back in test and dev only"""
+        response = self.run_request('/users', ['SELECT 1'])
+        self.assertEqual(response.headers['X-Query-Count'], '1')
+        self.app.config['CS_ENV'] = 'production'
+        self.assertNotIn('X-Query-Count', self.run_request('/users', ['SELECT 1']).headers)
+
+    @patch('utils.queries.logger')
+    def test_n_plus_one_flagged(self, mock_logger):
+        """Test if repeated statements of one shape are logged"""
+        self.run_request('/users', ['SELECT 1', 'SELECT 2'])
+        mock_logger.warning.assert_not_called()
+        self.run_request('/users', ['SELECT 1', 'SELECT 2', 'SELECT 3'])
+        mock_logger.warning.assert_called_once()
+        self.assertEqual(mock_logger.warning.call_args.args[2], 3)
+
+    def test_budget_fails_tests(self):
+        """Test if exceeding the budget raises in test mode"""
+        self.run_request('/posts', ['SELECT 1', 'SELECT 2'])
+        with self.assertRaises(QueryBudgetExceeded):
+            self.run_request('/posts', ['SELECT 1', 'SELECT 2', 'SELECT 3'])
+
+    @patch('utils.queries.logger')
+    def test_budget_logged_elsewhere(self, mock_logger):
+        """Test if exceeding the budget is only logged outside test mode"""
+        self.app.config['CS_ENV'] = 'production'
+        self.run_request('/posts', ['SELECT 1', 'SELECT 2', 'SELECT 3 + 1'])
+        mock_logger.warning.assert_called_once()
+
+    def test_streamed_body_counted(self):
+        """Test if the statements of a streamed body count in test mode"""
+        self.app.testing = True
+        with self.assertRaises(QueryBudgetExceeded):
+            self.app.test_client().get('/comments')
+
+    @patch('utils.queries.logger')
+    def test_streamed_body_checked_on_close(self, mock_logger):
+        """Test if a streamed body is checked once the response closes"""
+        self.app.config['CS_ENV'] = 'production'
+        response = self.app.test_client().get('/comments')
+        self.assertEqual(response.get_data(), b'["0","1","2"]\n')
+        mock_logger.warning.assert_not_called()
+        response.close()
+        self.assertEqual(mock_logger.warning.call_count, 2)
+        self.assertIn('ran 3 statements', mock_logger.warning.call_args.args[0])
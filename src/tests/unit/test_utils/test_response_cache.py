@@ -0,0 +1,175 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from flask import Flask, g, jsonify
+from models import Comment, Like, Post, User
+from utils.auth import Principal
+from utils.response_cache import ResponseCache, _collect_cascaded, response_cache
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test the tag-invalidated cache of GET responses"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['CS_RESPONSE_CACHE'] = 'memory'
+        self.cache = ResponseCache()
+        self.cache.init_app(self.app)
+        self.calls = 0
+
+    def view(self, status=200):
+        self.calls += 1
+        response = jsonify({'calls': self.calls})
+        response.set_etag(f'v{self.calls}')
+        return response, status
+
+    def get(self, path='/posts/1', tags=('post:1',), headers=None, **kwargs):
+        cached = self.cache.cached(lambda: list(tags), **kwargs)(self.view)
+        with self.app.test_request_context(path, headers=headers or {}):
+            return cached()
+
+    def test_miss_then_hit(self):
+        """Test if the second request is replayed without calling the view"""
+        first = self.get()
+        second = self.get()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(second.get_json(), {'calls': 1})
+        self.assertEqual(second.headers['ETag'], first.headers['ETag'])
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_primary_after_change(self):
+        """Test if with replicas only entries whose tags changed within the lag
+        window are filled from the primary"""
+        self.app.config.update(CS_REPLICA_URIS=['sqlite://'], CS_REPLICA_STICKY_SECONDS=5)
+        self.cache.init_app(self.app)
+        on_primary = []
+        view = self.view
+
+        def recording_view():
+            on_primary.append(bool(g.get('db_primary')))
+            return view()
+        self.view = recording_view
+        self.get()
+        self.cache.invalidate('post:1')
+        self.get()
+        self.get(path='/posts/2', tags=('post:2',))
+        self.assertEqual(on_primary, [False, True, False])
+        with patch('utils.response_cache.time.monotonic', return_value=1e12):
+            self.assertFalse(self.cache.tags.changed(['post:1']))
+
+    def test_query_string_is_part_of_key(self):
+        """Test if another page is not served from the cache"""
+        self.get('/posts?offset=0')
+        self.get('/posts?offset=1')
+        self.assertEqual(self.calls, 2)
+
+    def test_invalidate_tag(self):
+        """Test if bumping any tag of an entry drops it"""
+        self.get(tags=('post:1', 'posts:list'))
+        self.cache.invalidate('posts:list')
+        self.assertEqual(self.get(tags=('post:1', 'posts:list')).headers['X-Cache'], 'MISS')
+        self.cache.invalidate('post:2')
+        self.get(tags=('post:1', 'posts:list'))
+        self.assertEqual(self.calls, 2)
+
+    def test_write_during_view(self):
+        """Test if a write committed while the view runs makes the entry stale"""
+        view = self.view
+
+        def racing_view():
+            self.cache.invalidate('post:1')
+            return view()
+        self.view = racing_view
+        self.get()
+        self.view = view
+        self.get()
+        self.assertEqual(self.calls, 2)
+
+    def test_errors_not_stored(self):
+        """Test if only 200 responses are cached"""
+        view = self.view
+        self.view = lambda: view(404)
+        self.get()
+        self.get()
+        self.assertEqual(self.calls, 2)
+
+    def test_replay_conditional(self):
+        """Test if a hit answers 304 when the client holds the version"""
+        etag = self.get().headers['ETag']
+        response = self.get(headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+
+    @patch('utils.auth.current_principal')
+    def test_vary_on_user(self, mock_principal):
+        """Test if responses depending on the user are kept apart"""
+        mock_principal.return_value = Principal(id='1', email='a@b.c')
+        self.get(vary_on_user=True)
+        mock_principal.return_value = Principal(id='2', email='d@e.f')
+        self.get(vary_on_user=True)
+        self.get(vary_on_user=True)
+        self.assertEqual(self.calls, 2)
+        mock_principal.return_value = None
+        self.get(vary_on_user=True)
+        self.get(vary_on_user=True)
+        self.assertEqual(self.calls, 4)
+
+    def test_disabled(self):
+        """Test if every request reaches the view unless configured"""
+        self.cache.init_app(Flask(__name__))
+        self.get()
+        response, status = self.get()
+        self.assertEqual(self.calls, 2)
+        self.assertNotIn('X-Cache', response.headers)
+        self.cache.invalidate('post:1')
+
+    def test_backend_errors(self):
+        """Test if a failing tag store falls back to the view"""
+        self.cache.tags = MagicMock()
+        self.cache.tags.versions.side_effect = ConnectionError
+        self.cache.tags.bump.side_effect = ConnectionError
+        response, status = self.get()
+        self.assertEqual(response.get_json(), {'calls': 1})
+        self.cache.invalidate('post:1')
+
+    def test_invalidate_on_commit(self):
+        """Test if tags are collected on the session until commit"""
+        session = MagicMock(info={})
+        self.cache.invalidate_on_commit(session, 'post:1', 'posts:list')
+        self.assertEqual(session.info['response_invalidations'], {'post:1', 'posts:list'})
+
+
+class TestCacheTags(unittest.TestCase):
+    """Test the tags invalidated by writes to each model"""
+
+    def test_post(self):
+        post = Post(id='p', user_id='u')
+        self.assertEqual(post._cache_tags(), ['post:p', 'user:u:posts', 'posts:list'])
+
+    def test_comment(self):
+        comment = Comment(id='c', post_id='p')
+        self.assertEqual(set(comment._cache_tags()),
+                         {'comment:c', 'post:p:comments', 'comments:list',
+                          'post:p', 'posts:list'})
+
+    def test_user(self):
+        self.assertEqual(User(id='u')._cache_tags(), ['user:u', 'users:list'])
+
+    def test_like(self):
+        self.assertEqual(Like(post_id='p')._cache_tags(), ['post:p', 'posts:list'])
+
+    def test_cascaded(self):
+        """Test if the rows deleted by ON DELETE CASCADE are tagged before the flush"""
+        session = MagicMock(info={}, deleted=[Post(id='p', user_id='u')])
+        session.execute.return_value.mappings.return_value = [
+            {'id': 'c1', 'post_id': 'p'}, {'id': 'c2', 'post_id': 'p'}]
+        with patch.object(response_cache, 'entries', MagicMock()):
+            _collect_cascaded(session, None, None)
+        self.assertTrue({'comment:c1', 'comment:c2', 'post:p:comments'}
+                        <= session.info['response_invalidations'])
+
+    def test_user_cascades(self):
+        """Test if a user's posts, comments and likes are looked up on delete"""
+        models = [model for model, criterion in User(id='u')._cascaded()]
+        self.assertEqual(models, [Post, Comment, Like])
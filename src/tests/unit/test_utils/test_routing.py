@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from flask import Flask, g
+from models import Post
+from utils.routing import ReplicaRouter, _stick_writer, primary
+
+
+class TestReplicaRouter(unittest.TestCase):
+    """Test which engine the statements of a request go to"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['CS_REPLICA_URIS'] = ['sqlite:///replica.db']
+        self.router = ReplicaRouter()
+        self.router.init_app(self.app)
+        self.session = MagicMock(_flushing=False)
+        self.session._db.engines = {'replica0': 'replica engine'}
+        self.select = Post.__table__.select()
+
+    def bind(self, method='GET', clause=None, email='a@b.c'):
+        with self.app.test_request_context('/posts', method=method):
+            g.email = email
+            return self.router.get_bind(self.session, self.select if clause is None else clause)
+
+    def test_binds_added(self):
+        """Test if every replica becomes a bind"""
+        self.assertEqual(self.app.config['SQLALCHEMY_BINDS'],
+                         {'replica0': 'sqlite:///replica.db'})
+
+    def test_reads_of_gets_to_replica(self):
+        """Test if GET requests read from a replica"""
+        self.assertEqual(self.bind(), 'replica engine')
+        self.assertEqual(self.router.stats(), {'replica,replica0': 1})
+
+    def test_writes_to_primary(self):
+        """Test if flushes, DML and other methods use the primary"""
+        self.assertIsNone(self.bind(clause=Post.__table__.insert()))
+        self.assertIsNone(self.bind(method='POST'))
+        self.session._flushing = True
+        self.assertIsNone(self.bind())
+        self.assertEqual(self.router.stats(), {'primary,write': 2, 'primary,method': 1})
+
+    def test_sticky_after_write(self):
+        """Test if a user who wrote reads from the primary for a while"""
+        with self.app.test_request_context('/users/me', method='PUT'), \
+                patch('utils.routing.router', self.router):
+            g.email = 'a@b.c'
+            _stick_writer(MagicMock(info={'wrote': True}))
+        self.assertIsNone(self.bind())
+        self.assertEqual(self.bind(email='d@e.f'), 'replica engine')
+        self.router.writers.clear()
+        self.assertEqual(self.bind(), 'replica engine')
+
+    def test_primary_block(self):
+        """Test if reads filling a cache use the primary"""
+        with self.app.test_request_context('/posts'):
+            with primary():
+                self.assertIsNone(self.router.get_bind(self.session, self.select))
+            self.assertEqual(self.router.get_bind(self.session, self.select), 'replica engine')
+
+    def test_disabled(self):
+        """Test if nothing is routed without replicas"""
+        self.router.init_app(Flask(__name__))
+        self.assertFalse(self.router.enabled)
+        self.assertIsNone(self.bind())
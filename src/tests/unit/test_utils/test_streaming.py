@@ -0,0 +1,59 @@
+import json
+import unittest
+from unittest.mock import MagicMock
+from flask import Flask
+from utils.json_provider import json_provider_class
+from utils.streaming import stream_json_array
+
+
+class TestStreamJsonArray(unittest.TestCase):
+    """Test the streaming of JSON arrays"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.json = json_provider_class('auto')(self.app)
+        self.request_context = self.app.test_request_context()
+        self.request_context.push()
+
+    def tearDown(self):
+        self.request_context.pop()
+
+    def rows(self, count):
+        rows = []
+        for i in range(count):
+            row = MagicMock()
+            row.to_dict.return_value = {'id': str(i), 'title': f'Case {i}'}
+            rows.append(row)
+        return rows
+
+    def test_streams_rows_as_array(self):
+        """Test if the chunks join into the array jsonify would have sent"""
+        response = stream_json_array(self.rows(3), 'posts')
+        self.assertTrue(response.is_streamed)
+        chunks = list(response.response)
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads(''.join(chunks)),
+                         [{'id': '0', 'title': 'Case 0'}, {'id': '1', 'title': 'Case 1'},
+                          {'id': '2', 'title': 'Case 2'}])
+        self.assertEqual(response.mimetype, 'application/json')
+
+    def test_streams_empty_array(self):
+        """Test if no rows give an empty array"""
+        response = stream_json_array([], 'posts')
+        self.assertEqual(json.loads(''.join(response.response)), [])
+
+    def test_query_runs_before_streaming(self):
+        """Test if a failing query raises in the view, not mid-response"""
+        query = MagicMock()
+        query.__iter__.side_effect = Exception('gone away')
+        with self.assertRaises(Exception):
+            stream_json_array(query, 'posts')
+
+    def test_custom_serializer(self):
+        """Test if rows go through the serializer given"""
+        response = stream_json_array([1, 2], serialize=lambda row: {'n': row})
+        self.assertEqual(json.loads(''.join(response.response)), [{'n': 1}, {'n': 2}])
+
+
+if __name__ == '__main__':
+    unittest.main()
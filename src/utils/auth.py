@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+"""This module resolves the user behind the token of the current request.
+token_required stores the token and its email on flask.g. The first call to
+current_principal() in a request resolves them to a Principal, which is kept
+in a bounded LRU+TTL cache keyed by token so later requests with the same
+token skip the users lookup altogether. Entries never outlive the token's
+`exp`, and are dropped as soon as the user is saved, updated or deleted.
+The cache and its invalidation are per process: with several workers, the
+others keep resolving a deleted user, or one whose password changed, until
+their entries expire. CS_PRINCIPAL_CACHE_TTL is kept to seconds for that
+reason, which still spares the lookup to a user's bursts of requests."""
+import time
+from typing import NamedTuple
+from flask import g
+from models.base_model import on_write
+from models.user import User
+from utils.cache import LRUCache
+from utils.config import Config
+
+
+class Principal(NamedTuple):
+    """The authenticated user, as much of it as most views need"""
+    id: str
+    email: str
+
+
+class PrincipalCache(LRUCache):
+    """LRU+TTL cache of principals by token, indexed by user id so every token
+    of a user can be invalidated at once"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize, ttl)
+        self._tokens = {}
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            super().set(key, value, ttl)
+            if key in self._data:
+                self._tokens.setdefault(value.id, set()).add(key)
+
+    def invalidate_user(self, user_id: str):
+        """Forget every token resolved to this user"""
+        with self._lock:
+            for token in list(self._tokens.get(user_id, ())):
+                self.delete(token)
+            self._tokens.pop(user_id, None)
+
+    def _evicted(self, key, value):
+        tokens = self._tokens.get(value.id)
+        if tokens is not None:
+            tokens.discard(key)
+            if not tokens:
+                del self._tokens[value.id]
+
+
+principal_cache = PrincipalCache(maxsize=Config.CS_PRINCIPAL_CACHE_SIZE,
+                                 ttl=Config.CS_PRINCIPAL_CACHE_TTL)
+
+
+def current_principal():
+    """Return the Principal of the current request, or None if the token's
+    user does not exist. Costs at most one query per token and TTL"""
+    if 'principal' in g:
+        return g.principal
+    token = g.get('token')
+    principal = principal_cache.get(token) if token else None
+    if principal is None:
+        user = User.get_user_by_email(g.email)
+        # Keep the row around, views needing the whole user reuse it
+        g.user = user
+        if user is not None:
+            principal = Principal(id=user.id, email=user.email)
+            if token:
+                ttl = Config.CS_PRINCIPAL_CACHE_TTL
+                if g.get('token_exp'):
+                    ttl = min(ttl, g.token_exp - time.time())
+                principal_cache.set(token, principal, ttl)
+    g.principal = principal
+    return principal
+
+
+def current_user():
+    """Return the User row of the current request, or None if it does not exist"""
+    if 'user' not in g:
+        principal = current_principal()
+        if 'user' not in g:
+            g.user = User.get(principal.id) if principal else None
+    return g.user
+
+
+@on_write
+def _invalidate_principal(instance, action):
+    """Drop the cached principals of a user as soon as the user changes"""
+    if isinstance(instance, User):
+        principal_cache.invalidate_user(instance._identity())
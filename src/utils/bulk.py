@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+"""This module imports and exports posts and comments as NDJSON, one object
+per line, for POST /admin/import, GET /admin/export and the flask commands.
+A line looks like
+    {"type": "post", "id": "...", "email": "dr@example.com", "title": "...",
+     "content": "...", "create_at": "2023-11-05T14:03:09.000120"}
+    {"type": "comment", "post_id": "...", "user_id": "...", "content": "..."}
+where id and create_at are optional, and the author is given by user_id or
+email. Comments must come after their post. Lines are read CS_IMPORT_CHUNK_SIZE
+at a time: each chunk is checked with a few IN queries, written with
+multi-row INSERTs and committed, so memory stays bounded whatever the size of
+the archive. A line that cannot be imported is reported with its number and
+skipped. Exports stream rows from a server-side cursor in the same format,
+so an export can be imported elsewhere; likes are not exported."""
+import json
+import uuid
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from models import Comment, Post, User
+from models.base_model import format_datetime
+from utils.cache import identity_cache
+from utils.database import db
+from utils.logger import logger
+from utils.response_cache import response_cache
+
+# Longest line read, and errors listed in a report, the rest are only counted
+MAX_LINE = 64 * 1024
+MAX_ERRORS = 1000
+# Models by the type of a line, and the columns imported for each
+TYPES = {'post': Post, 'comment': Comment}
+COLUMNS = {Post: ('title', 'content'), Comment: ('post_id', 'content')}
+EXPORTS = {'posts': Post, 'comments': Comment}
+
+
+class ImportReport:
+    """Counts the rows imported and the lines that failed"""
+
+    def __init__(self):
+        self.imported = {'posts': 0, 'comments': 0}
+        self.errors = []
+        self.failed = 0
+
+    def error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self) -> dict:
+        return {'imported': self.imported, 'failed': self.failed,
+                'errors': sorted(self.errors, key=lambda error: error['line'])}
+
+
+def read_lines(stream, max_length: int = MAX_LINE):
+    """Yield the lines of a binary stream, cut at max_length so one huge line
+    cannot exhaust memory; parse_line rejects what was cut"""
+    while True:
+        line = stream.readline(max_length)
+        if not line:
+            return
+        yield line
+        while not line.endswith(b'\n') and len(line) == max_length:
+            # Skip the rest of the line
+            line = stream.readline(max_length)
+
+
+def parse_line(line) -> tuple:
+    """Return the model and column values of an NDJSON line.
+    Raise ValueError with a message for the report if the line is invalid"""
+    if isinstance(line, bytes):
+        if len(line) >= MAX_LINE and not line.endswith(b'\n'):
+            raise ValueError('line too long')
+        line = line.decode('utf-8')
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError('expected an object')
+    kind = data.get('type', 'post')
+    model = TYPES.get(kind) if isinstance(kind, str) else None
+    if model is None:
+        raise ValueError(f'unknown type {kind}')
+    row = {}
+    for name in COLUMNS[model] + ('id', 'user_id', 'email'):
+        value = data.get(name)
+        if value is None:
+            continue
+        column = model.__table__.c.get(name)
+        length = getattr(column.type, 'length', None) if column is not None else None
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f'{name} must be a non empty string')
+        if length and len(value) > length:
+            raise ValueError(f'{name} longer than {length} characters')
+        row[name] = value
+    missing = [name for name in COLUMNS[model] if name not in row]
+    if 'user_id' not in row and 'email' not in row:
+        missing.append('user_id or email')
+    if missing:
+        raise ValueError(f'missing {", ".join(missing)}')
+    create_at = data.get('create_at')
+    if create_at is not None and not isinstance(create_at, str):
+        raise ValueError('create_at must be an ISO 8601 string')
+    now = datetime.utcnow()
+    row['create_at'] = datetime.fromisoformat(create_at) if create_at else now
+    row['update_at'] = now
+    row.setdefault('id', str(uuid.uuid4()))
+    return model, row
+
+
+def import_ndjson(lines, chunk_size: int = 1000) -> dict:
+    """Import posts and comments from NDJSON lines, return the report"""
+    report, chunk = ImportReport(), []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            chunk.append((number,) + parse_line(line))
+        except (ValueError, TypeError, UnicodeDecodeError) as e:
+            report.error(number, str(e))
+        if len(chunk) >= chunk_size:
+            _import_chunk(chunk, report)
+            chunk = []
+    if chunk:
+        _import_chunk(chunk, report)
+    logger.info('Imported %s posts and %s comments, %s lines failed',
+                report.imported['posts'], report.imported['comments'], report.failed)
+    return report.to_dict()
+
+
+def _import_chunk(chunk: list, report: ImportReport):
+    """Resolve the authors and posts of a chunk, then write it in one
+    transaction. When it conflicts with existing rows, write the lines one
+    at a time to find the ones at fault"""
+    chunk = _resolve(chunk, report)
+    try:
+        _insert(chunk, report)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        for entry in chunk:
+            try:
+                with db.session.begin_nested():
+                    _insert([entry], report)
+            except IntegrityError:
+                report.error(entry[0], 'conflicts with an existing row')
+        db.session.commit()
+
+
+def _resolve(chunk: list, report: ImportReport) -> list:
+    """Swap emails for user ids and drop the lines whose author or post does
+    not exist, with one query per kind of reference"""
+    emails = {row['email'].lower() for _, _, row in chunk if 'email' in row}
+    user_ids = {row['user_id'] for _, _, row in chunk if 'user_id' in row}
+    post_ids = {row['post_id'] for _, model, row in chunk if model is Comment}
+    by_email = dict(db.session.execute(
+        select(User.email, User.id).where(User.email.in_(emails), User.deleted_at.is_(None))
+    ).all()) if emails else {}
+    by_email = {email.lower(): id for email, id in by_email.items()}
+    users = set(db.session.scalars(select(User.id).where(
+        User.id.in_(user_ids), User.deleted_at.is_(None)))) if user_ids else set()
+    posts = set(db.session.scalars(select(Post.id).where(Post.id.in_(post_ids)))) \
+        if post_ids else set()
+    resolved = []
+    for number, model, row in chunk:
+        email, given = row.pop('email', None), row.get('user_id')
+        row['user_id'] = given if given is not None else by_email.get(email.lower())
+        if row['user_id'] is None or (given is not None and given not in users):
+            report.error(number, 'unknown user')
+        elif model is Comment and row['post_id'] not in posts:
+            report.error(number, 'unknown post')
+        else:
+            if model is Post:
+                # Comments further down the chunk may belong to it
+                posts.add(row['id'])
+            resolved.append((number, model, row))
+    return resolved
+
+
+def _insert(chunk: list, report: ImportReport):
+    """Write posts then comments with one multi-row INSERT each, count the
+    comments on their posts and invalidate what shows them"""
+    session = db.session()
+    new_posts = [row for _, model, row in chunk if model is Post]
+    new_comments = [row for _, model, row in chunk if model is Comment]
+    if new_posts:
+        session.execute(Post.__table__.insert(), new_posts)
+    if new_comments:
+        session.execute(Comment.__table__.insert(), new_comments)
+    counts = {}
+    for row in new_comments:
+        counts[row['post_id']] = counts.get(row['post_id'], 0) + 1
+    tags = ['posts:list', 'comments:list']
+    for post_id, count in counts.items():
+        Post.bump_counters(session, post_id, comments=count)
+        identity_cache.invalidate_on_commit(session, Post, post_id)
+        tags += Post.counter_tags(post_id) + [f'post:{post_id}:comments']
+    tags += [f'user:{row["user_id"]}:posts' for row in new_posts]
+    response_cache.invalidate_on_commit(session, *tags)
+    report.imported['posts'] += len(new_posts)
+    report.imported['comments'] += len(new_comments)
+
+
+def export_ndjson(types=('posts', 'comments'), batch_size: int = 1000):
+    """Yield the posts then the comments as NDJSON, one string per batch of
+    rows, read from a server-side cursor in index order"""
+    for kind in types:
+        model = EXPORTS[kind]
+        table, name = model.__table__, kind[:-1]
+        order = (table.c.create_at, table.c.id) if model is Post else \
+            (table.c.post_id, table.c.create_at, table.c.id)
+        result = db.session.execute(select(table).order_by(*order)
+                                    .execution_options(yield_per=batch_size))
+        for rows in result.partitions():
+            yield ''.join(json.dumps({'type': name, **row._asdict()}, default=format_datetime)
+                          + '\n' for row in rows)
@@ -0,0 +1,257 @@
+#!/usr/bin/python3
+"""This module contains the caches shared by the app: an in-process LRU+TTL
+cache, a Redis backend with the same interface, and the identity cache that
+serves rows by primary key"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+import redis
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from utils.database import db
+from utils.extension import Extension
+from utils.logger import logger
+
+
+class LRUCache:
+    """A thread-safe, size-bounded cache whose entries also expire after a TTL.
+    The least recently used entry is dropped once maxsize is reached"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """Return the value stored under key, or default if missing or expired"""
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return default
+            if expires <= time.monotonic():
+                del self._data[key]
+                self._evicted(key, value)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        """Store value under key for ttl seconds, the cache default if not given"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                old_key, (old_value, _) = self._data.popitem(last=False)
+                self._evicted(old_key, old_value)
+
+    def delete(self, key):
+        """Drop key from the cache if it is there"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._evicted(key, entry[0])
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            for key, (value, _) in list(self._data.items()):
+                self._evicted(key, value)
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def _evicted(self, key, value):
+        """Hook called with the lock held whenever an entry leaves the cache"""
+        pass
+
+
+class RedisCache:
+    """Cache backend storing pickled values in Redis, shared by every worker.
+    Only point it at a Redis instance you trust, values are unpickled on read"""
+
+    def __init__(self, url: str, ttl: float = 300, prefix: str = 'cs'):
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key, default=None):
+        raw = self.client.get(f'{self.prefix}:{key}')
+        return default if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl > 0:
+            self.client.set(f'{self.prefix}:{key}', pickle.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(f'{self.prefix}:{key}')
+
+    def clear(self):
+        for key in self.client.scan_iter(f'{self.prefix}:*'):
+            self.client.delete(key)
+
+    def ping(self) -> bool:
+        return self.client.ping()
+
+
+class IdentityCache:
+    """Read-through cache of rows by primary key, for models that set
+    __cache_identity__ = True. Rows are stored as plain column values and
+    merged back into the session without a query on a hit. Disabled unless
+    CS_IDENTITY_CACHE is 'memory' or 'redis'; initialised like db with init_app.
+    With replicas, a row invalidated less than lag seconds ago is read from
+    the primary on a miss, a replica may still hold the old values"""
+
+    def __init__(self):
+        self.backend = None
+        self.lag = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        kind = app.config.get('CS_IDENTITY_CACHE')
+        ttl = app.config.get('CS_IDENTITY_CACHE_TTL', 300)
+        if kind == 'memory':
+            self.backend = LRUCache(app.config.get('CS_IDENTITY_CACHE_SIZE', 10000), ttl)
+        elif kind == 'redis':
+            self.backend = RedisCache(app.config['CS_REDIS_URL'], ttl, prefix='cs:identity')
+        else:
+            self.backend = None
+        self.lag = app.config.get('CS_REPLICA_STICKY_SECONDS', 5) \
+            if app.config.get('CS_REPLICA_URIS') else 0
+
+    @staticmethod
+    def key(model, ident) -> str:
+        return f'{model.__tablename__}:{ident}'
+
+    def get(self, model, ident):
+        """Return the row of model with primary key ident, or None"""
+        if self.backend is None:
+            return model.query.get(ident)
+        # An object already in this session is free, and may hold pending changes
+        obj = db.session.identity_map.get(identity_key(model, ident))
+        if obj is not None:
+            return obj
+        try:
+            values = self.backend.get(self.key(model, ident))
+        except Exception as e:
+            logger.exception(e)
+            values = None
+        if values is not None:
+            self._count(hit=True)
+            return self._load(model, values)
+        self._count(hit=False)
+        if self._changed(model, ident):
+            # A replica may not have the latest row yet, see utils/routing.py
+            from utils.routing import primary
+            with primary():
+                obj = model.query.get(ident)
+        else:
+            obj = model.query.get(ident)
+        if obj is not None:
+            self.store(obj)
+        return obj
+
+    def store(self, obj):
+        """Cache the column values of a fully loaded object"""
+        state = inspect(obj)
+        if self.backend is None or state.modified:
+            return
+        keys = [attr.key for attr in state.mapper.column_attrs]
+        if state.unloaded.intersection(keys):
+            # Deferred or expired columns, caching would need a query
+            return
+        values = {key: state.dict[key] for key in keys}
+        try:
+            self.backend.set(self.key(type(obj), state.identity[0]), values)
+        except Exception as e:
+            logger.exception(e)
+
+    def invalidate(self, model, ident):
+        """Forget the cached row of model with primary key ident"""
+        if self.backend is None:
+            return
+        try:
+            self.backend.delete(self.key(model, ident))
+            if self.lag:
+                self.backend.set(f'{self.key(model, ident)}:changed', True, self.lag)
+        except Exception as e:
+            logger.exception(e)
+
+    def invalidate_on_commit(self, session, model, ident):
+        """Forget a row once the transaction changing it commits, so no reader
+        can cache the old values between the change and the commit"""
+        session.info.setdefault('identity_invalidations', set()).add((model, ident))
+
+    def stats(self) -> dict:
+        """Return the hit and miss counters"""
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'ratio': self.hits / total if total else 0.0}
+
+    def _changed(self, model, ident) -> bool:
+        """Return True if the row was invalidated within the last lag seconds"""
+        if not self.lag:
+            return False
+        try:
+            return self.backend.get(f'{self.key(model, ident)}:changed') is not None
+        except Exception as e:
+            logger.exception(e)
+            return True
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def _load(model, values: dict):
+        """Rebuild a cached row and attach it to the session without a query.
+        Values are set as committed state, bypassing __init__ and __setattr__"""
+        obj = model.__mapper__.class_manager.new_instance()
+        for key, value in values.items():
+            set_committed_value(obj, key, value)
+        make_transient_to_detached(obj)
+        return db.session.merge(obj, load=False)
+
+
+identity_cache = Extension('identity_cache', IdentityCache)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_cascaded(session, flush_context, instances):
+    """Forget on commit the cached rows ON DELETE CASCADE is about to remove
+    with the deleted ones, see Model._cascaded"""
+    if identity_cache.backend is None:
+        return
+    for obj in session.deleted:
+        for model, criterion in getattr(obj, '_cascaded', list)():
+            if getattr(model, '__cache_identity__', False):
+                for ident in session.scalars(select(model.id).where(criterion)):
+                    identity_cache.invalidate_on_commit(session, model, ident)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for model, ident in session.info.pop('identity_invalidations', ()):
+        identity_cache.invalidate(model, ident)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('identity_invalidations', None)
@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+"""This module answers conditional GETs.
+Responses carry a strong ETag derived from the id, update_at and counters of
+the rows they show. Single rows also carry their update_at as Last-Modified;
+lists do not, since a row leaving or entering the page changes the list
+without moving its newest update_at. When the client's If-None-Match or
+If-Modified-Since shows it already has that version, the view answers 304
+before serializing anything. update_at moves on every
+UPDATE, including counter bumps, see models/base_model.py."""
+import hashlib
+from datetime import datetime
+from flask import current_app, g, request
+from werkzeug.http import is_resource_modified
+
+# Columns besides update_at that change the representation without an ORM write
+VERSION_COLUMNS = ('likes_count', 'comments_count')
+
+
+def validators(rows, *parts) -> tuple:
+    """Return the ETag and Last-Modified of a row or list of rows, the
+    latter always None for lists. parts are anything else the response
+    shows, like the next page cursor"""
+    single = not isinstance(rows, (list, tuple))
+    if single:
+        rows = [rows]
+    digest = hashlib.sha1()
+    last_modified = None
+    for row in rows:
+        values = row.__dict__
+        # Expired rows are refreshed rather than versioned by a missing value
+        update_at = values['update_at'] if 'update_at' in values else row.update_at
+        digest.update(f'{row._identity()}:{update_at}'.encode())
+        for column in VERSION_COLUMNS:
+            # Only columns already loaded, reading them must not cost a query
+            if column in values:
+                digest.update(f':{values[column]}'.encode())
+        digest.update(b'\n')
+        if single and isinstance(update_at, datetime):
+            last_modified = update_at
+    for part in parts:
+        digest.update(f'{part}\n'.encode())
+    return digest.hexdigest(), last_modified
+
+
+def conditional(rows, render, *parts):
+    """Return 304 if the client holds the current version of rows, otherwise
+    the response built by render(). Both carry the validators. Responses
+    embedding ?include= rows are rendered as is, since those rows change on
+    their own"""
+    if g.get('includes'):
+        return render()
+    etag, last_modified = validators(rows, *parts)
+    if is_resource_modified(request.environ, etag, last_modified=last_modified):
+        response = render()
+    else:
+        response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
@@ -1,6 +1,6 @@
 # Create class Config to initiate all configurations for the app
 from dotenv import load_dotenv
-from os import getenv
+from os import cpu_count, getenv
 
 load_dotenv()
 
@@ -17,3 +17,113 @@ class Config:
     CERT = getenv('CERT')
     KEY = getenv('KEY')
     SQLALCHEMY_DATABASE_URI = f'mysql+pymysql://{CS_MYSQL_USER}:{CS_MYSQL_PASS}@{CS_MYSQL_HOST}:{CS_MYSQL_PORT}/{CS_MYSQL_DB}'
+    # Accounts owning more rows than this are purged in the background
+    CS_PURGE_THRESHOLD = int(getenv('CS_PURGE_THRESHOLD', 1000))
+    CS_PURGE_BATCH_SIZE = int(getenv('CS_PURGE_BATCH_SIZE', 500))
+    # Tokens resolved to users by token_required, see utils/auth.py
+    CS_PRINCIPAL_CACHE_SIZE = int(getenv('CS_PRINCIPAL_CACHE_SIZE', 10000))
+    # Each worker caches on its own: another worker may still accept the token
+    # of a deleted user, or one whose password changed, for up to the TTL
+    CS_PRINCIPAL_CACHE_TTL = int(getenv('CS_PRINCIPAL_CACHE_TTL', 5))
+    # Read-through cache of rows by primary key: '', 'memory' or 'redis'
+    CS_IDENTITY_CACHE = getenv('CS_IDENTITY_CACHE', '')
+    CS_IDENTITY_CACHE_SIZE = int(getenv('CS_IDENTITY_CACHE_SIZE', 10000))
+    CS_IDENTITY_CACHE_TTL = int(getenv('CS_IDENTITY_CACHE_TTL', 300))
+    CS_REDIS_URL = getenv('CS_REDIS_URL', 'redis://localhost:6379/0')
+    # Buffer likes in memory and write them in bulk, see utils/like_buffer.py
+    CS_LIKE_WRITE_BEHIND = getenv('CS_LIKE_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+    CS_LIKE_FLUSH_INTERVAL = float(getenv('CS_LIKE_FLUSH_INTERVAL', 1.0))
+    CS_LIKE_FLUSH_SIZE = int(getenv('CS_LIKE_FLUSH_SIZE', 1000))
+    # Flushes a post's toggles are tried in before they are dropped
+    CS_LIKE_MAX_RETRIES = int(getenv('CS_LIKE_MAX_RETRIES', 5))
+    # JSON encoder of the app: 'auto' uses orjson when installed, or 'stdlib'
+    CS_JSON_PROVIDER = getenv('CS_JSON_PROVIDER', 'auto')
+    # Comments embedded per post by ?include=comment_preview
+    CS_COMMENT_PREVIEW_SIZE = int(getenv('CS_COMMENT_PREVIEW_SIZE', 3))
+    # POST /batch: sub-requests per batch, and threads running the GETs
+    CS_BATCH_MAX_REQUESTS = int(getenv('CS_BATCH_MAX_REQUESTS', 20))
+    CS_BATCH_WORKERS = int(getenv('CS_BATCH_WORKERS', 4))
+    # Cache of GET responses invalidated by tags: '', 'memory' or 'redis'.
+    # Use redis when running several workers, memory entries are per process
+    CS_RESPONSE_CACHE = getenv('CS_RESPONSE_CACHE', '')
+    CS_RESPONSE_CACHE_SIZE = int(getenv('CS_RESPONSE_CACHE_SIZE', 5000))
+    CS_RESPONSE_CACHE_TTL = int(getenv('CS_RESPONSE_CACHE_TTL', 60))
+    # Log files, see utils/logger.py. CS_LOG_FORMAT is 'text' or 'json', and
+    # CS_LOG_REQUEST_SAMPLE the share of per-request lines kept, 0 to 1
+    CS_LOG_DIR = getenv('CS_LOG_DIR', '../.logs')
+    CS_LOG_FORMAT = getenv('CS_LOG_FORMAT', 'text')
+    CS_LOG_MAX_BYTES = int(getenv('CS_LOG_MAX_BYTES', 10 * 1024 * 1024))
+    CS_LOG_BACKUPS = int(getenv('CS_LOG_BACKUPS', 5))
+    # How often the gunicorn master checks the sizes of the shared log files
+    CS_LOG_ROTATE_INTERVAL = float(getenv('CS_LOG_ROTATE_INTERVAL', 10.0))
+    CS_LOG_BATCH_SIZE = int(getenv('CS_LOG_BATCH_SIZE', 100))
+    CS_LOG_REQUEST_SAMPLE = float(getenv('CS_LOG_REQUEST_SAMPLE', 1.0))
+    # Request metrics at /api/v1/metrics, see utils/metrics.py. Set the
+    # directory when running several workers so their metrics are added up
+    CS_METRICS = getenv('CS_METRICS', 'true').lower() in ('1', 'true', 'yes')
+    CS_METRICS_DIR = getenv('CS_METRICS_DIR', '')
+    CS_METRICS_SYNC_INTERVAL = float(getenv('CS_METRICS_SYNC_INTERVAL', 5.0))
+    # Statements of one shape per request flagged as N+1, see utils/queries.py
+    CS_N_PLUS_ONE_THRESHOLD = int(getenv('CS_N_PLUS_ONE_THRESHOLD', 5))
+    # Comma separated emails of the users allowed on /admin endpoints
+    CS_ADMIN_EMAILS = {email.strip().lower() for email in getenv('CS_ADMIN_EMAILS', '').split(',')
+                       if email.strip()}
+    # NDJSON lines imported per transaction, see utils/bulk.py
+    CS_IMPORT_CHUNK_SIZE = int(getenv('CS_IMPORT_CHUNK_SIZE', 1000))
+    # Comma separated URIs of read replicas serving GET requests, and how long
+    # a user's reads stay on the primary after a write, see utils/routing.py.
+    # Cache misses on rows or tags changed within as long also read the primary.
+    # The sticky store is 'memory', holding up to CS_REPLICA_STICKY_SIZE users,
+    # or 'redis', which gunicorn requires with several workers
+    CS_REPLICA_URIS = [uri.strip() for uri in getenv('CS_REPLICA_URIS', '').split(',')
+                       if uri.strip()]
+    CS_REPLICA_STICKY_SECONDS = float(getenv('CS_REPLICA_STICKY_SECONDS', 5))
+    CS_REPLICA_STICKY_STORE = getenv('CS_REPLICA_STICKY_STORE', 'memory')
+    CS_REPLICA_STICKY_SIZE = int(getenv('CS_REPLICA_STICKY_SIZE', 10000))
+    # /status answers 503 past these limits, see utils/health.py. The database
+    # and Redis are probed at most once per CS_HEALTH_PROBE_TTL seconds
+    CS_HEALTH_MAX_POOL_USAGE = float(getenv('CS_HEALTH_MAX_POOL_USAGE', 0.9))
+    CS_HEALTH_MAX_DB_LATENCY = float(getenv('CS_HEALTH_MAX_DB_LATENCY', 0.5))
+    CS_HEALTH_MAX_QUEUE = int(getenv('CS_HEALTH_MAX_QUEUE', 10000))
+    CS_HEALTH_PROBE_TTL = float(getenv('CS_HEALTH_PROBE_TTL', 2.0))
+    # Serving with gunicorn, see gunicorn.conf.py. CS_WORKERS 0 runs 2 per CPU
+    # plus one, CS_WORKER_CLASS is sync, gthread or gevent (needs gevent).
+    # Workers are replaced after CS_MAX_REQUESTS requests, give or take jitter;
+    # gunicorn 22 gthread workers drop a few connections when replaced
+    CS_BIND = getenv('CS_BIND', f'0.0.0.0:{PORT or 5000}')
+    CS_WORKERS = int(getenv('CS_WORKERS', 0))
+    CS_WORKER_CLASS = getenv('CS_WORKER_CLASS', 'sync')
+    CS_THREADS = int(getenv('CS_THREADS', 4))
+    CS_WORKER_CONNECTIONS = int(getenv('CS_WORKER_CONNECTIONS', 100))
+    CS_PRELOAD = getenv('CS_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+    CS_MAX_REQUESTS = int(getenv('CS_MAX_REQUESTS', 2000))
+    CS_MAX_REQUESTS_JITTER = int(getenv('CS_MAX_REQUESTS_JITTER', 200))
+    CS_KEEPALIVE = int(getenv('CS_KEEPALIVE', 5))
+    CS_WORKER_TIMEOUT = int(getenv('CS_WORKER_TIMEOUT', 30))
+    # Outgoing emails, see utils/mail.py. Nothing is sent without CS_MAIL_HOST,
+    # and password resets then answer 503 outside tests and debug.
+    # The sender defaults to CS_MAIL_USER
+    # Where the app is reached, like https://caseshare.example, for the links
+    # sent by email. Never taken from the Host header, which the client sets:
+    # without it password reset emails are refused outside tests and debug
+    CS_PUBLIC_URL = getenv('CS_PUBLIC_URL', '').rstrip('/')
+    CS_MAIL_HOST = getenv('CS_MAIL_HOST', '')
+    CS_MAIL_PORT = int(getenv('CS_MAIL_PORT', 587))
+    CS_MAIL_USER = getenv('CS_MAIL_USER', '')
+    CS_MAIL_PASSWORD = getenv('CS_MAIL_PASSWORD', '')
+    CS_MAIL_STARTTLS = getenv('CS_MAIL_STARTTLS', 'true').lower() in ('1', 'true', 'yes')
+    CS_MAIL_SENDER = getenv('CS_MAIL_SENDER', '')
+    CS_MAIL_TIMEOUT = float(getenv('CS_MAIL_TIMEOUT', 10.0))
+    CS_MAIL_WORKERS = int(getenv('CS_MAIL_WORKERS', 2))
+    CS_MAIL_BATCH_SIZE = int(getenv('CS_MAIL_BATCH_SIZE', 50))
+    CS_MAIL_QUEUE_SIZE = int(getenv('CS_MAIL_QUEUE_SIZE', 10000))
+    CS_MAIL_MAX_RETRIES = int(getenv('CS_MAIL_MAX_RETRIES', 5))
+    CS_MAIL_RETRY_DELAY = float(getenv('CS_MAIL_RETRY_DELAY', 2.0))
+    CS_MAIL_IDLE_SECONDS = float(getenv('CS_MAIL_IDLE_SECONDS', 30.0))
+    # Passwords hashed at once on the host across every worker, 0 for no
+    # bound, and how long a hash may wait for its turn, see utils/passwords.py.
+    # Stored hashes with fewer iterations are upgraded on login
+    CS_PASSWORD_WORKERS = int(getenv('CS_PASSWORD_WORKERS', min(2, cpu_count() or 1)))
+    CS_PASSWORD_ITERATIONS = int(getenv('CS_PASSWORD_ITERATIONS', 600000))
+    CS_PASSWORD_QUEUE_TIMEOUT = float(getenv('CS_PASSWORD_QUEUE_TIMEOUT', 2.0))
+    CS_PASSWORD_SLOTS_DIR = getenv('CS_PASSWORD_SLOTS_DIR', '')
@@ -1,5 +1,17 @@
 # This file creates a SQLAlchemy instance
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 
 
-db = SQLAlchemy()
+class RoutingSession(Session):
+    """Session letting a router pick the engine of each statement, which
+    utils/routing.py sets to send the reads of GET requests to replicas"""
+    router = None
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.router is not None:
+            bind = self.router.get_bind(self, clause)
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
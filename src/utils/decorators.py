@@ -1,30 +1,89 @@
 #!/usr/bin/python3
 """This module contains decorator functions for the views. These includes:
 - token_required
+- sparse_fields
+- expandable
+- admin_required
 """
 import jwt
 from functools import wraps
-from flask import request, make_response
+from flask import current_app, g, request, make_response
 from os import environ
 from flask import jsonify
+from utils.fields import parse_fields
+from utils.includes import parse_includes
 from utils.logger import logger
 
 SECRET_KEY = environ.get('SECRET_KEY')
+# WSGI environ key under which POST /batch hands its already decoded token to
+# the sub-requests it dispatches. Clients cannot set it, only HTTP_* keys
+BATCH_AUTH = 'caseshare.batch_auth'
 
 
 def token_required(f):
-    """Checks if a token is passed by the front-end to the endpoint"""
+    """Checks if a token is passed by the front-end to the endpoint.
+    The token and its email are kept on flask.g, views get the user behind
+    them through utils.auth.current_principal and current_user.
+    Sub-requests of a batch reuse the token the batch was authenticated with"""
     @wraps(f)
     def decorator(*args, **kwargs):
         try:
-            token = request.headers.get('Authorization')
-            token = token.split(' ')[1].strip() if token else None
-            data = jwt.decode(token, SECRET_KEY, algorithms='HS256')
-            user_email = data['email']
+            batch_auth = request.environ.get(BATCH_AUTH)
+            if batch_auth:
+                token, user_email, token_exp = batch_auth
+            else:
+                token = request.headers.get('Authorization')
+                token = token.split(' ')[1].strip() if token else None
+                data = jwt.decode(token, SECRET_KEY, algorithms='HS256')
+                user_email, token_exp = data['email'], data.get('exp')
+            g.token, g.email, g.token_exp = token, user_email, token_exp
             logger.info('Token validated successfully')
             return f(user_email, *args, **kwargs)
         except Exception as e:
             logger.exception(e)
             response = make_response(jsonify({'error': 'invalid or missing token'}), 403)
             return response
-    return decorator
\ No newline at end of file
+    return decorator
+
+def sparse_fields(model):
+    """Validates the `fields` query parameter against the columns of model.
+    The fields are kept on flask.g, None when the parameter is missing"""
+    def wrapper(f):
+        @wraps(f)
+        def decorator(*args, **kwargs):
+            try:
+                g.fields = parse_fields(model, request.args.get('fields'))
+            except ValueError as e:
+                logger.exception(e)
+                return jsonify({'error': str(e)}), 400
+            return f(*args, **kwargs)
+        return decorator
+    return wrapper
+
+
+def expandable(model):
+    """Validates the `include` query parameter against what model can embed.
+    The includes are kept on flask.g, None when the parameter is missing"""
+    def wrapper(f):
+        @wraps(f)
+        def decorator(*args, **kwargs):
+            try:
+                g.includes = parse_includes(model, request.args.get('include'))
+            except ValueError as e:
+                logger.exception(e)
+                return jsonify({'error': str(e)}), 400
+            return f(*args, **kwargs)
+        return decorator
+    return wrapper
+
+def admin_required(f):
+    """Lets through only the users listed in CS_ADMIN_EMAILS.
+    Goes below token_required, which sets the email checked"""
+    @wraps(f)
+    def decorator(*args, **kwargs):
+        email = (g.get('email') or '').lower()
+        if email not in current_app.config['CS_ADMIN_EMAILS']:
+            logger.error('User %s is not an admin', email)
+            return jsonify({'error': 'forbidden'}), 403
+        return f(*args, **kwargs)
+    return decorator
@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+"""This module binds the helpers of utils to the apps using them.
+Helpers like metrics or like_buffer are module-level objects, imported
+wherever they are needed and initialised like db with init_app. create_app
+may run more than once in a process, tests build apps with their own
+settings, so init_app does not configure the shared object: it gives the app
+an instance of its own, kept in app.extensions, and the shared object hands
+every attribute to the instance of current_app.
+Outside an app context, in gunicorn hooks and at exit, that is the instance
+of the first app initialised, the one wsgi.py serves, or an unconfigured
+one before any app is. Background threads run on the instance that started
+them."""
+from flask import current_app, has_app_context
+
+
+class Extension:
+    """Module-level handle on the per-app instances of a helper class"""
+
+    def __init__(self, name: str, factory):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_default', factory())
+        object.__setattr__(self, '_bound', False)
+
+    def init_app(self, app):
+        """Give app its own instance, configured from its config. Runs once
+        per app"""
+        if self._name in app.extensions:
+            return
+        instance = self._factory()
+        instance.init_app(app)
+        app.extensions[self._name] = instance
+        if not self._bound:
+            object.__setattr__(self, '_default', instance)
+            object.__setattr__(self, '_bound', True)
+
+    def instance(self):
+        """Return the instance of current_app, or the default one"""
+        if has_app_context():
+            instance = current_app.extensions.get(self._name)
+            if instance is not None:
+                return instance
+        return self._default
+
+    def __getattr__(self, name):
+        return getattr(self.instance(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.instance(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self.instance(), name)
+
+    def __len__(self):
+        return len(self.instance())
+
+    def __bool__(self):
+        return True
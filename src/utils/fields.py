@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+"""This module implements sparse fieldsets.
+GET endpoints returning models accept `fields`, a comma separated list of the
+columns the client wants, e.g. ?fields=id,title,create_at. The other columns
+are neither selected from the database (load_only) nor serialized. Columns a
+model never serializes, like the password of a User, cannot be requested."""
+from sqlalchemy.orm import load_only
+
+
+def parse_fields(model, value: str = None):
+    """Return the fields requested for model as a tuple, None if value is None.
+    Raise ValueError naming the fields the model does not serialize"""
+    if value is None:
+        return None
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    if not fields:
+        raise ValueError('no fields requested')
+    allowed = {key for key, _ in model._serialized_columns()}
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f'unknown fields: {", ".join(unknown)}')
+    return fields
+
+
+def load_fields(query, model, fields: tuple = None, extra: tuple = ()):
+    """Select only the requested columns, plus id, create_at and update_at
+    which identity, keyset pagination and ETags need, and the extra columns"""
+    if not fields:
+        return query
+    keys = dict.fromkeys(('id', 'create_at', 'update_at') + tuple(extra) + fields)
+    return query.options(load_only(*(getattr(model, key) for key in keys)))
+
+
+def get_with_fields(model, id, fields: tuple = None):
+    """Get an object by primary key loading only the requested columns.
+    Without fields this is model.get, which may be served from the identity cache"""
+    if not fields:
+        return model.get(id)
+    return load_fields(model.query, model, fields).filter_by(id=id).first()
@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+"""This module contains the readiness check served at /api/v1/status.
+A worker whose connection pool is exhausted still answers, slowly, so the
+load balancer needs more than a constant OK to stop sending it traffic.
+The check reports, for the primary and every replica, how many pooled
+connections are in use and the latency of a SELECT 1, and the depth of
+the queues drained by background threads. Past CS_HEALTH_MAX_POOL_USAGE,
+CS_HEALTH_MAX_DB_LATENCY or CS_HEALTH_MAX_QUEUE the status is 503, so
+traffic drains before latency collapses.
+The probes run at most once per CS_HEALTH_PROBE_TTL seconds, however
+often the balancer asks. Cache backends are reported but never fail the
+check, every cache falls back to the database when Redis is down."""
+import threading
+import time
+from sqlalchemy import text
+from utils.cache import identity_cache
+from utils.database import db
+from utils.extension import Extension
+from utils.like_buffer import like_buffer
+from utils.logger import log_queue
+from utils.mail import mailer
+from utils.purge import pending_purges
+from utils.response_cache import response_cache
+from utils.routing import router
+
+
+def pool_stats(pool) -> dict:
+    """Return the connections of a pool in use and its capacity. Only
+    QueuePool has a capacity, other pools report their class alone"""
+    stats = {'class': type(pool).__name__}
+    if hasattr(pool, 'checkedout') and hasattr(pool, '_max_overflow'):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        stats.update(size=pool.size(), checked_out=pool.checkedout(),
+                     overflow=max(pool.overflow(), 0), capacity=capacity)
+        if pool._max_overflow >= 0 and capacity:
+            stats['usage'] = round(pool.checkedout() / capacity, 3)
+    return stats
+
+
+class HealthCheck:
+    """Probes the dependencies of this worker. Initialised like db with init_app"""
+
+    def __init__(self):
+        self.max_pool_usage = 0.9
+        self.max_latency = 0.5
+        self.max_queue = 10000
+        self.probe_ttl = 2.0
+        self._probes = {}
+        self._probed = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_pool_usage = app.config.get('CS_HEALTH_MAX_POOL_USAGE', 0.9)
+        self.max_latency = app.config.get('CS_HEALTH_MAX_DB_LATENCY', 0.5)
+        self.max_queue = app.config.get('CS_HEALTH_MAX_QUEUE', 10000)
+        self.probe_ttl = app.config.get('CS_HEALTH_PROBE_TTL', 2.0)
+        self._probes = {}
+        self._probed = 0.0
+
+    def check(self):
+        """Return the report of this worker, and whether it should get traffic.
+        Needs an app context"""
+        failures = []
+        pools = {name: pool_stats(engine.pool) for name, engine in self._engines()}
+        for name, stats in pools.items():
+            if stats.get('usage', 0) >= self.max_pool_usage:
+                failures.append(f'{name} pool {stats["usage"]:.0%} used')
+        probes = self._probe(pools)
+        for name, probe in probes['database'].items():
+            if 'error' in probe:
+                failures.append(f'{name} unreachable')
+            elif probe['latency'] > self.max_latency:
+                failures.append(f'{name} answered in {probe["latency"]:.3f}s')
+        queues = {'likes': len(like_buffer), 'purges': pending_purges(),
+                  'logs': log_queue.qsize(), 'mails': len(mailer)}
+        for name, depth in queues.items():
+            if depth > self.max_queue:
+                failures.append(f'{depth} {name} queued')
+        report = {'status': 'UNAVAILABLE' if failures else 'OK', 'failures': failures,
+                  'pools': pools, 'database': probes['database'],
+                  'caches': probes['caches'], 'queues': queues}
+        return report, not failures
+
+    def _engines(self):
+        """Yield the primary and the replicas with their names"""
+        for key, engine in db.engines.items():
+            yield key or 'primary', engine
+
+    def _probe(self, pools: dict) -> dict:
+        """Return the last probes, run again once they are older than the TTL.
+        Requests arriving while a probe runs get the previous one"""
+        if self._probes and time.monotonic() - self._probed < self.probe_ttl:
+            return self._probes
+        if not self._lock.acquire(blocking=not self._probes):
+            return self._probes
+        try:
+            database = {}
+            for name, engine in self._engines():
+                if pools[name].get('usage', 0) >= 1:
+                    # Waiting for a connection would only add to the queue
+                    database[name] = {'error': 'pool exhausted'}
+                else:
+                    database[name] = self._ping_database(engine)
+            caches = {'identity': self._ping_cache(identity_cache.backend),
+                      'response': self._ping_cache(response_cache.entries),
+                      'sticky': self._ping_cache(router.writers if router.enabled else None)}
+            self._probes = {'database': database, 'caches': caches}
+            self._probed = time.monotonic()
+            return self._probes
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _ping_database(engine) -> dict:
+        start = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except Exception as e:
+            return {'error': type(e).__name__}
+        return {'latency': round(time.perf_counter() - start, 4)}
+
+    @staticmethod
+    def _ping_cache(backend) -> dict:
+        if backend is None:
+            return {'backend': 'off'}
+        if not hasattr(backend, 'ping'):
+            return {'backend': 'memory', 'ok': True}
+        try:
+            return {'backend': 'redis', 'ok': bool(backend.ping())}
+        except Exception as e:
+            return {'backend': 'redis', 'ok': False, 'error': type(e).__name__}
+
+
+health = Extension('health', HealthCheck)
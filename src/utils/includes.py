@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+"""This module expands related rows into list responses.
+`include` is a comma separated list of what to embed in each row:
+- author: the user who wrote the post or comment, redacted by User.to_dict
+- comment_preview: the latest comments of each post
+- counts: the like and comment counters of each post
+Whatever the page size, authors cost one IN query (selectinload) and previews
+one windowed query, instead of one request per row from the client."""
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased, selectinload
+from models import Comment, Post
+from utils.database import db
+
+INCLUDES = {
+    Post: ('author', 'comment_preview', 'counts'),
+    Comment: ('author',),
+}
+
+# Columns an include reads, loaded even when ?fields= leaves them out
+COLUMNS = {
+    'author': ('user_id',),
+    'counts': ('likes_count', 'comments_count'),
+}
+
+# Response cache tags of the rows an include embeds
+TAGS = {
+    'author': ('users:list',),
+    'comment_preview': ('comments:list',),
+}
+
+
+def parse_includes(model, value: str = None):
+    """Return the includes requested for model as a tuple, None if value is None.
+    Raise ValueError naming the includes the model does not support"""
+    if value is None:
+        return None
+    includes = tuple(dict.fromkeys(include.strip() for include in value.split(',')
+                                   if include.strip()))
+    unknown = [include for include in includes if include not in INCLUDES.get(model, ())]
+    if unknown:
+        raise ValueError(f'unknown includes: {", ".join(unknown)}')
+    return includes or None
+
+
+def include_columns(includes: tuple = None) -> tuple:
+    """Return the columns the includes need loaded"""
+    return tuple(column for include in includes or () for column in COLUMNS.get(include, ()))
+
+
+def include_tags(includes: tuple = None) -> list:
+    """Return the response cache tags of what the includes embed"""
+    return [tag for include in includes or () for tag in TAGS.get(include, ())]
+
+
+def load_includes(query, model, includes: tuple = None):
+    """Eager load the relationships the includes embed"""
+    if includes and 'author' in includes:
+        query = query.options(selectinload(model.user))
+    return query
+
+
+def comment_previews(post_ids: list, size: int) -> dict:
+    """Return the latest `size` comments of each post by post id, newest
+    first, in a single query ranking the comments of every post at once"""
+    if not post_ids:
+        return {}
+    rank = func.row_number().over(partition_by=Comment.post_id,
+                                  order_by=(Comment.create_at.desc(), Comment.id.desc()))
+    ranked = select(Comment, rank.label('rank'))\
+        .where(Comment.post_id.in_(post_ids)).subquery()
+    comment = aliased(Comment, ranked)
+    previews = {post_id: [] for post_id in post_ids}
+    for row in db.session.scalars(select(comment).where(ranked.c.rank <= size)
+                                  .order_by(ranked.c.post_id, ranked.c.rank)):
+        previews[row.post_id].append(row)
+    return previews
+
+
+def with_includes(rows, model, includes: tuple = None, fields: tuple = None):
+    """Return the rows and the function serializing each of them with its
+    includes, None without includes. Rows are read at once so what the
+    includes need can be batched for the whole page"""
+    if not includes:
+        return rows, None
+    rows = list(rows)
+    previews = {}
+    if 'comment_preview' in includes:
+        previews = comment_previews([row.id for row in rows],
+                                    current_app.config['CS_COMMENT_PREVIEW_SIZE'])
+
+    def serialize(row):
+        data = row.to_dict(fields)
+        if 'author' in includes:
+            data['author'] = row.user.to_dict() if row.user else None
+        if 'comment_preview' in includes:
+            data['comment_preview'] = [comment.to_dict() for comment in previews.get(row.id, ())]
+        if 'counts' in includes:
+            data['counts'] = {'likes': row.likes_count, 'comments': row.comments_count}
+        return data
+    return rows, serialize
@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+"""This module contains the JSON providers the app can encode responses with.
+Flask's default provider uses the json module of the standard library. When
+orjson is installed, OrjsonProvider encodes the same values several times
+faster; values orjson does not know, like datetimes, go through Flask's own
+default so responses keep their shape whichever provider is used."""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, keys sorted like the default one"""
+
+    def _options(self, indent=None) -> int:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs) -> str:
+        return self.dumps_bytes(obj, indent=kwargs.get('indent')).decode()
+
+    def dumps_bytes(self, obj, indent=None) -> bytes:
+        """Encode obj straight to UTF-8, skipping the str round trip"""
+        return orjson.dumps(obj, default=self.default, option=self._options(indent))
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self._app.debug if self.compact is None else not self.compact
+        return self._app.response_class(self.dumps_bytes(obj, indent=indent) + b'\n',
+                                        mimetype=self.mimetype)
+
+
+def json_provider_class(name: str = 'auto'):
+    """Return the provider class configured by CS_JSON_PROVIDER"""
+    if name == 'orjson' and orjson is None:
+        raise ValueError('CS_JSON_PROVIDER is orjson but orjson is not installed')
+    if name in ('auto', 'orjson') and orjson is not None:
+        return OrjsonProvider
+    if name not in ('auto', 'stdlib'):
+        raise ValueError(f'unknown CS_JSON_PROVIDER {name}')
+    return DefaultJSONProvider
@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+"""This module contains the write-behind buffer for likes.
+When a case trends, committing every like on its own makes all the requests
+fight over the same post row. With CS_LIKE_WRITE_BEHIND on, the like views
+only record the latest state of each (user, post) in memory. A background
+thread writes the buffer to the database every CS_LIKE_FLUSH_INTERVAL
+seconds, or as soon as CS_LIKE_FLUSH_SIZE toggles are waiting, with one
+INSERT and one DELETE per post. Whatever is still buffered is written when
+the process exits. Toggles of a post failing with an integrity error, like a
+post deleted meanwhile, are dropped at once; after other errors they are
+tried in CS_LIKE_MAX_RETRIES more flushes, then dropped. Both are logged.
+Delivery is at most once. Toggles still buffered are lost when the process
+is killed, times out under gunicorn or cannot write them on exit; only the
+last case is logged, with the number dropped. The buffer is per process, so
+pending() only shows a user's toggle to requests served by the same worker:
+another worker answers from the database until the flush."""
+import atexit
+import threading
+from sqlalchemy.exc import IntegrityError
+from models import Like
+from utils.extension import Extension
+from utils.logger import logger
+from utils.response_cache import response_cache
+
+
+class LikeBuffer:
+    """Coalesces like and unlike toggles per (user, post) until flushed.
+    Initialised like db with init_app, records nothing while disabled"""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.interval = 1.0
+        self.max_pending = 1000
+        self.max_retries = 5
+        self._pending = {}
+        # Failed flushes in a row, by post
+        self._failures = {}
+        # Toggles being written, still visible to pending() until committed
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('CS_LIKE_WRITE_BEHIND', False)
+        self.interval = app.config.get('CS_LIKE_FLUSH_INTERVAL', 1.0)
+        self.max_pending = app.config.get('CS_LIKE_FLUSH_SIZE', 1000)
+        self.max_retries = app.config.get('CS_LIKE_MAX_RETRIES', 5)
+        if self.enabled:
+            atexit.register(self.flush_at_exit)
+
+    def record(self, user_id: str, post_id: str, liked: bool):
+        """Remember that a user liked or unliked a post. Only the last toggle
+        of each (user, post) is kept, so like-unlike-like costs one write"""
+        with self._lock:
+            self._pending[(user_id, post_id)] = liked
+            full = len(self._pending) >= self.max_pending
+        # The user's cached like summary must show the toggle already
+        response_cache.invalidate(f'post:{post_id}')
+        self._start()
+        if full:
+            self._wake.set()
+
+    def pending(self, user_id: str, post_id: str):
+        """Return True or False if a toggle of the user on the post is waiting
+        to be written, None otherwise"""
+        key = (user_id, post_id)
+        with self._lock:
+            return self._pending.get(key, self._inflight.get(key))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self) -> int:
+        """Write every buffered toggle to the database, one transaction per
+        post. Toggles of a post that fails stay buffered for the next flush,
+        unless they never can be written or failed too often.
+        Return the number of toggles written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            if not batch:
+                return 0
+            posts = {}
+            for (user_id, post_id), liked in batch.items():
+                liked_ids, unliked_ids = posts.setdefault(post_id, ([], []))
+                (liked_ids if liked else unliked_ids).append(user_id)
+            written = 0
+            try:
+                with self.app.app_context():
+                    for post_id, (liked_ids, unliked_ids) in posts.items():
+                        try:
+                            Like.toggle_many(post_id, liked_ids, unliked_ids)
+                            written += len(liked_ids) + len(unliked_ids)
+                            self._failures.pop(post_id, None)
+                        except Exception as e:
+                            logger.exception(e)
+                            self._failed(post_id, liked_ids, unliked_ids, e)
+            finally:
+                with self._lock:
+                    self._inflight = {}
+            logger.info('%s buffered likes written for %s posts', written, len(posts))
+            return written
+
+    def flush_at_exit(self) -> int:
+        """Flush before the process goes, logging the toggles that could not
+        be written and are lost with it. Return their number"""
+        try:
+            self.flush()
+        except Exception as e:
+            logger.exception(e)
+        with self._lock:
+            dropped = len(self._pending)
+            self._pending = {}
+        if dropped:
+            logger.error('%s buffered likes dropped at exit', dropped)
+        return dropped
+
+    def _failed(self, post_id: str, liked_ids: list, unliked_ids: list, error: Exception):
+        """Put back the toggles of a post that failed, or drop them if retrying
+        cannot help or they failed max_retries times after the first"""
+        failures = self._failures.get(post_id, 0) + 1
+        if isinstance(error, IntegrityError) or failures > self.max_retries:
+            self._failures.pop(post_id, None)
+            logger.error('%s buffered likes of post %s dropped after %s attempts: %s',
+                         len(liked_ids) + len(unliked_ids), post_id, failures, error)
+            return
+        self._failures[post_id] = failures
+        self._requeue(post_id, liked_ids, unliked_ids)
+
+    def _requeue(self, post_id: str, liked_ids: list, unliked_ids: list):
+        """Put back toggles that could not be written, unless newer ones came in"""
+        with self._lock:
+            for user_id in liked_ids:
+                self._pending.setdefault((user_id, post_id), True)
+            for user_id in unliked_ids:
+                self._pending.setdefault((user_id, post_id), False)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception(e)
+
+    def _start(self):
+        """Start the flushing thread the first time something is buffered"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='like-flusher',
+                                                daemon=True)
+                self._thread.start()
+
+
+like_buffer = Extension('like_buffer', LikeBuffer)
@@ -1,33 +1,223 @@
+"""This module sets up the logger of the app.
+Views only put records on a queue; a listener thread formats them and writes
+them to info.log and error.log, flushing once the queue is drained or every
+CS_LOG_BATCH_SIZE records rather than after each line. Files are rotated at
+CS_LOG_MAX_BYTES and the rotated copies gzipped. Under gunicorn the workers
+share the files and only the master rotates them, see rotate_logs.
+CS_LOG_FORMAT=json writes
+JSON lines, and CS_LOG_REQUEST_SAMPLE keeps only that share of the
+'Request received'/'Response sent' lines.
+Log with %-style arguments, logger.info('Post %s created', post.id), so
+nothing is formatted for records that are dropped."""
+import atexit
+import gzip
+import json
 import logging
+import os
+import random
+import shutil
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+from utils.config import Config
 
 logger = logging.getLogger(__name__)
 
 logger.setLevel(logging.INFO)
 
-class InfoHandler(logging.FileHandler):
-    """Handler for info logs only"""
+
+class BatchFileHandler(RotatingFileHandler):
+    """Rotating file handler that flushes every batch_size records instead of
+    after each one, gzipping the rotated files"""
+
+    def __init__(self, filename, max_bytes=0, backup_count=0, batch_size=1):
+        super().__init__(filename, mode='a', maxBytes=max_bytes,
+                         backupCount=backup_count, encoding='utf-8', delay=True)
+        self.batch_size = batch_size
+        # Off in processes sharing the file, see stop_rotating
+        self.rotating = True
+        self.namer = lambda name: name + '.gz'
+        self.rotator = self._compress
+        self._pending = 0
+        self._size = None
+
     def emit(self, record):
-        if record.levelno == logging.INFO:
+        try:
+            msg = self.format(record) + self.terminator
+            size = len(msg.encode(self.encoding))
+            if self._full(size):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg)
+            self._size += size
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def _full(self, size: int) -> bool:
+        """Tell if size more bytes would take the file over max_bytes. Sizes
+        are counted here, asking the stream would flush it"""
+        if self._size is None:
+            path = self.baseFilename
+            self._size = os.path.getsize(path) if os.path.exists(path) else 0
+        return self.rotating and 0 < self.maxBytes < self._size + size and self._size > 0
+
+    def doRollover(self):
+        super().doRollover()
+        self._size = 0
+
+    def copy_truncate(self) -> bool:
+        """Rotate the file past max_bytes by gzipping a copy and truncating it
+        in place, for processes appending to it to carry on in the same file.
+        Lines appended between the copy and the truncation are lost"""
+        path = self.baseFilename
+        if not (self.maxBytes > 0 and self.backupCount > 0 and os.path.exists(path)
+                and os.path.getsize(path) >= self.maxBytes):
+            return False
+        for i in range(self.backupCount - 1, 0, -1):
+            source = self.rotation_filename(f'{path}.{i}')
+            if os.path.exists(source):
+                os.replace(source, self.rotation_filename(f'{path}.{i + 1}'))
+        with open(path, 'rb+') as src, gzip.open(self.rotation_filename(f'{path}.1'), 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+            src.truncate(0)
+        return True
+
+    def flush(self):
+        super().flush()
+        self._pending = 0
+
+    @staticmethod
+    def _compress(source, dest):
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+
+class InfoHandler(BatchFileHandler):
+    """Handler for info and warning logs"""
+    def emit(self, record):
+        if logging.INFO <= record.levelno < logging.ERROR:
             super().emit(record)
 
-class ErrorHandler(logging.FileHandler):
-    """Handler for error logs and critical logs"""
+
+class ErrorHandler(BatchFileHandler):
+    """Handler for error logs and critical logs, written at once"""
+    def __init__(self, filename, max_bytes=0, backup_count=0):
+        super().__init__(filename, max_bytes, backup_count, batch_size=1)
+
     def emit(self, record):
         if record.levelno >= logging.ERROR:
             super().emit(record)
 
 
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line"""
+    def format(self, record):
+        entry = {'time': self.formatTime(record), 'level': record.levelname,
+                 'file': record.filename, 'line': record.lineno,
+                 'message': record.getMessage()}
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Keeps only a share of the records logged with extra={'sample': True}"""
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return not getattr(record, 'sample', False) or random.random() < self.rate
+
+
+class LazyQueueHandler(QueueHandler):
+    """Queues records for the listener thread. Only the message is merged
+    here, as its arguments may change once the view returns; the rest of the
+    formatting, tracebacks included, happens on the listener thread"""
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class BatchQueueListener(QueueListener):
+    """Flushes the handlers once the queue is drained rather than per record"""
+    def handle(self, record):
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+
+
 # Create handlers
-info_handler = InfoHandler(filename='../.logs/info.log',
-                                   mode='a', encoding='utf-8')
-error_logger = ErrorHandler(filename='../.logs/error.log',
-                                   mode='a', encoding='utf-8')
+info_handler = InfoHandler(os.path.join(Config.CS_LOG_DIR, 'info.log'),
+                           Config.CS_LOG_MAX_BYTES, Config.CS_LOG_BACKUPS,
+                           Config.CS_LOG_BATCH_SIZE)
+error_logger = ErrorHandler(os.path.join(Config.CS_LOG_DIR, 'error.log'),
+                            Config.CS_LOG_MAX_BYTES, Config.CS_LOG_BACKUPS)
 
 # Create formatter and add it to handlers
-format = logging.Formatter('%(asctime)s - %(filename)s - %(lineno)d - %(levelname)s - %(message)s')
+if Config.CS_LOG_FORMAT == 'json':
+    format = JsonFormatter()
+else:
+    format = logging.Formatter('%(asctime)s - %(filename)s - %(lineno)d - %(levelname)s - %(message)s')
 info_handler.setFormatter(format)
 error_logger.setFormatter(format)
 
-# Add handlers to the logger
-logger.addHandler(info_handler)
-logger.addHandler(error_logger)
+# Add the queue to the logger, the listener feeds the file handlers
+log_queue = SimpleQueue()
+queue_handler = LazyQueueHandler(log_queue)
+queue_handler.addFilter(SampleFilter(Config.CS_LOG_REQUEST_SAMPLE))
+logger.addHandler(queue_handler)
+listener = BatchQueueListener(log_queue, info_handler, error_logger)
+
+
+def start_logging():
+    """Start the listener thread, again in a forked worker where it is gone"""
+    if listener._thread is None or not listener._thread.is_alive():
+        listener._thread = None
+        listener.start()
+
+
+def stop_logging():
+    """Write the queued records and close the files"""
+    if listener._thread is not None:
+        listener.stop()
+    info_handler.close()
+    error_logger.close()
+
+
+def stop_rotating():
+    """Leave rotation to another process. Renaming a file other processes
+    append to would leave them writing to the unlinked copy"""
+    info_handler.rotating = error_logger.rotating = False
+
+
+def rotate_logs(interval: float):
+    """Rotate the log files by copy and truncate every interval seconds, in a
+    thread of the one process in charge of it, the gunicorn master. The
+    workers open them in append mode, so what they write after a truncation
+    lands at the start of the emptied file"""
+    stop_rotating()
+
+    def run():
+        while True:
+            for handler in (info_handler, error_logger):
+                try:
+                    handler.copy_truncate()
+                except OSError as e:
+                    logger.error('Rotating %s failed: %s', handler.baseFilename, e)
+            time.sleep(interval)
+    thread = threading.Thread(target=run, name='log-rotation', daemon=True)
+    thread.start()
+    return thread
+
+
+start_logging()
+atexit.register(stop_logging)
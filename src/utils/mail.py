@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+"""This module sends emails from a queue, off the request path.
+Views only queue a message, which takes microseconds whatever the state of
+the mail server. CS_MAIL_WORKERS threads drain the queue, each keeping its
+SMTP connection open between messages and sending whatever is waiting, up
+to CS_MAIL_BATCH_SIZE messages, over it. The connection is closed after
+CS_MAIL_IDLE_SECONDS without mail. Messages failing with a temporary error
+are tried again CS_MAIL_MAX_RETRIES times, waiting CS_MAIL_RETRY_DELAY
+seconds, then twice as long each time. Messages refused for good are dropped
+and logged.
+Sending is off unless CS_MAIL_HOST is set. To try it against a local SMTP
+stand-in printing the messages:
+    python -m aiosmtpd -n -l localhost:8025
+    CS_MAIL_HOST=localhost CS_MAIL_PORT=8025 CS_MAIL_STARTTLS=false"""
+import atexit
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from queue import Empty, Full, Queue
+from utils.extension import Extension
+from utils.logger import logger
+
+
+class Mailer:
+    """Queue of outgoing emails and the threads sending them. Initialised
+    like db with init_app, queues nothing while disabled"""
+
+    def __init__(self):
+        self.enabled = False
+        self.host = None
+        self.port = 587
+        self.user = None
+        self.password = None
+        self.starttls = True
+        self.sender = None
+        self.timeout = 10.0
+        self.workers = 2
+        self.batch_size = 50
+        self.max_retries = 5
+        self.retry_delay = 2.0
+        self.idle_seconds = 30.0
+        self.sent = 0
+        self.failed = 0
+        self._queue = Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        self.host = config.get('CS_MAIL_HOST') or None
+        self.enabled = self.host is not None
+        self.port = config.get('CS_MAIL_PORT', 587)
+        self.user = config.get('CS_MAIL_USER') or None
+        self.password = config.get('CS_MAIL_PASSWORD') or None
+        self.starttls = config.get('CS_MAIL_STARTTLS', True)
+        self.sender = config.get('CS_MAIL_SENDER') or self.user
+        self.timeout = config.get('CS_MAIL_TIMEOUT', 10.0)
+        self.workers = config.get('CS_MAIL_WORKERS', 2)
+        self.batch_size = config.get('CS_MAIL_BATCH_SIZE', 50)
+        self.max_retries = config.get('CS_MAIL_MAX_RETRIES', 5)
+        self.retry_delay = config.get('CS_MAIL_RETRY_DELAY', 2.0)
+        self.idle_seconds = config.get('CS_MAIL_IDLE_SECONDS', 30.0)
+        self._queue = Queue(config.get('CS_MAIL_QUEUE_SIZE', 10000))
+        if self.enabled:
+            atexit.register(self.flush)
+
+    def send(self, to: str, subject: str, body: str) -> bool:
+        """Queue an email. Return False if it cannot be sent: mail is
+        disabled or the queue is full"""
+        if not self.enabled:
+            return False
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = to
+        message['Subject'] = subject
+        message.set_content(body)
+        try:
+            self._queue.put_nowait((message, 0))
+        except Full:
+            logger.error('Mail queue full, email to %s dropped', to)
+            return False
+        self._start()
+        return True
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait for the queued emails to be sent, at most timeout seconds.
+        Return True if the queue emptied. Retries still waiting are lost"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            if not any(thread.is_alive() for thread in self._threads):
+                self._start()
+            time.sleep(0.05)
+        return not self._queue.unfinished_tasks
+
+    def stats(self) -> dict:
+        """Return the emails sent, dropped and waiting"""
+        return {'sent': self.sent, 'failed': self.failed, 'queued': len(self)}
+
+    def _run(self):
+        connection = None
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.idle_seconds)]
+            except Empty:
+                connection = self._close(connection)
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            for message, attempt in batch:
+                try:
+                    connection = self._deliver(connection, message, attempt)
+                except Exception as e:
+                    logger.exception(e)
+                finally:
+                    self._queue.task_done()
+
+    def _deliver(self, connection, message, attempt: int):
+        """Send one message, connecting if needed, and return the connection
+        to reuse for the next one"""
+        try:
+            if connection is None:
+                connection = self._connect()
+            try:
+                connection.send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                # The server closed the idle connection, one fresh try
+                connection = self._connect()
+                connection.send_message(message)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+            # 4xx replies are temporary, 5xx ones and refused recipients final
+            code = getattr(e, 'smtp_code', None)
+            if code is not None and code < 500:
+                self._retry(message, attempt, e)
+            else:
+                self._count(failed=True)
+                logger.error('Email to %s refused: %s', message['To'], e)
+            return connection
+        except (smtplib.SMTPException, OSError) as e:
+            self._retry(message, attempt, e)
+            return self._close(connection)
+        self._count(failed=False)
+        logger.info('Email "%s" sent', message['Subject'])
+        return connection
+
+    def _connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            connection.starttls()
+        if self.user and self.password:
+            connection.login(self.user, self.password)
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None:
+            try:
+                connection.quit()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+        return None
+
+    def _retry(self, message, attempt: int, error: Exception):
+        """Queue a message again after a delay doubling with each attempt"""
+        if attempt >= self.max_retries:
+            self._count(failed=True)
+            logger.error('Email to %s dropped after %s attempts: %s',
+                         message['To'], attempt + 1, error)
+            return
+        delay = self.retry_delay * 2 ** attempt
+        logger.warning('Email to %s failed, retrying in %ss: %s', message['To'], delay, error)
+        timer = threading.Timer(delay, self._requeue, args=(message, attempt + 1))
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, message, attempt: int):
+        try:
+            self._queue.put_nowait((message, attempt))
+        except Full:
+            self._count(failed=True)
+            logger.error('Mail queue full, email to %s dropped', message['To'])
+
+    def _count(self, failed: bool):
+        with self._lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.sent += 1
+
+    def _start(self):
+        """Start the sending threads the first time something is queued, and
+        again in a forked worker where they are gone"""
+        if len(self._threads) == self.workers and all(t.is_alive() for t in self._threads):
+            return
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, daemon=True,
+                                          name=f'mailer-{len(self._threads)}')
+                thread.start()
+                self._threads.append(thread)
+
+
+mailer = Extension('mailer', Mailer)
@@ -0,0 +1,274 @@
+#!/usr/bin/python3
+"""This module measures the requests served by the app.
+The before_request and after_request hooks of the app time every request and
+record, by endpoint, method and status, its latency and the number and time
+of the database queries it ran, counted by utils/queries.py. GET /api/v1/metrics exposes them with the
+requests in flight and the cache hit ratios in the Prometheus text format.
+The latency of a streamed response, like a list from stream_json_array,
+is taken once its body is sent.
+With CS_METRICS_DIR set, each gunicorn worker saves its numbers to
+<pid>-<start>.json there every CS_METRICS_SYNC_INTERVAL seconds and the
+metrics of all the workers are added up. The start time in the name keeps a
+new worker reusing a pid from overwriting an older one's file. When a worker
+exits, the master adds its counters to exited.json and removes its file;
+empty the directory when the server starts."""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import partial
+from flask import g, request
+from utils.cache import identity_cache
+from utils.extension import Extension
+from utils.logger import logger
+from utils.response_cache import response_cache
+from utils.routing import router
+
+# Upper bounds of the histogram buckets, +Inf is added when rendering
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Counters of the workers that exited, kept by the master
+EXITED = 'exited.json'
+
+
+def _observe(table: dict, key, buckets: tuple, value: float):
+    """Count value in the histogram of key: one slot per bucket, one for
+    +Inf, then the sum of the values"""
+    entry = table.get(key)
+    if entry is None:
+        entry = table[key] = [0] * (len(buckets) + 1) + [0]
+    entry[bisect_left(buckets, value)] += 1
+    entry[-1] += value
+
+
+def _labels(names: tuple, values) -> str:
+    return ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for name, value in zip(names, values))
+
+
+class Metrics:
+    """Request metrics of this process, merged with the other workers' when
+    rendered. Initialised like db with init_app"""
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.interval = 5.0
+        self.requests = {}
+        self.queries = {}
+        self.query_seconds = {}
+        self.in_flight = 0
+        self._synced = 0.0
+        self._pid = None
+        self._path = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('CS_METRICS', True)
+        self.directory = app.config.get('CS_METRICS_DIR') or None
+        self.interval = app.config.get('CS_METRICS_SYNC_INTERVAL', 5.0)
+        if self.enabled and self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            atexit.register(self.sync)
+
+    def start_request(self):
+        """Called by before_request"""
+        if not self.enabled:
+            return
+        g.metrics_start = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+
+    def end_request(self, response):
+        """Called by after_request, also run for the 500 of unhandled errors.
+        A streamed body is generated after that, the request is recorded once
+        the response closes"""
+        if not self.enabled or 'metrics_start' not in g:
+            return
+        record = partial(self._record, g._get_current_object(), g.pop('metrics_start'),
+                         (request.endpoint or 'unmatched', request.method,
+                          response.status_code))
+        if response.is_streamed:
+            response.call_on_close(record)
+        else:
+            record()
+
+    def _record(self, counts, start: float, key: tuple):
+        """Count a request that started at start, with the statements it ran"""
+        elapsed = time.perf_counter() - start
+        endpoint = key[0]
+        with self._lock:
+            self.in_flight -= 1
+            _observe(self.requests, key, DURATION_BUCKETS, elapsed)
+            _observe(self.queries, endpoint, QUERY_BUCKETS, counts.get('db_queries', 0))
+            self.query_seconds[endpoint] = (self.query_seconds.get(endpoint, 0.0)
+                                            + counts.get('db_seconds', 0.0))
+        if self.directory and time.monotonic() - self._synced > self.interval:
+            self.sync()
+
+    def snapshot(self) -> dict:
+        """Return the numbers of this process as plain JSON types"""
+        with self._lock:
+            return {'requests': [[list(key), entry] for key, entry in self.requests.items()],
+                    'queries': [[key, entry] for key, entry in self.queries.items()],
+                    'query_seconds': self.query_seconds.copy(),
+                    'in_flight': self.in_flight,
+                    'caches': {'identity': identity_cache.stats(),
+                               'response': response_cache.stats()},
+                    'routes': router.stats()}
+
+    def sync(self):
+        """Save the numbers of this process for the other workers to read"""
+        self._synced = time.monotonic()
+        if self._pid != os.getpid():
+            # First sync of this process, a forked worker included
+            self._pid = os.getpid()
+            self._path = os.path.join(self.directory, f'{self._pid}-{time.time_ns()}.json')
+        try:
+            _dump(self._path, self.snapshot())
+        except OSError as e:
+            logger.exception(e)
+
+    def mark_process_dead(self, pid: int):
+        """Add the counters of a worker that exited to exited.json, without
+        its gauge, and remove its file. Called by the master only"""
+        exited = os.path.join(self.directory, EXITED)
+        try:
+            total = _load(exited) if os.path.exists(exited) else None
+            for name in os.listdir(self.directory):
+                if name.startswith(f'{pid}-') and name.endswith('.json'):
+                    path = os.path.join(self.directory, name)
+                    total = _fold(total, _load(path))
+                    _dump(exited, total)
+                    os.remove(path)
+        except (OSError, ValueError) as e:
+            logger.exception(e)
+
+    def collect(self) -> list:
+        """Return the snapshots of every worker, this one up to date"""
+        if not self.directory:
+            return [self.snapshot()]
+        self.sync()
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.exception(e)
+        return snapshots
+
+    def render(self) -> str:
+        """Return the metrics of all workers in the Prometheus text format"""
+        requests, queries, query_seconds, caches, routes = {}, {}, {}, {}, {}
+        in_flight = 0
+        for snapshot in self.collect():
+            for key, entry in snapshot['requests']:
+                _merge(requests, tuple(key), entry)
+            for key, entry in snapshot['queries']:
+                _merge(queries, key, entry)
+            for key, seconds in snapshot['query_seconds'].items():
+                query_seconds[key] = query_seconds.get(key, 0.0) + seconds
+            for name, stats in snapshot['caches'].items():
+                hits, misses = caches.get(name, (0, 0))
+                caches[name] = (hits + stats['hits'], misses + stats['misses'])
+            for key, count in snapshot.get('routes', {}).items():
+                routes[key] = routes.get(key, 0) + count
+            in_flight += snapshot['in_flight']
+        lines = []
+        _histogram(lines, 'caseshare_request_duration_seconds',
+                   'Time taken to answer requests', ('endpoint', 'method', 'status'),
+                   requests, DURATION_BUCKETS)
+        _histogram(lines, 'caseshare_request_db_queries',
+                   'Database queries run per request', ('endpoint',),
+                   {(key,): entry for key, entry in queries.items()}, QUERY_BUCKETS)
+        lines += ['# HELP caseshare_db_query_seconds_total Time spent in database queries',
+                  '# TYPE caseshare_db_query_seconds_total counter']
+        lines += ['caseshare_db_query_seconds_total{endpoint="%s"} %r' % (key, value)
+                  for key, value in sorted(query_seconds.items())]
+        lines += ['# HELP caseshare_db_routes_total Statements sent to the primary or a '
+                  'replica, see utils/routing.py',
+                  '# TYPE caseshare_db_routes_total counter']
+        lines += ['caseshare_db_routes_total{%s} %d'
+                  % (_labels(('target', 'reason'), key.split(',', 1)), count)
+                  for key, count in sorted(routes.items())]
+        lines += ['# HELP caseshare_requests_in_flight Requests being answered',
+                  '# TYPE caseshare_requests_in_flight gauge',
+                  f'caseshare_requests_in_flight {in_flight}']
+        for kind, index, help in (('hits', 0, 'Cache lookups answered from the cache'),
+                                  ('misses', 1, 'Cache lookups that missed')):
+            lines += [f'# HELP caseshare_cache_{kind}_total {help}',
+                      f'# TYPE caseshare_cache_{kind}_total counter']
+            lines += [f'caseshare_cache_{kind}_total{{cache="{name}"}} {counts[index]}'
+                      for name, counts in sorted(caches.items())]
+        lines += ['# HELP caseshare_cache_hit_ratio Share of cache lookups that hit',
+                  '# TYPE caseshare_cache_hit_ratio gauge']
+        lines += [f'caseshare_cache_hit_ratio{{cache="{name}"}} '
+                  f'{hits / (hits + misses) if hits + misses else 0.0!r}'
+                  for name, (hits, misses) in sorted(caches.items())]
+        return '\n'.join(lines) + '\n'
+
+
+def _load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _dump(path: str, snapshot: dict):
+    """Write a snapshot in one step, readers never see half of it"""
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def _fold(total: dict, snapshot: dict) -> dict:
+    """Return the counters of total plus those of snapshot, with no request
+    in flight. total may be None"""
+    total = total or {'requests': [], 'queries': [], 'query_seconds': {}, 'caches': {},
+                      'routes': {}}
+    requests, queries = {}, {}
+    for source in (total, snapshot):
+        for key, entry in source['requests']:
+            _merge(requests, tuple(key), entry)
+        for key, entry in source['queries']:
+            _merge(queries, key, entry)
+    query_seconds = dict(total['query_seconds'])
+    for key, seconds in snapshot['query_seconds'].items():
+        query_seconds[key] = query_seconds.get(key, 0.0) + seconds
+    caches = {name: dict(stats) for name, stats in total['caches'].items()}
+    for name, stats in snapshot['caches'].items():
+        counts = caches.setdefault(name, {'hits': 0, 'misses': 0})
+        counts['hits'] += stats['hits']
+        counts['misses'] += stats['misses']
+    routes = dict(total.get('routes', {}))
+    for key, count in snapshot.get('routes', {}).items():
+        routes[key] = routes.get(key, 0) + count
+    return {'requests': [[list(key), entry] for key, entry in requests.items()],
+            'queries': [[key, entry] for key, entry in queries.items()],
+            'query_seconds': query_seconds, 'in_flight': 0, 'caches': caches,
+            'routes': routes}
+
+
+def _merge(table: dict, key, entry: list):
+    current = table.get(key)
+    table[key] = entry[:] if current is None else [a + b for a, b in zip(current, entry)]
+
+
+def _histogram(lines: list, name: str, help: str, names: tuple, table: dict, buckets: tuple):
+    lines += [f'# HELP {name} {help}', f'# TYPE {name} histogram']
+    for key, entry in sorted(table.items(), key=lambda item: [str(part) for part in item[0]]):
+        labels = _labels(names, key)
+        total = 0
+        for bound, count in zip(buckets + ('+Inf',), entry):
+            total += count
+            lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, total))
+        lines.append('%s_sum{%s} %r' % (name, labels, entry[-1]))
+        lines.append('%s_count{%s} %d' % (name, labels, total))
+
+
+metrics = Extension('metrics', Metrics)
@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+"""This module contains helpers for keyset (cursor) pagination.
+A cursor is an opaque, url-safe token holding the (create_at, id) of the last
+row a client has seen, so the next page can be read straight from an index
+instead of scanning and discarding every skipped row like OFFSET does."""
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+time = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def encode_cursor(create_at: datetime, id: str) -> str:
+    """Turn the sort key of a row into an opaque cursor"""
+    raw = json.dumps([create_at.strftime(time), id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Get back the (create_at, id) stored in a cursor.
+    Raise ValueError if the cursor was not produced by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        create_at, id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.strptime(create_at, time), str(id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError('invalid cursor') from e
+
+
+def keyset_paginate(query, model, cursor: str = None, limit: int = 20,
+                    descending: bool = True) -> tuple:
+    """Read one page of `query` ordered by (create_at, id).
+    Return the rows and the cursor of the next page, or None on the last page.
+    The query should be backed by an index ending in (create_at, id)"""
+    if descending:
+        query = query.order_by(model.create_at.desc(), model.id.desc())
+    else:
+        query = query.order_by(model.create_at.asc(), model.id.asc())
+    if cursor:
+        create_at, id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(or_(model.create_at < create_at,
+                                     and_(model.create_at == create_at, model.id < id)))
+        else:
+            query = query.filter(or_(model.create_at > create_at,
+                                     and_(model.create_at == create_at, model.id > id)))
+    # Fetch one extra row to know whether there is a next page at all
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].create_at, rows[-1].id)
+    return rows, None
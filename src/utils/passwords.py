@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+"""This module hashes and checks passwords, a bounded number at a time.
+A PBKDF2 hash costs hundreds of milliseconds of CPU by design. Computed by
+every request at once, a burst of logins takes every core and unrelated
+requests wait behind it. At most CS_PASSWORD_WORKERS passwords are hashed at
+once on the host, however many gunicorn workers and threads serve the app:
+each hash first takes one of that many slots, lock files in
+CS_PASSWORD_SLOTS_DIR held with flock. The kernel releases the locks of a
+process that dies, so a killed worker never keeps its slot. A request
+waiting longer than CS_PASSWORD_QUEUE_TIMEOUT seconds for a slot fails with
+PasswordsBusy, answered with a 503, so a burst is turned away rather than
+piling up. The hash itself runs in the request's thread, PBKDF2 releases
+the GIL while it computes.
+New hashes use CS_PASSWORD_ITERATIONS rounds of PBKDF2-SHA256. Hashes made
+with other parameters still check, and needs_rehash tells the login view
+to store a new one.
+Until init_app runs, for models used outside the app, hashing is not bounded."""
+import fcntl
+import os
+import tempfile
+import time
+from werkzeug import security
+from utils.extension import Extension
+
+
+class PasswordsBusy(Exception):
+    """Raised when no hashing slot frees up in time"""
+
+
+class PasswordHasher:
+    """Host-wide bound on the passwords hashed at once. Initialised like db
+    with init_app, hashes without waiting until then"""
+
+    def __init__(self):
+        self.slots = 0
+        self.method = 'pbkdf2:sha256:600000'
+        self.queue_timeout = 2.0
+        self.directory = None
+
+    def init_app(self, app):
+        self.slots = app.config.get('CS_PASSWORD_WORKERS', 2)
+        self.method = f'pbkdf2:sha256:{app.config.get("CS_PASSWORD_ITERATIONS", 600000)}'
+        self.queue_timeout = app.config.get('CS_PASSWORD_QUEUE_TIMEOUT', 2.0)
+        self.directory = app.config.get('CS_PASSWORD_SLOTS_DIR') or \
+            os.path.join(tempfile.gettempdir(), 'caseshare-passwords')
+        if self.slots:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def hash(self, password: str) -> str:
+        """Return the hash of a password with the current parameters"""
+        return self._run(security.generate_password_hash, password, self.method)
+
+    def check(self, pwhash: str, password: str) -> bool:
+        """Return True if the password matches the hash"""
+        return self._run(security.check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """Return True if a hash was made with other parameters than the current"""
+        return isinstance(pwhash, str) and pwhash.split('$', 1)[0] != self.method
+
+    def _run(self, function, *args):
+        if not self.slots:
+            return function(*args)
+        slot = self._acquire()
+        try:
+            return function(*args)
+        finally:
+            # Closing the file releases its lock
+            slot.close()
+
+    def _acquire(self):
+        """Return the open lock file of a free slot, waiting for one at most
+        queue_timeout seconds. Every call opens its own file, so threads of
+        one process also exclude each other"""
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            for i in range(self.slots):
+                slot = open(os.path.join(self.directory, f'{i}.lock'), 'a')
+                try:
+                    fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return slot
+                except BlockingIOError:
+                    slot.close()
+            if time.monotonic() >= deadline:
+                raise PasswordsBusy('too many passwords being hashed')
+            time.sleep(0.01)
+
+
+passwords = Extension('passwords', PasswordHasher)
+
+
+def generate_password_hash(password: str) -> str:
+    """Hash a password in a slot, see PasswordHasher"""
+    return passwords.hash(password)
+
+
+def check_password_hash(pwhash: str, password: str) -> bool:
+    """Check a password in a slot, see PasswordHasher"""
+    return passwords.check(pwhash, password)
@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+"""This module deletes everything a deleted account owns.
+Small accounts are deleted with a single statement and the ON DELETE CASCADE
+foreign keys do the rest, once the posts they liked or commented on are
+uncounted. Large accounts are marked deleted at once and a
+background thread deletes their rows in bounded batches, recording its
+progress in a PurgeJob that can be polled.
+The queue lives in the worker's memory. Jobs of a worker that exits or is
+recycled stay unfinished until `flask --app api.v1.app resume-purges`
+runs them again, starting where they stopped. Whoever runs a job first
+claims it, so a job still queued in a live worker is never run twice."""
+import threading
+from datetime import datetime, timedelta
+from queue import Queue
+from sqlalchemy import delete, func, literal, or_, select, update
+from models import Comment, Document, Image, Like, Message, Post, PurgeJob, User, Video
+from utils.cache import identity_cache
+from utils.database import db
+from utils.logger import logger
+from utils.response_cache import response_cache
+
+_jobs = Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _owned(user_id: str):
+    """Yield (model, criterion) for every table holding rows owned by a user.
+    Children come first so each batch only removes rows nothing else points to"""
+    posts = select(Post.id).where(Post.user_id == user_id)
+    for model in (Like, Comment, Image, Video, Document):
+        # Rows written by the user, and rows others attached to the user's posts
+        yield model, or_(model.user_id == user_id, model.post_id.in_(posts))
+    yield Message, or_(Message.sender_id == user_id, Message.receiver_id == user_id)
+    yield Post, Post.user_id == user_id
+
+
+def count_owned_rows(user_id: str, limit: int = None) -> int:
+    """Count the rows that deleting a user would remove. With a limit, stop
+    once more than limit are found, reading at most limit + 1 rows: the
+    count is then only known to be over it"""
+    total = 0
+    for model, criterion in _owned(user_id):
+        rows = select(literal(1)).select_from(model).where(criterion)
+        if limit is not None:
+            rows = rows.limit(limit + 1 - total)
+        total += db.session.scalar(select(func.count()).select_from(rows.subquery()))
+        if limit is not None and total > limit:
+            break
+    return total
+
+
+def delete_account(user: User) -> bool:
+    """Delete a small account at once, the database cascading the delete to
+    what it owns. No ORM event fires for cascaded rows, so the user's likes
+    and comments on other users' posts are first taken off those posts'
+    counters, in the same transaction. Return False if the delete failed"""
+    own_posts = select(Post.id).where(Post.user_id == user.id)
+    for model in (Like, Comment):
+        _uncount(model, (model.user_id == user.id) & model.post_id.not_in(own_posts))
+    if not user.delete():
+        db.session.rollback()
+        return False
+    return True
+
+
+def schedule_purge(app, user: User, total: int) -> PurgeJob:
+    """Mark a user deleted and queue the purge of everything they own. total
+    may be a lower bound, the purge counts the rows again before starting"""
+    user.deleted_at = datetime.utcnow()
+    job = PurgeJob(user_id=user.id, total=total, status='pending', purged=0)
+    db.session.add(user)
+    db.session.add(job)
+    db.session.commit()
+    # Let caches holding the user, like the principal cache, forget it
+    user._written('update')
+    _jobs.put((app, user.id, job.id))
+    _start_worker()
+    logger.info('Purge %s of user %s scheduled for %s rows', job.id, user.id, total)
+    return job
+
+
+def pending_purges() -> int:
+    """Return the number of purge jobs waiting for the worker"""
+    return _jobs.qsize()
+
+
+def unfinished_purges(idle_seconds: float) -> list:
+    """Return (user_id, job_id, status, update_at) of the jobs not done and
+    without progress for idle_seconds, left behind by a worker that exited
+    or failed. Queued jobs qualify too, purge_user only runs those still in
+    the state seen here"""
+    since = datetime.utcnow() - timedelta(seconds=idle_seconds)
+    return db.session.execute(select(PurgeJob.user_id, PurgeJob.id, PurgeJob.status,
+                                     PurgeJob.update_at)
+                              .where(PurgeJob.status != 'done', PurgeJob.update_at < since)
+                              .order_by(PurgeJob.create_at)).all()
+
+
+def claim_purge(job_id: str, status: str = 'pending', update_at: datetime = None) -> bool:
+    """Mark a job running, in one statement, if it is still in the status
+    and, when given, at the update_at seen. Return False if another process
+    claimed it or moved it on first"""
+    criteria = [PurgeJob.id == job_id, PurgeJob.status == status]
+    if update_at is not None:
+        criteria.append(PurgeJob.update_at == update_at)
+    claimed = db.session.execute(update(PurgeJob).where(*criteria)
+                                 .values(status='running', update_at=datetime.utcnow()))
+    db.session.commit()
+    return claimed.rowcount == 1
+
+
+def purge_user(user_id: str, job_id: str, batch_size: int, status: str = 'pending',
+               update_at: datetime = None) -> bool:
+    """Delete the rows of a user batch by batch, then the user itself.
+    Each batch is its own transaction so locks are held only briefly, and
+    running the purge again after a crash picks up where it stopped.
+    The job is first claimed from the status and update_at seen, see
+    claim_purge. Return False if it was not, someone else runs it"""
+    if not claim_purge(job_id, status, update_at):
+        logger.info('Purge %s of user %s taken by another worker', job_id, user_id)
+        return False
+    job = db.session.get(PurgeJob, job_id)
+    try:
+        # The request only counted up to the threshold
+        job.total = job.purged + count_owned_rows(user_id)
+        db.session.commit()
+        for model, criterion in _owned(user_id):
+            while True:
+                ids = db.session.scalars(select(model.id).where(criterion)
+                                         .limit(batch_size)).all()
+                if not ids:
+                    break
+                if model in (Like, Comment):
+                    _uncount(model, model.id.in_(ids))
+                db.session.execute(delete(model).where(model.id.in_(ids)))
+                for id in ids:
+                    identity_cache.invalidate(model, id)
+                if model in (Post, Comment):
+                    kind = 'post' if model is Post else 'comment'
+                    response_cache.invalidate_on_commit(db.session(),
+                                                        *(f'{kind}:{id}' for id in ids))
+                job.purged += len(ids)
+                db.session.commit()
+        db.session.execute(delete(User).where(User.id == user_id))
+        identity_cache.invalidate(User, user_id)
+        # Rows went away with bulk deletes, no tags were collected for them
+        response_cache.invalidate_on_commit(db.session(), f'user:{user_id}',
+                                            f'user:{user_id}:posts', 'users:list',
+                                            'posts:list', 'comments:list')
+        job.status = 'done'
+        db.session.commit()
+        logger.info('Purge %s of user %s done, %s rows deleted', job_id, user_id, job.purged)
+    except Exception as e:
+        logger.exception(e)
+        db.session.rollback()
+        job.status = 'failed'
+        db.session.commit()
+    return True
+
+
+def _uncount(model, criterion):
+    """Take the likes or comments about to be deleted off their posts' counters"""
+    rows = db.session.execute(select(model.post_id, func.count()).where(criterion)
+                              .group_by(model.post_id)).all()
+    for post_id, count in rows:
+        if model is Like:
+            Post.bump_counters(db.session, post_id, likes=-count)
+        else:
+            Post.bump_counters(db.session, post_id, comments=-count)
+        identity_cache.invalidate_on_commit(db.session(), Post, post_id)
+        response_cache.invalidate_on_commit(db.session(), *Post.counter_tags(post_id))
+
+
+def _run():
+    """Take purge jobs off the queue one at a time, forever"""
+    while True:
+        app, user_id, job_id = _jobs.get()
+        try:
+            with app.app_context():
+                purge_user(user_id, job_id, app.config['CS_PURGE_BATCH_SIZE'])
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            _jobs.task_done()
+
+
+def _start_worker():
+    """Start the purge thread the first time a job is queued"""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='purge-worker', daemon=True)
+            _worker.start()
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+"""This module counts and fingerprints the SQL statements of each request.
+Statements differing only in their values share a fingerprint. When one
+fingerprint runs CS_N_PLUS_ONE_THRESHOLD times or more in a request, like a
+lazy load of post.comments inside a loop, a possible N+1 is logged.
+Views can declare how many statements they may run with @query_budget(n).
+With CS_ENV=test, exceeding it raises QueryBudgetExceeded so the test fails;
+elsewhere it is logged. With CS_ENV=dev or test, responses carry the number
+of statements run in an X-Query-Count header.
+Streamed bodies run their statements after the view returns, they are
+counted until the response closes, buffered first in test mode."""
+import re
+import time
+from collections import Counter
+from functools import lru_cache, partial
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from utils.logger import logger
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s|\?|:\w+")
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more statements than its budget"""
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> str:
+    """Return statement with its values and IN lists replaced by ?"""
+    shape = _LITERALS.sub('?', _SPACES.sub(' ', statement).strip())
+    return _LISTS.sub('(?)', shape)
+
+
+def query_budget(limit: int):
+    """Declare the most statements a request to the view may run, token
+    lookups included. Checked by check_queries once the response is ready"""
+    def wrapper(f):
+        f.query_budget = limit
+        return f
+    return wrapper
+
+
+def track_queries():
+    """Start counting the statements of the request, called by before_request"""
+    g.db_queries, g.db_seconds = 0, 0.0
+    g.query_shapes = Counter()
+
+
+def check_queries(response):
+    """Flag the N+1 patterns and budget overruns of the request, called by
+    after_request. A streamed body, like a list from stream_json_array, runs
+    its lazy loads after that: it is checked once the response closes, and
+    its X-Query-Count only counts the statements run before streaming. With
+    CS_ENV=test it is buffered here instead, counted in full"""
+    if 'query_shapes' not in g:
+        return response
+    config = current_app.config
+    if response.is_streamed and config['CS_ENV'] == 'test':
+        # Buffered, so its statements are counted before the checks below
+        # and an overrun fails the test
+        response.make_sequence()
+    if config['CS_ENV'] in ('dev', 'test'):
+        response.headers['X-Query-Count'] = str(g.db_queries)
+    view = current_app.view_functions.get(request.endpoint)
+    check = partial(_check_counts, g._get_current_object(), request.endpoint or 'unmatched',
+                    getattr(view, 'query_budget', None), config['CS_N_PLUS_ONE_THRESHOLD'],
+                    config['CS_ENV'] == 'test')
+    if response.is_streamed:
+        response.call_on_close(check)
+    else:
+        check()
+    return response
+
+
+def _check_counts(counts, endpoint: str, budget, threshold: int, strict: bool):
+    """Log the N+1 patterns among the counts of a request and check its budget,
+    raising QueryBudgetExceeded if strict"""
+    for shape, count in counts.query_shapes.items():
+        if count >= threshold:
+            logger.warning('Possible N+1 on %s: %s statements like %s',
+                           endpoint, count, shape[:200])
+    if budget is not None and counts.db_queries > budget:
+        message = f'{endpoint} ran {counts.db_queries} statements, its budget is {budget}'
+        if strict:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_ended(conn, cursor, statement, parameters, context, executemany):
+    # Queries of background threads, like the like flusher, belong to no request
+    if has_request_context() and 'query_shapes' in g:
+        g.db_queries += 1
+        g.db_seconds += time.perf_counter() - context._query_start
+        g.query_shapes[fingerprint(statement)] += 1
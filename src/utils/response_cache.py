@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+"""This module caches whole GET responses of the API.
+Each entry depends on tags such as post:<id>, user:<id>:posts or posts:list.
+Every tag has a version number; an entry remembers the versions of its tags
+when the view started, and is only served while they are all unchanged.
+Invalidating a tag bumps its version, which drops every entry depending on
+it without having to find them. Tags are invalidated after commit for every
+row flushed through the session (see Model._cache_tags), for the rows the
+database deletes along with them (see Model._cascaded) and explicitly by
+writes bypassing the ORM, like the post counters.
+Disabled unless CS_RESPONSE_CACHE is 'memory' or 'redis'."""
+import hashlib
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+from flask import current_app, make_response, request
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from utils.cache import LRUCache, RedisCache
+from utils.extension import Extension
+from utils.logger import logger
+from utils.routing import primary
+
+# Response headers stored with the body, the rest is added on every request
+HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'X-Next-Cursor')
+
+
+class MemoryTags:
+    """Tag versions of a single process, and when each last changed"""
+
+    def __init__(self, lag: float = 0):
+        self.lag = lag
+        self._versions = {}
+        self._bumped = {}
+        self._lock = threading.Lock()
+
+    def versions(self, tags: list) -> list:
+        return [self._versions.get(tag, 0) for tag in tags]
+
+    def changed(self, tags: list) -> bool:
+        """Return True if any of the tags changed within the last lag seconds"""
+        since = time.monotonic() - self.lag
+        return any(self._bumped.get(tag, since) > since for tag in tags)
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+                self._bumped[tag] = time.monotonic()
+
+
+class RedisTags:
+    """Tag versions shared by every worker through Redis counters, and keys
+    living lag seconds marking the tags changed lately"""
+
+    def __init__(self, cache: RedisCache, lag: float = 0):
+        self.client = cache.client
+        self.prefix = f'{cache.prefix}:tag'
+        self.lag = lag
+
+    def versions(self, tags: list) -> list:
+        if not tags:
+            return []
+        values = self.client.mget([f'{self.prefix}:{tag}' for tag in tags])
+        return [int(value or 0) for value in values]
+
+    def changed(self, tags: list) -> bool:
+        """Return True if any of the tags changed within the last lag seconds"""
+        if not tags or not self.lag:
+            return False
+        return any(self.client.mget([f'{self.prefix}:changed:{tag}' for tag in tags]))
+
+    def bump(self, tags):
+        with self.client.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.incr(f'{self.prefix}:{tag}')
+                if self.lag:
+                    pipe.set(f'{self.prefix}:changed:{tag}', 1, px=max(1, int(self.lag * 1000)))
+            pipe.execute()
+
+
+class ResponseCache:
+    """Entries by request and optionally user, validated by tag versions.
+    Initialised like db with init_app"""
+
+    def __init__(self):
+        self.entries = None
+        self.tags = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        kind = app.config.get('CS_RESPONSE_CACHE')
+        ttl = app.config.get('CS_RESPONSE_CACHE_TTL', 60)
+        # How long a replica may lag behind a change, see utils/routing.py
+        lag = app.config.get('CS_REPLICA_STICKY_SECONDS', 5) \
+            if app.config.get('CS_REPLICA_URIS') else 0
+        if kind == 'memory':
+            self.entries = LRUCache(app.config.get('CS_RESPONSE_CACHE_SIZE', 5000), ttl)
+            self.tags = MemoryTags(lag)
+        elif kind == 'redis':
+            self.entries = RedisCache(app.config['CS_REDIS_URL'], ttl, prefix='cs:response')
+            self.tags = RedisTags(self.entries, lag)
+        else:
+            self.entries = self.tags = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.entries is not None
+
+    def invalidate(self, *tags):
+        """Drop every entry depending on any of the tags"""
+        if not self.enabled or not tags:
+            return
+        try:
+            self.tags.bump(set(tags))
+        except Exception as e:
+            logger.exception(e)
+
+    def invalidate_on_commit(self, session, *tags):
+        """Invalidate tags once the transaction changing them commits"""
+        session.info.setdefault('response_invalidations', set()).update(tags)
+
+    def stats(self) -> dict:
+        """Return the hit and miss counters"""
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'ratio': self.hits / total if total else 0.0}
+
+    def cached(self, tags, vary_on_user: bool = False, ttl: float = None):
+        """Cache the 200 responses of a GET view. tags is called with the view's
+        URL arguments and returns the tags the response depends on. Responses
+        depending on who asks need vary_on_user, which keys them by user.
+        Goes below token_required so only authenticated requests are served"""
+        def wrapper(f):
+            @wraps(f)
+            def decorator(*args, **kwargs):
+                # Views are decorated once, at import, for every app
+                cache = current_app.extensions.get('response_cache', self)
+                if not cache.enabled or request.method != 'GET':
+                    return f(*args, **kwargs)
+                try:
+                    key = cache._key(vary_on_user)
+                    entry_tags = sorted(set(tags(**kwargs)))
+                    # Versions are read before the view so a write committed
+                    # while it runs makes the stored entry stale at once
+                    versions = cache.tags.versions(entry_tags)
+                    entry = cache.entries.get(key) if key else None
+                except Exception as e:
+                    logger.exception(e)
+                    return f(*args, **kwargs)
+                if entry is not None and entry['tags'] == entry_tags \
+                        and entry['versions'] == versions:
+                    cache._count(hit=True)
+                    return cache._replay(entry)
+                cache._count(hit=False)
+                # A replica may be behind the versions read when a tag changed
+                # lately, see utils/routing.py
+                with primary() if cache._changed(entry_tags) else nullcontext():
+                    response = make_response(f(*args, **kwargs))
+                if key and response.status_code == 200:
+                    cache._store(key, entry_tags, versions, response, ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return decorator
+        return wrapper
+
+    def _key(self, vary_on_user: bool):
+        """Return the cache key of the request, None if it cannot be cached"""
+        parts = [request.path, request.query_string.decode('latin-1')]
+        if vary_on_user:
+            from utils.auth import current_principal
+            principal = current_principal()
+            if principal is None:
+                return None
+            parts.append(principal.id)
+        return hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+    def _store(self, key: str, tags: list, versions: list, response, ttl: float):
+        headers = [(name, response.headers[name]) for name in HEADERS
+                   if name in response.headers]
+        entry = {'tags': tags, 'versions': versions, 'headers': headers,
+                 'body': response.get_data()}
+        try:
+            self.entries.set(key, entry, ttl)
+        except Exception as e:
+            logger.exception(e)
+
+    def _changed(self, tags: list) -> bool:
+        try:
+            return self.tags.changed(tags)
+        except Exception as e:
+            logger.exception(e)
+            return True
+
+    @staticmethod
+    def _replay(entry: dict):
+        response = current_app.response_class(entry['body'], 200, entry['headers'])
+        response.headers['X-Cache'] = 'HIT'
+        # Answers 304 if the client already holds this version
+        return response.make_conditional(request)
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+response_cache = Extension('response_cache', ResponseCache)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_cascaded(session, flush_context, instances):
+    """Remember the tags of the rows ON DELETE CASCADE is about to remove with
+    the deleted ones. They never enter the session, so they are read first"""
+    if not response_cache.enabled:
+        return
+    tags = set()
+    for obj in session.deleted:
+        for model, criterion in getattr(obj, '_cascaded', list)():
+            columns = model.__table__.columns
+            # Transient copies give the tags without joining the session
+            for values in session.execute(select(*columns).where(criterion)).mappings():
+                tags.update(model(**values)._cache_tags())
+    if tags:
+        response_cache.invalidate_on_commit(session, *tags)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    """Remember the tags of every row written by the flush"""
+    if not response_cache.enabled:
+        return
+    tags = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        cache_tags = getattr(obj, '_cache_tags', None)
+        if cache_tags is not None:
+            tags.update(cache_tags())
+    if tags:
+        response_cache.invalidate_on_commit(session, *tags)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    response_cache.invalidate(*session.info.pop('response_invalidations', ()))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('response_invalidations', None)
@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+"""This module sends the reads of GET requests to read replicas.
+Replicas are listed in CS_REPLICA_URIS and become the binds replica0,
+replica1... Every statement of a flush, every INSERT, UPDATE or DELETE and
+every statement of other methods goes to the primary. Once a user commits a
+write, their reads stay on the primary for CS_REPLICA_STICKY_SECONDS so they
+never see a replica that has not caught up, e.g. GET /users/me right after
+PUT /users/me. The users in that window are remembered per process, or in
+Redis for every worker with CS_REPLICA_STICKY_STORE=redis. A worker would
+not know about the writes served by the others, so gunicorn.conf.py refuses
+to start several workers with replicas and the per process store.
+Reads filling the identity or response cache use the primary when the row
+or one of the tags was invalidated less than CS_REPLICA_STICKY_SECONDS ago,
+a stale replica row would otherwise be cached past its invalidation. Other
+cache fills read from a replica like any read.
+Routing decisions are counted for /api/v1/metrics."""
+import random
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from utils.cache import LRUCache, RedisCache
+from utils.database import RoutingSession
+from utils.extension import Extension
+from utils.logger import logger
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+class ReplicaRouter:
+    """Picks the engine of each statement. Initialised like db with
+    init_app, which it must precede so the replica engines get created"""
+
+    def __init__(self):
+        self.keys = []
+        self.window = 5
+        self.writers = None
+        self.routes = Counter()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        uris = app.config.get('CS_REPLICA_URIS') or []
+        self.keys = [f'replica{index}' for index in range(len(uris))]
+        if self.keys:
+            binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+            binds.update(zip(self.keys, uris))
+        self.window = app.config.get('CS_REPLICA_STICKY_SECONDS', 5)
+        if app.config.get('CS_REPLICA_STICKY_STORE') == 'redis':
+            self.writers = RedisCache(app.config['CS_REDIS_URL'], self.window,
+                                      prefix='cs:sticky')
+        else:
+            self.writers = LRUCache(app.config.get('CS_REPLICA_STICKY_SIZE', 10000),
+                                    self.window)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.keys)
+
+    def get_bind(self, session, clause):
+        """Return the replica engine for the statement, None for the primary"""
+        if not self.keys or not has_request_context():
+            return None
+        if session._flushing or getattr(clause, 'is_dml', False):
+            return self._route('primary', 'write')
+        if request.method not in READ_METHODS:
+            return self._route('primary', 'method')
+        if g.get('db_primary'):
+            return self._route('primary', 'cache fill')
+        if self._sticky():
+            return self._route('primary', 'sticky')
+        if 'db_replica' not in g:
+            # One replica per request, its reads see a single snapshot
+            g.db_replica = random.choice(self.keys)
+        self._route('replica', g.db_replica)
+        return session._db.engines[g.db_replica]
+
+    def wrote(self, email: str):
+        """Keep the reads of a user who just wrote on the primary for a while"""
+        try:
+            self.writers.set(email, True)
+        except Exception as e:
+            logger.exception(e)
+
+    def stats(self) -> dict:
+        """Return how many statements went where, and why"""
+        with self._lock:
+            return {f'{target},{reason}': count
+                    for (target, reason), count in self.routes.items()}
+
+    def _sticky(self) -> bool:
+        if 'db_sticky' not in g:
+            email = g.get('email')
+            try:
+                g.db_sticky = email is not None and self.writers.get(email) is not None
+            except Exception as e:
+                logger.exception(e)
+                g.db_sticky = True
+        return g.db_sticky
+
+    def _route(self, target: str, reason: str):
+        with self._lock:
+            self.routes[target, reason] += 1
+        return None
+
+
+router = Extension('router', ReplicaRouter)
+RoutingSession.router = router
+
+
+@contextmanager
+def primary():
+    """Read from the primary within the block"""
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('db_primary', False)
+    g.db_primary = True
+    try:
+        yield
+    finally:
+        g.db_primary = previous
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _note_statement(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info['wrote'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _stick_writer(session):
+    if session.info.pop('wrote', False) and router.enabled and has_request_context():
+        email = g.get('email')
+        if email is not None:
+            router.wrote(email)
+            g.db_sticky = True
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_write(session):
+    session.info.pop('wrote', None)
@@ -0,0 +1,35 @@
+#!/usr/bin/python3
+"""This module streams JSON arrays.
+jsonify needs the whole list of dicts and then the whole encoded payload in
+memory at once. stream_json_array encodes the rows one at a time, as the query
+yields them, into a chunked response holding a single JSON array."""
+from flask import current_app, stream_with_context
+from flask.globals import app_ctx
+from utils.logger import logger
+
+
+def stream_json_array(rows, label: str = 'rows', serialize=None, status: int = 200,
+                      fields: tuple = None):
+    """Return a response streaming rows as a JSON array.
+    rows may be a list or a query, which is executed right away so database
+    errors still reach the caller instead of cutting the response short.
+    serialize turns a row into something JSON encodable, to_dict(fields) by default"""
+    rows = iter(rows)
+    serialize = serialize or (lambda row: row.to_dict(fields))
+    dumps = current_app.json.dumps
+    # stream_with_context alone would give the body a new app context, and a
+    # new g, so the statements it runs would not count for the request
+    context = app_ctx._get_current_object()
+
+    def generate():
+        with context:
+            count = 0
+            yield '['
+            for row in rows:
+                yield (',' if count else '') + dumps(serialize(row))
+                count += 1
+            yield ']\n'
+            logger.info('%s %s retrieved successfully', count, label)
+
+    return current_app.response_class(stream_with_context(generate()), status,
+                                      mimetype=current_app.json.mimetype)
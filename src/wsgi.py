@@ -0,0 +1,5 @@
+#!/usr/bin/python3
+"""WSGI entry point of the app. Serve it with gunicorn from src/:
+    gunicorn wsgi:app
+which reads its settings from gunicorn.conf.py"""
+from api.v1.app import app